@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+from benchmarks.synth_benchmark import ROOT, ACCOUNT, REGION, ELB_ACCOUNT_ID, measure, cdk_context
+
+PHASES = ["services_chart", "cluster_stack_synth"]
+
+def service_specs(count: int) -> list:
+    # Synthetic spec, every other service autoscales
+    # pylint: disable=import-outside-toplevel
+    from infrastructure.app_chart import AutoscalingOptions
+    from infrastructure.services_chart import ServiceSpec
+    return [
+        ServiceSpec(
+            name = f"service{index:04d}",
+            image = "paulbouwer/hello-kubernetes:1.5",
+            memory_request_mib = 512,
+            autoscaling = AutoscalingOptions(max_replicas=6) if index % 2 else None,
+            replicas = None if index % 2 else 2
+        )
+        for index in range(count)
+    ]
+
+def run_size(count: int) -> dict:
+    # One spec size, executed in a fresh interpreter
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    results = {}
+
+    # pylint: disable=import-outside-toplevel
+    import aws_cdk
+    import cdk8s
+    from infrastructure.services_chart import ServicesChart
+    from infrastructure.charts import AppsOptions
+    from infrastructure.cluster_stack import KubernetesClusterStack
+
+    specs = service_specs(count)
+    measure(
+        results,
+        "services_chart",
+        lambda: ServicesChart(
+            cdk8s.App(), "ServicesChart", namespace="default", alb_access_logs_bucket_name="benchmark-bucket", services=specs
+        ).to_json()
+    )
+
+    with tempfile.TemporaryDirectory() as outdir:
+        def cluster_stack_synth():
+            app = aws_cdk.App(context=cdk_context(), outdir=outdir)
+            KubernetesClusterStack(
+                app,
+                "cdk8s-samples-app-stack",
+                env = aws_cdk.Environment(account=ACCOUNT, region=REGION),
+                admin_users = [],
+                admin_roles = [],
+                elb_account_id = ELB_ACCOUNT_ID,
+                certificate = None,
+                hosted_zone_id = None,
+                hosted_zone_name = None,
+                record_name = None,
+                apps = AppsOptions(services=specs)
+            )
+            return app.synth()
+        measure(results, "cluster_stack_synth", cluster_stack_synth)
+
+    return results
+
+def linear_fit(counts: list, seconds: list) -> dict:
+    # Least squares fit of seconds = intercept + slope * count
+    slope, intercept = statistics.linear_regression(counts, seconds)
+    mean = statistics.mean(seconds)
+    residuals = sum((value - (intercept + slope * count)) ** 2 for count, value in zip(counts, seconds))
+    total = sum((value - mean) ** 2 for value in seconds)
+    return {
+        "ms_per_service": round(slope * 1000, 3),
+        "intercept_seconds": round(intercept, 3),
+        "r_squared": round(1 - residuals / total, 4) if total else 1.0
+    }
+
+def marginal_ms_per_service(counts: list, seconds: list) -> list:
+    # Cost of each added service between two consecutive sizes
+    return [
+        round((seconds[index] - seconds[index - 1]) / (counts[index] - counts[index - 1]) * 1000, 3)
+        for index in range(1, len(counts))
+    ]
+
+def summarize(sizes: dict) -> dict:
+    counts = sorted(sizes)
+    phases = {}
+    for phase in PHASES:
+        seconds = [sizes[count][phase]["seconds"] for count in counts]
+        phases[phase] = {
+            "seconds": dict(zip(counts, [round(value, 3) for value in seconds])),
+            **{
+                memory: {count: sizes[count][phase][memory] for count in counts}
+                for memory in ["python_rss_growth_mib", "node_rss_mib"]
+            },
+            "marginal_ms_per_service": marginal_ms_per_service(counts, seconds),
+            "fit": linear_fit(counts, seconds) if len(counts) > 1 else None
+        }
+    return {"python": sys.version.split()[0], "sizes": counts, "phases": phases}
+
+def superlinear(results: dict, max_growth: float) -> list:
+    # Phases whose cost per added service grew more than max_growth (a fraction) from the smallest to the largest sizes
+    slower = []
+    for phase, measures in results["phases"].items():
+        marginal = measures["marginal_ms_per_service"]
+        if len(marginal) > 1 and marginal[0] > 0 and marginal[-1] > marginal[0] * (1 + max_growth):
+            slower.append(f"{phase}: {marginal[-1]:.1f}ms per service at the largest size vs {marginal[0]:.1f}ms at the smallest")
+    return slower
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Synth time and memory of the services chart and cluster stack by number of services")
+    parser.add_argument("--sizes", default="10,50,100,200,400", help="Comma separated numbers of services")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--max-growth", type=float, default=1.0, help="Allowed growth of the cost per service between the smallest and largest sizes, as a fraction")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context("spawn")
+    sizes = {}
+    for count in sorted(int(size) for size in args.sizes.split(",")):
+        with context.Pool(1) as pool:
+            sizes[count] = pool.apply(run_size, (count,))
+    results = summarize(sizes)
+    results["superlinear"] = superlinear(results, args.max_growth)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    for message in results["superlinear"]:
+        print(f"Superlinear synth: {message}", file=sys.stderr)
+    return 1 if results["superlinear"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
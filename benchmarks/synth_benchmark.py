@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Dummy deployment parameters, the benchmark never talks to AWS
+ACCOUNT = "123456789012"
+REGION = "us-east-1"
+ELB_ACCOUNT_ID = "127311923021"
+CONNECTION_ARN = f"arn:aws:codestar-connections:{REGION}:{ACCOUNT}:connection/benchmark"
+ENVIRON = {"ACCOUNT": ACCOUNT, "REGION": REGION, "ELB_ACCOUNT_ID": ELB_ACCOUNT_ID, "CONNECTION_ARN": CONNECTION_ARN}
+
+PHASES = ["jsii_startup", "app_chart", "cluster_stack", "pipeline_stack", "app_synth", "nag_synth"]
+
+def rss_mib(pid: int) -> float:
+    # Resident memory of a process, Linux only
+    for line in Path(f"/proc/{pid}/status").read_text(encoding="utf-8").splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return 0
+
+def descendants(pid: int) -> list:
+    children = []
+    for task_children in Path(f"/proc/{pid}/task").glob("*/children"):
+        for child in task_children.read_text(encoding="utf-8").split():
+            children += [int(child)] + descendants(int(child))
+    return children
+
+def memory_mib() -> tuple:
+    # Python interpreter and jsii node processes started by it
+    if not Path("/proc").is_dir():
+        return None, None
+    node_rss = sum(rss_mib(pid) for pid in descendants(os.getpid()))
+    return round(rss_mib(os.getpid()), 1), round(node_rss, 1)
+
+def measure(results: dict, phase: str, function):
+    python_before, node_before = memory_mib()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    python_after, node_after = memory_mib()
+    results[phase] = {
+        "seconds": seconds,
+        "python_rss_mib": python_after,
+        "node_rss_mib": node_after,
+        "python_rss_growth_mib": None if python_after is None else round(python_after - python_before, 1),
+        "node_rss_growth_mib": None if node_after is None else round(node_after - node_before, 1)
+    }
+    return result
+
+def cdk_context() -> dict:
+    with open(ROOT / "cdk.json", encoding="utf-8") as cdk_json:
+        return json.load(cdk_json)["context"]
+
+def pipeline_app(outdir: str):
+    # Same construct tree as app.py, through the same factory
+    # pylint: disable=import-outside-toplevel
+    from aws_cdk import App
+    from infrastructure.pipeline_app import create_pipeline_stack
+
+    app = App(context=cdk_context(), outdir=outdir)
+    create_pipeline_stack(app, ENVIRON)
+    return app
+
+def run_phases() -> dict:
+    # One benchmark run, executed in a fresh interpreter so jsii startup is measured every time
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    results = {}
+
+    # pylint: disable=import-outside-toplevel
+    def jsii_startup():
+        import aws_cdk
+        import cdk_nag
+        import cdk8s
+        import cdk8s_plus_27
+        return aws_cdk, cdk_nag, cdk8s, cdk8s_plus_27
+    aws_cdk, _, cdk8s, _ = measure(results, "jsii_startup", jsii_startup)
+
+    from infrastructure.app_chart import AppChart
+    from infrastructure.cluster_stack import KubernetesClusterStack
+    from infrastructure.nag_checks import synth_with_nag_checks
+
+    measure(
+        results,
+        "app_chart",
+        lambda: cdk8s.Testing.synth(
+            AppChart(cdk8s.Testing.app(), "AppChart", namespace="default", alb_access_logs_bucket_name="benchmark-bucket")
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as outdir:
+        cluster_app = aws_cdk.App(context=cdk_context(), outdir=outdir)
+        measure(
+            results,
+            "cluster_stack",
+            lambda: KubernetesClusterStack(
+                cluster_app,
+                "cdk8s-samples-app-stack",
+                env = aws_cdk.Environment(account=ACCOUNT, region=REGION),
+                admin_users = [],
+                admin_roles = [],
+                elb_account_id = ELB_ACCOUNT_ID,
+                certificate = None,
+                hosted_zone_id = None,
+                hosted_zone_name = None,
+                record_name = None
+            )
+        )
+
+    with tempfile.TemporaryDirectory() as outdir:
+        app = measure(results, "pipeline_stack", lambda: pipeline_app(outdir))
+        measure(results, "app_synth", lambda: synth_with_nag_checks(app, mode="off"))
+
+    # Nag only runs as an aspect during synthesis, so it is measured on a second identical app
+    with tempfile.TemporaryDirectory() as outdir:
+        app = pipeline_app(outdir)
+        measure(results, "nag_synth", lambda: synth_with_nag_checks(app, mode="full"))
+
+    return results
+
+def max_or_none(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+def summarize(runs: list) -> dict:
+    phases = {}
+    for phase in PHASES:
+        seconds = [run[phase]["seconds"] for run in runs]
+        phases[phase] = {
+            "seconds": {
+                "min": round(min(seconds), 3),
+                "median": round(statistics.median(seconds), 3),
+                "mean": round(statistics.mean(seconds), 3),
+                "max": round(max(seconds), 3)
+            },
+            **{
+                measure: max_or_none(run[phase][measure] for run in runs)
+                for measure in ["python_rss_mib", "node_rss_mib", "python_rss_growth_mib", "node_rss_growth_mib"]
+            }
+        }
+    return {
+        "runs": len(runs),
+        "python": sys.version.split()[0],
+        "phases": phases,
+        "total_seconds": round(sum(phase["seconds"]["median"] for phase in phases.values()), 3)
+    }
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    # Phases whose median time grew more than threshold (a fraction) over the baseline
+    slower = []
+    for phase, measures in results["phases"].items():
+        if phase not in baseline["phases"]:
+            continue
+        baseline_median = baseline["phases"][phase]["seconds"]["median"]
+        median = measures["seconds"]["median"]
+        if median <= baseline_median * (1 + threshold):
+            continue
+        # A phase rounded to 0s in the baseline has no relative growth
+        growth = f"+{median / baseline_median - 1:.0%}" if baseline_median > 0 else "from 0s"
+        slower.append(f"{phase}: {median:.3f}s vs {baseline_median:.3f}s baseline ({growth})")
+    return slower
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time and memory-profile each phase of the CDK synthesis of app.py")
+    parser.add_argument("--runs", type=int, default=3, help="Number of repetitions, each in a fresh interpreter")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed median slowdown per phase over the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(args.runs):
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(run_phases))
+    results = summarize(runs)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            slower = regressions(results, json.load(baseline_file), args.threshold)
+        for message in slower:
+            print(f"Synth regression: {message}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
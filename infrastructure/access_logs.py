@@ -0,0 +1,212 @@
+from constructs import Construct
+from aws_cdk import Stack, Duration
+from aws_cdk.aws_s3 import IBucket, LifecycleRule, Transition, StorageClass
+from aws_cdk.aws_glue import CfnDatabase, CfnTable
+from aws_cdk.aws_athena import CfnWorkGroup, CfnNamedQuery
+
+# Columns and regex of the ALB access log format, in log order
+# https://docs.aws.amazon.com/athena/latest/ug/application-load-balancer-logs.html
+ALB_LOG_COLUMNS = [
+    ("type", "string"),
+    ("time", "string"),
+    ("elb", "string"),
+    ("client_ip", "string"),
+    ("client_port", "int"),
+    ("target_ip", "string"),
+    ("target_port", "int"),
+    ("request_processing_time", "double"),
+    ("target_processing_time", "double"),
+    ("response_processing_time", "double"),
+    ("elb_status_code", "int"),
+    ("target_status_code", "string"),
+    ("received_bytes", "bigint"),
+    ("sent_bytes", "bigint"),
+    ("request_verb", "string"),
+    ("request_url", "string"),
+    ("request_proto", "string"),
+    ("user_agent", "string"),
+    ("ssl_cipher", "string"),
+    ("ssl_protocol", "string"),
+    ("target_group_arn", "string"),
+    ("trace_id", "string"),
+    ("domain_name", "string"),
+    ("chosen_cert_arn", "string"),
+    ("matched_rule_priority", "string"),
+    ("request_creation_time", "string"),
+    ("actions_executed", "string"),
+    ("redirect_url", "string"),
+    ("lambda_error_reason", "string"),
+    ("target_port_list", "string"),
+    ("target_status_code_list", "string"),
+    ("classification", "string"),
+    ("classification_reason", "string"),
+    ("conn_trace_id", "string")
+]
+
+ALB_LOG_REGEX = (
+    r'([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*):([0-9]*) ([^ ]*)[:-]([0-9]*) ([-.0-9]*) ([-.0-9]*) ([-.0-9]*) (|[-0-9]*) (-|[-0-9]*) '
+    r'([-0-9]*) ([-0-9]*) \"([^ ]*) (.*) (- |[^ ]*)\" \"([^\"]*)\" ([A-Z0-9-_]+) ([A-Za-z0-9.-]*) ([^ ]*) \"([^\"]*)\" '
+    r'\"([^\"]*)\" \"([^\"]*)\" ([-.0-9]*) ([^ ]*) \"([^\"]*)\" \"([^\"]*)\" \"([^ ]*)\" \"([^\s]+?)\" \"([^\s]+)\" '
+    r'\"([^ ]*)\" \"([^ ]*)\" ?([^ ]*)?'
+)
+
+# Query results are kept next to the logs, outside of the prefix the ALB writes to
+ATHENA_RESULTS_PREFIX = "athena-results/"
+
+# Only the partitions of the last day are scanned
+LAST_DAY = "day >= date_format(current_date - interval '1' day, '%Y/%m/%d')"
+
+LATENCY_QUERIES = {
+    "latency-per-path": (
+        "Target processing time percentiles per path over the last day",
+        """SELECT url_extract_path(request_url) AS path,
+    count(*) AS requests,
+    approx_percentile(target_processing_time, 0.5) AS p50,
+    approx_percentile(target_processing_time, 0.95) AS p95,
+    approx_percentile(target_processing_time, 0.99) AS p99,
+    max(target_processing_time) AS max
+FROM {table}
+WHERE {last_day} AND target_processing_time >= 0
+GROUP BY 1
+ORDER BY p99 DESC
+LIMIT 50"""
+    ),
+    "latency-per-target": (
+        "Target processing time percentiles and 5xx responses per pod over the last day",
+        """SELECT target_ip,
+    count(*) AS requests,
+    count_if(elb_status_code >= 500) AS errors,
+    approx_percentile(target_processing_time, 0.5) AS p50,
+    approx_percentile(target_processing_time, 0.95) AS p95,
+    approx_percentile(target_processing_time, 0.99) AS p99
+FROM {table}
+WHERE {last_day}
+GROUP BY 1
+ORDER BY p99 DESC"""
+    ),
+    "slowest-requests": (
+        "Slowest requests of the last day, with the time spent in the ALB and in the pod",
+        """SELECT time, request_verb, request_url, target_ip, elb_status_code,
+    request_processing_time, target_processing_time, response_processing_time,
+    request_processing_time + target_processing_time + response_processing_time AS total_time,
+    trace_id
+FROM {table}
+WHERE {last_day} AND target_processing_time >= 0
+ORDER BY total_time DESC
+LIMIT 100"""
+    )
+}
+
+class AccessLogsAthena(Construct):
+    # Glue table over the ALB access logs of a bucket, with partition projection on region and day
+    # so queries only scan the objects of the requested dates, plus saved latency queries
+    def __init__(self, scope: Construct, id: str, bucket: IBucket, database_name: str):
+        super().__init__(scope, id)
+
+        stack = Stack.of(self)
+        logs_location = f"s3://{bucket.bucket_name}/AWSLogs/{stack.account}/elasticloadbalancing"
+
+        self.database = CfnDatabase(
+            self,
+            "Database",
+            catalog_id = stack.account,
+            database_input = CfnDatabase.DatabaseInputProperty(
+                name = database_name
+            )
+        )
+
+        self.table = CfnTable(
+            self,
+            "Table",
+            catalog_id = stack.account,
+            database_name = database_name,
+            table_input = CfnTable.TableInputProperty(
+                name = "alb_access_logs",
+                table_type = "EXTERNAL_TABLE",
+                partition_keys = [
+                    CfnTable.ColumnProperty(name="region", type="string"),
+                    CfnTable.ColumnProperty(name="day", type="string")
+                ],
+                parameters = {
+                    "projection.enabled": "true",
+                    "projection.region.type": "enum",
+                    "projection.region.values": stack.region,
+                    "projection.day.type": "date",
+                    "projection.day.range": "2024/01/01,NOW",
+                    "projection.day.format": "yyyy/MM/dd",
+                    "projection.day.interval": "1",
+                    "projection.day.interval.unit": "DAYS",
+                    "storage.location.template": f"{logs_location}/${{region}}/${{day}}"
+                },
+                storage_descriptor = CfnTable.StorageDescriptorProperty(
+                    columns = [CfnTable.ColumnProperty(name=name, type=column_type) for name, column_type in ALB_LOG_COLUMNS],
+                    location = f"{logs_location}/",
+                    input_format = "org.apache.hadoop.mapred.TextInputFormat",
+                    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+                    serde_info = CfnTable.SerdeInfoProperty(
+                        serialization_library = "org.apache.hadoop.hive.serde2.RegexSerDe",
+                        parameters = {
+                            "serialization.format": "1",
+                            "input.regex": ALB_LOG_REGEX
+                        }
+                    )
+                )
+            )
+        )
+        self.table.add_dependency(self.database)
+
+        self.work_group = CfnWorkGroup(
+            self,
+            "WorkGroup",
+            name = f"{database_name}-workgroup",
+            recursive_delete_option = True,
+            work_group_configuration = CfnWorkGroup.WorkGroupConfigurationProperty(
+                enforce_work_group_configuration = True,
+                publish_cloud_watch_metrics_enabled = True,
+                result_configuration = CfnWorkGroup.ResultConfigurationProperty(
+                    output_location = f"s3://{bucket.bucket_name}/{ATHENA_RESULTS_PREFIX}",
+                    encryption_configuration = CfnWorkGroup.EncryptionConfigurationProperty(
+                        encryption_option = "SSE_S3"
+                    )
+                )
+            )
+        )
+
+        # Query results are only needed for a while
+        bucket.add_lifecycle_rule(
+            prefix = ATHENA_RESULTS_PREFIX,
+            expiration = Duration.days(7)
+        )
+
+        for name, (description, query) in LATENCY_QUERIES.items():
+            named_query = CfnNamedQuery(
+                self,
+                f"Query-{name}",
+                name = name,
+                description = description,
+                database = database_name,
+                work_group = self.work_group.name,
+                query_string = query.format(table="alb_access_logs", last_day=LAST_DAY)
+            )
+            named_query.add_dependency(self.table)
+            named_query.add_dependency(self.work_group)
+
+def access_logs_lifecycle_rules(infrequent_access_days: int = 30, glacier_days: int = 90) -> list:
+    # Older logs move to cheaper storage classes that Athena can still read without a restore
+    return [
+        LifecycleRule(
+            prefix = "AWSLogs/",
+            transitions = [
+                Transition(
+                    storage_class = StorageClass.INFREQUENT_ACCESS,
+                    transition_after = Duration.days(infrequent_access_days)
+                ),
+                Transition(
+                    storage_class = StorageClass.GLACIER_INSTANT_RETRIEVAL,
+                    transition_after = Duration.days(glacier_days)
+                )
+            ],
+            # The bucket is versioned, overwritten or deleted logs are not kept forever
+            noncurrent_version_expiration = Duration.days(30)
+        )
+    ]
@@ -1,8 +1,15 @@
 #!/usr/bin/env python
+import json
+from dataclasses import dataclass, replace
+from typing import Callable
 from constructs import Construct
 from cdk8s import (
     Chart,
-    ApiObjectMetadata
+    ApiObject,
+    ApiObjectMetadata,
+    JsonPatch,
+    Size,
+    Duration
 )
 from cdk8s_plus_27 import (
     Deployment,
@@ -11,48 +18,479 @@ from cdk8s_plus_27 import (
     ContainerResources,
     CpuResources,
     Cpu,
+    MemoryResources,
     ServicePort,
     ServiceType,
     Protocol,
     Ingress,
     IngressBackend,
-    ContainerSecurityContextProps
+    ContainerSecurityContextProps,
+    HorizontalPodAutoscaler,
+    Metric,
+    MetricTarget,
+    ScalingRules,
+    Probe,
+    ContainerLifecycle,
+    Handler,
+    DeploymentStrategy,
+    PercentOrAbsolute,
+    k8s
 )
 
+@dataclass(frozen=True)
+class AutoscalingOptions:
+    # Replica bounds the HorizontalPodAutoscaler keeps the deployment within
+    max_replicas: int
+    min_replicas: int = 2
+    # Average utilization targets, as a percentage of the container requests
+    cpu_target_utilization: int = 70
+    memory_target_utilization: int = None
+    # Scale up/down behavior, cdk8s-plus defaults when not set
+    scale_up: ScalingRules = None
+    scale_down: ScalingRules = None
+
+    def __post_init__(self):
+        if not 1 <= self.min_replicas <= self.max_replicas:
+            raise ValueError("The autoscaling replica bounds need 1 <= min_replicas <= max_replicas")
+
+@dataclass(frozen=True)
+class HttpProbeOptions:
+    path: str = "/"
+    period_seconds: int = 5
+    timeout_seconds: int = 2
+    failure_threshold: int = 3
+    success_threshold: int = 1
+    initial_delay_seconds: int = 0
+
+    def __post_init__(self):
+        # The ALB health check of a readiness probe takes its settings, within the target group limits
+        if not 5 <= self.period_seconds <= 300:
+            raise ValueError(f"The probe period must be between 5 and 300 seconds, the ALB health check interval range, got {self.period_seconds}")
+        if not 2 <= self.timeout_seconds < min(self.period_seconds, 121):
+            raise ValueError(
+                f"The probe timeout must be between 2 and 120 seconds and lower than its period, as the ALB health check requires, "
+                f"got {self.timeout_seconds}"
+            )
+        for threshold in ("success_threshold", "failure_threshold"):
+            if not 1 <= getattr(self, threshold) <= 10:
+                raise ValueError(f"The probe {threshold} must be between 1 and 10, the ALB health check allows up to 10 checks")
+
+    def to_probe(self, port: int) -> Probe:
+        return Probe.from_http_get(
+            self.path,
+            port = port,
+            period_seconds = Duration.seconds(self.period_seconds),
+            timeout_seconds = Duration.seconds(self.timeout_seconds),
+            failure_threshold = self.failure_threshold,
+            success_threshold = self.success_threshold,
+            initial_delay_seconds = Duration.seconds(self.initial_delay_seconds)
+        )
+
+    def health_check_annotations(self) -> dict:
+        # ALB target group health checks equivalent to this probe, the ALB needs at least 2 checks either way
+        return {
+            "alb.ingress.kubernetes.io/healthcheck-path": self.path,
+            "alb.ingress.kubernetes.io/healthcheck-interval-seconds": str(self.period_seconds),
+            "alb.ingress.kubernetes.io/healthcheck-timeout-seconds": str(self.timeout_seconds),
+            "alb.ingress.kubernetes.io/healthy-threshold-count": str(max(2, self.success_threshold)),
+            "alb.ingress.kubernetes.io/unhealthy-threshold-count": str(max(2, self.failure_threshold)),
+            # Same success range as a Kubernetes HTTP probe
+            "alb.ingress.kubernetes.io/success-codes": "200-399"
+        }
+
+LOAD_BALANCING_ALGORITHMS = ["round_robin", "least_outstanding_requests"]
+
+@dataclass(frozen=True)
+class AlbPerformanceProfile:
+    # Load balancer attributes
+    idle_timeout_seconds: int = 60
+    http2: bool = True
+    # Target group attributes
+    deregistration_delay_seconds: int = 300
+    slow_start_seconds: int = 0
+    load_balancing_algorithm: str = "round_robin"
+    # Target group health checks, ALB defaults when not set
+    healthcheck_interval_seconds: int = None
+    healthy_threshold_count: int = None
+    unhealthy_threshold_count: int = None
+
+    def __post_init__(self):
+        if self.healthcheck_interval_seconds is not None and not 5 <= self.healthcheck_interval_seconds <= 300:
+            raise ValueError(f"The health check interval must be between 5 and 300 seconds, got {self.healthcheck_interval_seconds}")
+        for count in (self.healthy_threshold_count, self.unhealthy_threshold_count):
+            if count is not None and not 2 <= count <= 10:
+                raise ValueError(f"The health check threshold counts must be between 2 and 10, got {count}")
+        if self.load_balancing_algorithm not in LOAD_BALANCING_ALGORITHMS:
+            raise ValueError(f"Unknown load balancing algorithm {self.load_balancing_algorithm}, expected one of {', '.join(LOAD_BALANCING_ALGORITHMS)}")
+        if self.slow_start_seconds and self.load_balancing_algorithm != "round_robin":
+            raise ValueError("Slow start is only supported with the round_robin load balancing algorithm")
+
+    @classmethod
+    def low_latency_api(cls) -> "AlbPerformanceProfile":
+        # Short requests: route to the least busy pod, drain and detect failures quickly
+        return cls(
+            idle_timeout_seconds = 30,
+            deregistration_delay_seconds = 30,
+            load_balancing_algorithm = "least_outstanding_requests",
+            healthcheck_interval_seconds = 5,
+            healthy_threshold_count = 2,
+            unhealthy_threshold_count = 2
+        )
+
+    @classmethod
+    def long_lived_connections(cls) -> "AlbPerformanceProfile":
+        # Streaming, websockets and long polling: keep idle connections open and let them drain, ramp up new pods
+        return cls(
+            idle_timeout_seconds = 3600,
+            deregistration_delay_seconds = 300,
+            slow_start_seconds = 60,
+            healthcheck_interval_seconds = 15,
+            healthy_threshold_count = 3,
+            unhealthy_threshold_count = 3
+        )
+
+    def load_balancer_attributes(self) -> list:
+        return [
+            f"idle_timeout.timeout_seconds={self.idle_timeout_seconds}",
+            f"routing.http2.enabled={str(self.http2).lower()}"
+        ]
+
+    def target_group_attributes(self) -> list:
+        return [
+            f"deregistration_delay.timeout_seconds={self.deregistration_delay_seconds}",
+            f"slow_start.duration_seconds={self.slow_start_seconds}",
+            f"load_balancing.algorithm.type={self.load_balancing_algorithm}"
+        ]
+
+    def health_check_annotations(self) -> dict:
+        annotations = {
+            "alb.ingress.kubernetes.io/healthcheck-interval-seconds": self.healthcheck_interval_seconds,
+            "alb.ingress.kubernetes.io/healthy-threshold-count": self.healthy_threshold_count,
+            "alb.ingress.kubernetes.io/unhealthy-threshold-count": self.unhealthy_threshold_count
+        }
+        return {key: str(value) for key, value in annotations.items() if value is not None}
+
+@dataclass(frozen=True)
+class GracefulShutdownOptions:
+    # Seconds a terminating pod keeps serving (preStop sleep) while the ALB drains it, also used as the
+    # target group deregistration delay. Defaults to the ALB profile deregistration delay, or 30 seconds.
+    drain_seconds: int = None
+    # Seconds left to the application to shut down after the drain, before it is killed
+    shutdown_seconds: int = 15
+    # Rolling update bounds, by default new pods are added before old ones go away so capacity never drops
+    max_surge: PercentOrAbsolute = None
+    max_unavailable: PercentOrAbsolute = None
+
+    def drain(self, alb_profile: AlbPerformanceProfile = None) -> int:
+        if self.drain_seconds is not None:
+            return self.drain_seconds
+        return alb_profile.deregistration_delay_seconds if alb_profile is not None else 30
+
+    def strategy(self) -> DeploymentStrategy:
+        return DeploymentStrategy.rolling_update(
+            max_surge = self.max_surge or PercentOrAbsolute.percent(25),
+            max_unavailable = self.max_unavailable or PercentOrAbsolute.absolute(0)
+        )
+
+@dataclass(frozen=True)
+class PodDisruptionBudgetOptions:
+    # Set exactly one of them
+    min_available: PercentOrAbsolute = None
+    max_unavailable: PercentOrAbsolute = None
+
+    def __post_init__(self):
+        if (self.min_available is None) == (self.max_unavailable is None):
+            raise ValueError("Set either min_available or max_unavailable on the PodDisruptionBudget")
+
+    def to_spec(self, match_labels: dict) -> k8s.PodDisruptionBudgetSpec:
+        return k8s.PodDisruptionBudgetSpec(
+            min_available = int_or_string(self.min_available) if self.min_available is not None else None,
+            max_unavailable = int_or_string(self.max_unavailable) if self.max_unavailable is not None else None,
+            selector = k8s.LabelSelector(match_labels=match_labels)
+        )
+
+@dataclass(frozen=True)
+class ZoneSpreadOptions:
+    # Maximum difference in number of pods between two availability zones
+    max_skew: int = 1
+    # ScheduleAnyway keeps scheduling when a zone is unavailable, DoNotSchedule enforces the skew
+    when_unsatisfiable: str = "ScheduleAnyway"
+
+    def topology_spread_constraint(self, match_labels: dict) -> dict:
+        return {
+            "maxSkew": self.max_skew,
+            "topologyKey": "topology.kubernetes.io/zone",
+            "whenUnsatisfiable": self.when_unsatisfiable,
+            "labelSelector": {
+                "matchLabels": match_labels
+            }
+        }
+
+@dataclass(frozen=True)
+class WorkloadOptions:
+    # Fixed number of replicas or autoscaling, not both
+    replicas: int = None
+    autoscaling: AutoscalingOptions = None
+    # CPU units of the container. Memory drives the Fargate pod size together with CPU, see fargate_sizing.py
+    cpu_request: float = 0.25
+    cpu_limit: float = 1
+    memory_request: Size = None
+    memory_limit: Size = None
+    readiness_probe: HttpProbeOptions = None
+    liveness_probe: HttpProbeOptions = None
+    graceful_shutdown: GracefulShutdownOptions = None
+    pod_disruption_budget: PodDisruptionBudgetOptions = None
+    zone_spread: ZoneSpreadOptions = None
+
+    def __post_init__(self):
+        if self.replicas is not None and self.autoscaling is not None:
+            raise ValueError("Set either a fixed number of replicas or autoscaling, not both")
+
+    def container(self, name: str, image: str, port: int) -> ContainerProps:
+        memory = None
+        if self.memory_request is not None or self.memory_limit is not None:
+            memory = MemoryResources(request=self.memory_request, limit=self.memory_limit)
+
+        # Keep serving while the ALB deregisters a terminating pod, then let the application stop on its own
+        lifecycle = None
+        if self.graceful_shutdown is not None:
+            lifecycle = ContainerLifecycle(pre_stop=Handler.from_command(["sleep", str(self.graceful_shutdown.drain())]))
+
+        return ContainerProps(
+            image = image,
+            image_pull_policy = ImagePullPolicy.ALWAYS,
+            name = name,
+            resources = ContainerResources(
+                cpu = CpuResources(request=Cpu.units(self.cpu_request), limit=Cpu.units(self.cpu_limit)),
+                memory = memory
+            ),
+            port_number = port,
+            readiness = self.readiness_probe.to_probe(port) if self.readiness_probe is not None else None,
+            liveness = self.liveness_probe.to_probe(port) if self.liveness_probe is not None else None,
+            lifecycle = lifecycle,
+            security_context = ContainerSecurityContextProps(
+                user = 1005
+            )
+        )
+
+@dataclass(frozen=True)
+class Workload:
+    deployment: Deployment
+    autoscaler: HorizontalPodAutoscaler = None
+    disruption_budget: k8s.KubePodDisruptionBudget = None
+
+@dataclass(frozen=True)
+class CanaryOptions:
+    # Candidate image, deployed next to the stable one and sharing the ingress
+    image: str
+    # Percentage of the requests forwarded to the candidate
+    weight: int = 10
+    replicas: int = 1
+
+    def __post_init__(self):
+        if not 0 <= self.weight <= 100:
+            raise ValueError("The canary weight is a percentage, between 0 and 100")
+
+@dataclass(frozen=True)
+class IngressGroupOptions:
+    # Ingresses with the same group name share one ALB, rules are evaluated by ascending order
+    name: str
+    order: int = 0
+    # Rule routing to this chart service on the shared ALB
+    path: str = "/"
+    host: str = None
+
+def int_or_string(value: PercentOrAbsolute) -> k8s.IntOrString:
+    if isinstance(value.value, str):
+        return k8s.IntOrString.from_string(value.value)
+    return k8s.IntOrString.from_number(value.value)
+
+def access_logs_attributes(alb_access_logs_bucket_name: str) -> list:
+    return [
+        "access_logs.s3.enabled=true",
+        f"access_logs.s3.bucket={alb_access_logs_bucket_name}"
+    ]
+
+def add_workload(
+        scope: Construct,
+        namespace: str,
+        container: ContainerProps,
+        options: WorkloadOptions,
+        resource_id: Callable[[str], str],
+        resource_name: Callable[[str], str]
+    ) -> Workload:
+    # Deployment of the container with its optional autoscaler and disruption budget. The resources are added
+    # to the scope under the ids of resource_id, by kind: deployment, hpa and pdb.
+    graceful_shutdown = options.graceful_shutdown
+    deployment = Deployment(
+        scope,
+        resource_id("deployment"),
+        metadata = ApiObjectMetadata(
+            name = resource_name("deployment"),
+            namespace = namespace
+        ),
+        select = True,
+        replicas = options.replicas,
+        strategy = graceful_shutdown.strategy() if graceful_shutdown is not None else None,
+        termination_grace_period = Duration.seconds(graceful_shutdown.drain() + graceful_shutdown.shutdown_seconds) if graceful_shutdown is not None else None,
+        containers = [container]
+    )
+
+    # Spread the replicas evenly across availability zones
+    if options.zone_spread is not None:
+        ApiObject.of(deployment).add_json_patch(
+            JsonPatch.add(
+                "/spec/template/spec/topologySpreadConstraints",
+                [options.zone_spread.topology_spread_constraint(deployment.match_labels)]
+            )
+        )
+
+    # Limit how many replicas voluntary disruptions (node or AZ maintenance) can take down at once
+    disruption_budget = None
+    if options.pod_disruption_budget is not None:
+        disruption_budget = k8s.KubePodDisruptionBudget(
+            scope,
+            resource_id("pdb"),
+            metadata = k8s.ObjectMeta(
+                name = resource_name("pdb"),
+                namespace = namespace
+            ),
+            spec = options.pod_disruption_budget.to_spec(deployment.match_labels)
+        )
+
+    # Scale the deployment on CPU/memory utilization
+    autoscaler = None
+    autoscaling = options.autoscaling
+    if autoscaling is not None:
+        metrics = []
+        if autoscaling.cpu_target_utilization is not None:
+            metrics.append(Metric.resource_cpu(MetricTarget.average_utilization(autoscaling.cpu_target_utilization)))
+        if autoscaling.memory_target_utilization is not None:
+            metrics.append(Metric.resource_memory(MetricTarget.average_utilization(autoscaling.memory_target_utilization)))
+
+        autoscaler = HorizontalPodAutoscaler(
+            scope,
+            resource_id("hpa"),
+            metadata = ApiObjectMetadata(
+                name = resource_name("hpa"),
+                namespace = namespace
+            ),
+            target = deployment,
+            min_replicas = autoscaling.min_replicas,
+            max_replicas = autoscaling.max_replicas,
+            metrics = metrics or None,
+            scale_up = autoscaling.scale_up,
+            scale_down = autoscaling.scale_down
+        )
+
+    return Workload(deployment, autoscaler, disruption_budget)
+
+def alb_annotations(
+        load_balancer_name: str,
+        alb_access_logs_bucket_name: str,
+        certificate: str = None,
+        alb_profile: AlbPerformanceProfile = None,
+        workload: WorkloadOptions = None,
+        ingress_group: IngressGroupOptions = None
+    ) -> dict:
+    # Enable ALB Access Logs
+    load_balancer_attributes = access_logs_attributes(alb_access_logs_bucket_name)
+    if alb_profile is not None:
+        load_balancer_attributes += alb_profile.load_balancer_attributes()
+
+    annotations = {
+        # Create Target Group with ip targets to work with Fargate
+        "alb.ingress.kubernetes.io/target-type": "ip",
+        # Set ALB name
+        "alb.ingress.kubernetes.io/load-balancer-name": load_balancer_name,
+        "alb.ingress.kubernetes.io/load-balancer-attributes": ",".join(load_balancer_attributes)
+    }
+
+    if ingress_group is not None:
+        # One ALB for every ingress of the group, its load balancer annotations must be the same on all of them.
+        # AppsOptions checks it for the charts of the cluster stack.
+        annotations["alb.ingress.kubernetes.io/load-balancer-name"] = f"{ingress_group.name}-alb"
+        annotations["alb.ingress.kubernetes.io/group.name"] = ingress_group.name
+        annotations["alb.ingress.kubernetes.io/group.order"] = str(ingress_group.order)
+
+    # The ALB drains a terminating pod for as long as it keeps serving. Without an ALB profile only the
+    # deregistration delay is set, the other target group attributes keep the ALB defaults.
+    target_group_attributes = alb_profile.target_group_attributes() if alb_profile is not None else None
+    graceful_shutdown = workload.graceful_shutdown if workload is not None else None
+    if graceful_shutdown is not None and alb_profile is not None:
+        target_group_attributes = replace(alb_profile, deregistration_delay_seconds=graceful_shutdown.drain(alb_profile)).target_group_attributes()
+    elif graceful_shutdown is not None:
+        target_group_attributes = [f"deregistration_delay.timeout_seconds={graceful_shutdown.drain()}"]
+    if target_group_attributes is not None:
+        annotations["alb.ingress.kubernetes.io/target-group-attributes"] = ",".join(target_group_attributes)
+
+    if alb_profile is not None:
+        # Idle timeout, routing algorithm, draining and health checks tuned for the traffic pattern
+        annotations.update(alb_profile.health_check_annotations())
+
+    if workload is not None and workload.readiness_probe is not None:
+        # Target group health checks match the readiness probe so pods take traffic as soon as they are ready
+        annotations.update(workload.readiness_probe.health_check_annotations())
+
+    if certificate is not None:
+        annotations.update(tls_annotations(certificate))
+    return annotations
+
+def tls_annotations(certificate: str) -> dict:
+    # Enable TLS 1.2 and HTTPS
+    return {
+        "alb.ingress.kubernetes.io/certificate-arn": certificate,
+        "alb.ingress.kubernetes.io/listen-ports": '[{"HTTPS":443}, {"HTTP":80}]',
+        "alb.ingress.kubernetes.io/ssl-policy": "ELBSecurityPolicy-TLS-1-2-Ext-2018-06",
+        "alb.ingress.kubernetes.io/ssl-redirect": '443'
+    }
+
 class AppChart(Chart):
-    def __init__(self, scope: Construct, id: str, namespace: str, alb_access_logs_bucket_name: str, certificate: str = None):
+    def __init__(
+            self,
+            scope: Construct,
+            id: str,
+            namespace: str,
+            alb_access_logs_bucket_name: str,
+            certificate: str = None,
+            workload: WorkloadOptions = None,
+            alb_profile: AlbPerformanceProfile = None,
+            canary: CanaryOptions = None,
+            name: str = None,
+            ingress_group: IngressGroupOptions = None
+        ):
         super().__init__(scope, id)
 
+        # Resource names, prefixed by the chart name when several charts share the namespace
+        def resource_name(default: str, suffix: str) -> str:
+            return f"{name}-{suffix}" if name is not None else default
+
         self.service_target_port = 8080
 
-        # K8s deployment
-        self.deployment = Deployment(
+        # The pods keep serving for the deregistration delay of the ALB profile unless a drain time is set
+        workload = workload or WorkloadOptions()
+        if workload.graceful_shutdown is not None:
+            workload = replace(
+                workload,
+                graceful_shutdown = replace(workload.graceful_shutdown, drain_seconds=workload.graceful_shutdown.drain(alb_profile))
+            )
+
+        # K8s deployment, autoscaler and disruption budget
+        app = add_workload(
             self,
-            "MyDeployment",
-            metadata = ApiObjectMetadata(
-                name = "my-cdk8s-deployment",
-                namespace=namespace
-            ),
-            select = True,
-            containers = [
-                 ContainerProps(
-                    image = "paulbouwer/hello-kubernetes:1.5",
-                    image_pull_policy = ImagePullPolicy.ALWAYS,
-                    name = "nginx",
-                    resources = ContainerResources(
-                        cpu = CpuResources(request=Cpu.units(0.25),limit=Cpu.units(1))
-                    ),
-                    port_number = self.service_target_port,
-                    security_context = ContainerSecurityContextProps(
-                        user = 1005
-                    )
-                )
-            ]
+            namespace,
+            workload.container("nginx", "paulbouwer/hello-kubernetes:1.5", self.service_target_port),
+            workload,
+            resource_id = {"deployment": "MyDeployment", "hpa": "MyAutoscaler", "pdb": "MyPodDisruptionBudget"}.get,
+            resource_name = lambda kind: resource_name(f"my-cdk8s-{kind}", kind)
         )
+        self.deployment = app.deployment
+        self.autoscaler = app.autoscaler
+        self.disruption_budget = app.disruption_budget
 
         # K8s Service
         self.service = self.deployment.expose_via_service(
-            name = "my-service",
+            name = resource_name("my-service", "service"),
             ports = [
                 ServicePort(
                     protocol = Protocol.TCP,
@@ -63,30 +501,82 @@ class AppChart(Chart):
             service_type = ServiceType.NODE_PORT
         )
 
-        alb_annotations = {
-            # Create Target Group with ip targets to work with Fargate
-            "alb.ingress.kubernetes.io/target-type": "ip",
-            # Set ALB name
-            "alb.ingress.kubernetes.io/load-balancer-name": f"{self.service.name}-alb",
-            # Enable ALB Access Logs
-            "alb.ingress.kubernetes.io/load-balancer-attributes": f"access_logs.s3.enabled=true,access_logs.s3.bucket={alb_access_logs_bucket_name}"
-        }
-
-        if certificate is not None:
-            # Enable TLS 1.2 and HTTPS
-            alb_annotations["alb.ingress.kubernetes.io/certificate-arn"]= certificate
-            alb_annotations["alb.ingress.kubernetes.io/listen-ports"]= '[{"HTTPS":443}, {"HTTP":80}]'
-            alb_annotations["alb.ingress.kubernetes.io/ssl-policy"] = "ELBSecurityPolicy-TLS-1-2-Ext-2018-06"
-            alb_annotations["alb.ingress.kubernetes.io/ssl-redirect"] = '443'
-
         # K8s ingress
         self.ingress = Ingress(
             self,
             "AppALBIngress",
             metadata = ApiObjectMetadata(
-                name = "my-test-ingress",
-                annotations = alb_annotations
+                name = resource_name("my-test-ingress", "ingress"),
+                annotations = alb_annotations(
+                    f"{self.service.name}-alb",
+                    alb_access_logs_bucket_name,
+                    certificate = certificate,
+                    alb_profile = alb_profile,
+                    workload = workload,
+                    ingress_group = ingress_group
+                )
             )
         )
         ## Route traffic to the service
-        self.ingress.add_rule("/", IngressBackend.from_service(self.service))
+        if ingress_group is not None and ingress_group.host is not None:
+            self.ingress.add_host_rule(ingress_group.host, ingress_group.path, IngressBackend.from_service(self.service))
+        else:
+            self.ingress.add_rule(ingress_group.path if ingress_group is not None else "/", IngressBackend.from_service(self.service))
+
+        # Canary release: a second deployment and service for the candidate image, the ALB splits the
+        # requests between both target groups following the weighted forward action
+        self.canary_deployment = None
+        self.canary_service = None
+        if canary is not None:
+            # Stable and canary deployments only differ by their image and replicas
+            canary_workload = replace(workload, replicas=canary.replicas, autoscaling=None, pod_disruption_budget=None, zone_spread=None)
+            self.canary_deployment = add_workload(
+                self,
+                namespace,
+                canary_workload.container("nginx", canary.image, self.service_target_port),
+                canary_workload,
+                resource_id = {"deployment": "MyCanaryDeployment"}.get,
+                resource_name = lambda kind: resource_name(f"my-cdk8s-canary-{kind}", f"canary-{kind}")
+            ).deployment
+            self.canary_service = self.canary_deployment.expose_via_service(
+                name = resource_name("my-canary-service", "canary-service"),
+                ports = [
+                    ServicePort(
+                        protocol = Protocol.TCP,
+                        target_port = self.service_target_port,
+                        port = 80,
+                    )
+                ],
+                service_type = ServiceType.NODE_PORT
+            )
+
+            self.ingress.metadata.add_annotation(
+                "alb.ingress.kubernetes.io/actions.weighted-routing",
+                json.dumps({
+                    "type": "forward",
+                    "forwardConfig": {
+                        "targetGroups": [
+                            {"serviceName": self.service.name, "servicePort": "80", "weight": 100 - canary.weight},
+                            {"serviceName": self.canary_service.name, "servicePort": "80", "weight": canary.weight}
+                        ]
+                    }
+                })
+            )
+            # The rule points to the annotation action instead of a service
+            ApiObject.of(self.ingress).add_json_patch(
+                JsonPatch.replace(
+                    "/spec/rules/0/http/paths/0/backend",
+                    {"service": {"name": "weighted-routing", "port": {"name": "use-annotation"}}}
+                )
+            )
+
+def create_app_chart(scope: Construct, namespace: str, alb_access_logs_bucket_name: str, certificate: str = None, **options) -> AppChart:
+    # Chart deployed to the cluster, shared by KubernetesClusterStack and manifests.py so both synthesize the same resources
+    return AppChart(
+        scope,
+        "AppChart",
+        namespace = namespace,
+        alb_access_logs_bucket_name = alb_access_logs_bucket_name,
+        certificate = certificate,
+        **options
+    )
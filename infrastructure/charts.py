@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from typing import Callable, Sequence
+from cdk8s import App
+from .app_chart import create_app_chart, CanaryOptions, IngressGroupOptions
+from .services_chart import ServicesChart, ServiceSpec, load_service_specs
+from .image_pinning import ImageResolver, PullThroughCacheOptions
+
+# Tag to digest lookups of the pinned images, committed with the code
+IMAGE_DIGESTS_FILE = "image-digests.json"
+
+@dataclass(frozen=True)
+class AppsOptions:
+    # AppChart keyword arguments of the main application
+    app_chart: dict = None
+    # ALB IngressGroup shared by the main application and the additional apps. Each additional app is a dict
+    # of AppChart keyword arguments, with a name and a path or host rule on the shared load balancer.
+    ingress_group: str = None
+    additional_apps: Sequence[dict] = None
+    # Services of a declarative spec, behind their own ALB
+    services: Sequence[ServiceSpec] = None
+    # One kubectl custom resource per chart, kind or resource, see manifest_split.py
+    manifest_split: str = "chart"
+    # Images pinned to the digest of their tag, then pulled from ECR in the region instead of the upstream registry
+    image_resolver: ImageResolver = None
+    pull_through_cache: PullThroughCacheOptions = None
+    # Workloads whose Fargate pod wastes more than this share of its capacity are flagged, as errors when strict
+    fargate_max_waste: float = 0.25
+    fargate_sizing_strict: bool = False
+
+    def __post_init__(self):
+        if not 0 <= self.fargate_max_waste <= 1:
+            raise ValueError(f"fargate_max_waste is a share of the pod price between 0 and 1, got {self.fargate_max_waste}")
+        if not self.additional_apps:
+            return
+        if self.ingress_group is None:
+            raise ValueError("Additional apps share the ALB of the main app, set an ingress group")
+
+        # Unnamed charts get the resource names of the main app and would replace its resources
+        names = [app.get("name") for app in self.additional_apps]
+        if None in names:
+            raise ValueError("Every additional app needs a name")
+        if len(set(names)) != len(names) or (self.app_chart or {}).get("name") in names:
+            raise ValueError(f"Additional app names must be unique and differ from the main app, got {', '.join(names)}")
+
+        # The controller merges the ingresses of a group into one ALB, conflicting attributes are never reconciled
+        load_balancer_attributes = {
+            tuple(app["alb_profile"].load_balancer_attributes()) if app.get("alb_profile") is not None else ()
+            for app in [self.app_chart or {}, *self.additional_apps]
+        }
+        if len(load_balancer_attributes) > 1:
+            raise ValueError("The apps of an ingress group share one ALB, their alb_profile idle timeout and HTTP/2 settings must match")
+
+def apps_options(try_get_context: Callable[[str], object]) -> AppsOptions:
+    # Charts of the cdk.json context, shared by DeployStage and manifests.py
+
+    # Canary image and traffic weight, e.g. "canary": {"image": "repo/app:candidate", "weight": 10}
+    app_chart_options = {}
+    canary = try_get_context("canary")
+    if canary is not None:
+        app_chart_options["canary"] = CanaryOptions(**canary)
+    # JSON or YAML file listing the services to deploy next to the application
+    services_spec = try_get_context("servicesSpec")
+    # ECR pull through cache of the upstream registry, e.g. "pullThroughCache": {"credential_arn": "arn:..."}
+    pull_through_cache = try_get_context("pullThroughCache")
+    # Share of the Fargate pod price a workload may leave unused, e.g. "fargateMaxWaste": 0.1
+    fargate_max_waste = try_get_context("fargateMaxWaste")
+
+    return AppsOptions(
+        app_chart = app_chart_options,
+        ingress_group = try_get_context("ingressGroup"),
+        additional_apps = try_get_context("additionalApps"),
+        services = load_service_specs(services_spec) if services_spec else None,
+        manifest_split = try_get_context("manifestSplit") or "chart",
+        image_resolver = ImageResolver(cache_path=IMAGE_DIGESTS_FILE) if try_get_context("pinImages") else None,
+        pull_through_cache = PullThroughCacheOptions(**pull_through_cache) if pull_through_cache is not None else None,
+        fargate_max_waste = fargate_max_waste if fargate_max_waste is not None else 0.25,
+        fargate_sizing_strict = bool(try_get_context("fargateSizingStrict"))
+    )
+
+def create_charts(
+        apps: AppsOptions,
+        alb_access_logs_bucket_name: str,
+        certificate: str = None,
+        namespace: str = "default",
+        new_app: Callable[[str], App] = None
+    ) -> dict:
+    # Charts by construct id, each in its own cdk8s app created by new_app from that id. With an ingress group the
+    # additional apps share the ALB of the main app, their path or host rules come first and the catch-all rule
+    # of the main app last.
+    new_app = new_app or (lambda chart_id: App())
+    additional_apps = apps.additional_apps or []
+    app_chart_options = dict(apps.app_chart or {})
+    if apps.ingress_group is not None:
+        app_chart_options["ingress_group"] = IngressGroupOptions(apps.ingress_group, order=len(additional_apps) + 1)
+    charts = {
+        "AppChart": create_app_chart(
+            new_app("AppChart"),
+            namespace = namespace,
+            alb_access_logs_bucket_name = alb_access_logs_bucket_name,
+            certificate = certificate,
+            **app_chart_options
+        )
+    }
+    for order, app_options in enumerate(additional_apps, start=1):
+        app_options = dict(app_options)
+        app_options["ingress_group"] = IngressGroupOptions(
+            apps.ingress_group,
+            order = order,
+            path = app_options.pop("path", "/"),
+            host = app_options.pop("host", None)
+        )
+        # Named after the deployment of the chart
+        chart_id = f"AppChart-{app_options['name']}-deployment"
+        charts[chart_id] = create_app_chart(
+            new_app(chart_id),
+            namespace = namespace,
+            alb_access_logs_bucket_name = alb_access_logs_bucket_name,
+            certificate = certificate,
+            **app_options
+        )
+
+    # The workloads of a service spec all go in one chart behind their own ALB
+    if apps.services:
+        charts["ServicesChart"] = ServicesChart(
+            new_app("ServicesChart"),
+            "ServicesChart",
+            namespace = namespace,
+            alb_access_logs_bucket_name = alb_access_logs_bucket_name,
+            services = apps.services,
+            certificate = certificate
+        )
+    return charts
@@ -1,22 +1,78 @@
-from typing import Sequence
+from dataclasses import dataclass
+from typing import Mapping, Sequence
 from constructs import Construct
-from aws_cdk import Stack, CfnOutput, RemovalPolicy
+from aws_cdk import Stack, CfnOutput, RemovalPolicy, Annotations, Size
+from aws_cdk.aws_ec2 import SubnetSelection, InterfaceVpcEndpointAwsService, GatewayVpcEndpointAwsService
 from aws_cdk.aws_eks import (
     FargateCluster,
     AlbControllerOptions,
     AlbControllerVersion,
     KubernetesVersion,
-    AlbScheme,
     ClusterLoggingTypes,
-    EndpointAccess
+    EndpointAccess,
+    KubectlProvider
 )
 from aws_cdk.aws_iam import Role, User
+from aws_cdk.aws_ecr import CfnPullThroughCacheRule
 from aws_cdk.aws_s3 import Bucket, BlockPublicAccess, BucketEncryption
 from aws_cdk.aws_iam import PolicyStatement, AccountPrincipal
-from aws_cdk.aws_route53 import CnameRecord, HostedZone
+from aws_cdk.aws_route53 import CnameRecord, HostedZone, CfnHealthCheck, CfnRecordSet, ARecord, AaaaRecord, RecordTarget
+from aws_cdk.aws_route53_targets import CloudFrontTarget
+from aws_cdk.aws_cloudfront import Distribution
 from aws_cdk.lambda_layer_kubectl_v28 import KubectlV28Layer
-from cdk8s import App as Ck8sApp
-from .app_chart import AppChart
+from cdk8s import Chart
+from .charts import AppsOptions, create_charts
+from .services_chart import ServicesChart
+from .manifests_stack import add_charts, KubectlProviderAttributes
+from .fargate_sizing import size_manifests
+from .access_logs import AccessLogsAthena, access_logs_lifecycle_rules
+from .edge_cache import EdgeDistribution, CloudFrontOptions
+from .image_pinning import pull_through_image, rewrite_chart_images
+
+def fully_qualified_record_name(record_name: str, zone_name: str) -> str:
+    # Same resolution as the Route 53 record constructs
+    zone_name = zone_name.rstrip(".")
+    if record_name.endswith("."):
+        return record_name
+    if record_name.endswith(zone_name):
+        return f"{record_name}."
+    return f"{record_name}.{zone_name}."
+
+# Services reached by the nodes, pods and controllers of the private cluster: image pulls, IAM roles for
+# service accounts, log shipping and the ALB controller
+INTERFACE_ENDPOINTS = {
+    "EcrApi": InterfaceVpcEndpointAwsService.ECR,
+    "EcrDocker": InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    "Sts": InterfaceVpcEndpointAwsService.STS,
+    "CloudWatchLogs": InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+    "ElasticLoadBalancing": InterfaceVpcEndpointAwsService.ELASTIC_LOAD_BALANCING
+}
+
+# Resource metrics of the HorizontalPodAutoscalers. The Fargate kubelet already listens on port 10250
+# of the pod address, metrics-server has to use another one.
+METRICS_SERVER_CHART_VERSION = "3.11.0"
+METRICS_SERVER_PORT = 4443
+
+@dataclass(frozen=True)
+class InfrastructureOptions:
+    # Memory of the kubectl handler, more memory applies large manifests and many auth entries faster,
+    # and its environment variables, e.g. proxy settings
+    kubectl_memory_mib: int = None
+    kubectl_environment: Mapping[str, str] = None
+    # Subnets of the control plane network interfaces and of the kubectl handler, e.g.
+    # [SubnetSelection(subnet_type=SubnetType.PRIVATE_WITH_EGRESS)]. The Fargate pods stay in the private subnets.
+    vpc_subnets: Sequence[SubnetSelection] = None
+    vpc_endpoints: bool = False
+    # Athena table and lifecycle rules of the ALB access logs bucket
+    access_logs_athena: bool = False
+    access_logs_lifecycle: bool = False
+    # Latency record per region, or a CloudFront distribution in front of the ALB
+    latency_routing: bool = False
+    cloudfront: CloudFrontOptions = None
+
+    def __post_init__(self):
+        if self.cloudfront is not None and self.latency_routing:
+            raise ValueError("The CloudFront distribution has a single ALB origin, it cannot be combined with latency routing")
 
 class KubernetesClusterStack(Stack):
     def __init__(
@@ -30,11 +86,20 @@ class KubernetesClusterStack(Stack):
             hosted_zone_id: str,
             hosted_zone_name: str,
             record_name: str,
+            apps: AppsOptions = None,
+            infrastructure: InfrastructureOptions = None,
             **kwargs
         ):
 
         super().__init__(scope, id, **kwargs)
 
+        apps = apps or AppsOptions()
+        infrastructure = infrastructure or InfrastructureOptions()
+        cloudfront = infrastructure.cloudfront
+        # The ALB redirects to HTTPS with a certificate for the record name, CloudFront must then use that name
+        if cloudfront is not None and certificate is not None and (cloudfront.certificate_arn is None or hosted_zone_id is None):
+            raise ValueError("With an ALB certificate, the CloudFront distribution needs a certificate_arn and a hosted zone record")
+
         # EKS Cluster
         self.cluster = FargateCluster(
             self,
@@ -55,9 +120,114 @@ class KubernetesClusterStack(Stack):
             # Make the endpoint private
             endpoint_access=EndpointAccess.PRIVATE,
             version = KubernetesVersion.V1_28,
-            kubectl_layer = KubectlV28Layer(self, "Kubectl")
+            kubectl_layer = KubectlV28Layer(self, "Kubectl"),
+            # Sizing of the kubectl handler, more memory applies large manifests and many auth entries faster.
+            # The subnet selection also places the control plane network interfaces. Changing it on an existing
+            # cluster requires a new cluster, which the fixed cluster name prevents, so set it before the first
+            # deployment. The handler runs in the private subnets of the selection, next to the private endpoint.
+            kubectl_memory = Size.mebibytes(infrastructure.kubectl_memory_mib) if infrastructure.kubectl_memory_mib is not None else None,
+            kubectl_environment = infrastructure.kubectl_environment,
+            vpc_subnets = infrastructure.vpc_subnets
+        )
+
+        # Keep AWS API calls and ECR image layers (served from S3) off the NAT gateways
+        if infrastructure.vpc_endpoints:
+            self.cluster.vpc.add_gateway_endpoint("S3Endpoint", service=GatewayVpcEndpointAwsService.S3)
+            for name, service in INTERFACE_ENDPOINTS.items():
+                self.cluster.vpc.add_interface_endpoint(f"{name}Endpoint", service=service)
+
+        self.add_metrics_server()
+
+        logs_bucket = self.add_access_logs_bucket(elb_account_id, infrastructure)
+
+        # Cdk8s resources
+        charts = create_charts(apps, logs_bucket.bucket_name, certificate)
+        self.rewrite_images(charts, apps)
+        self.report_pod_sizes(charts, apps)
+
+        added_charts = add_charts(self, self.cluster, charts, apps.manifest_split)
+
+        self.add_admins(admin_users, admin_roles)
+
+        # The deletion of `app_chart` is what instructs the controller to delete the ELB.
+        # So we need to make sure this happens before the controller is deleted.
+        for added_chart in added_charts:
+            added_chart.node.add_dependency(self.cluster.alb_controller)
+
+        # Lets the manifests stacks of this cluster apply their charts through the same kubectl handler.
+        # Looked up from a chart, which already waits for the handler, the stack itself would depend on it.
+        self.kubectl_provider = KubectlProviderAttributes.from_provider(KubectlProvider.get_or_create(added_charts[0], self.cluster))
+
+        # The ingresses of a group share the same address, it is only resolved once
+        alb_dns = self.cluster.get_ingress_load_balancer_address(charts["AppChart"].ingress.name)
+
+        # Return ALB Public DNS in stack outputs. With a certificate the ALB redirects HTTP to HTTPS,
+        # which only matches the record name.
+        application_endpoint = f"http://{alb_dns}"
+        if certificate is not None and hosted_zone_id is not None:
+            application_endpoint = f"https://{fully_qualified_record_name(record_name, hosted_zone_name).rstrip('.')}"
+        self.application_endpoint = CfnOutput(
+            self,
+            "ApplicationEndpoint",
+            value=application_endpoint
         )
 
+        if "ServicesChart" in charts:
+            self.add_services_endpoints(charts["ServicesChart"])
+
+        # Edge caching in front of the ALB, the record then points at the distribution
+        distribution = None
+        if cloudfront is not None:
+            distribution = EdgeDistribution(
+                self,
+                "EdgeDistribution",
+                alb_dns = alb_dns,
+                options = cloudfront,
+                domain_name = fully_qualified_record_name(record_name, hosted_zone_name).rstrip(".") if hosted_zone_id is not None else None,
+                alb_certificate = certificate
+            ).distribution
+            CfnOutput(
+                self,
+                "DistributionEndpoint",
+                value = f"https://{distribution.distribution_domain_name}"
+            )
+
+        if hosted_zone_id is not None and infrastructure.latency_routing:
+            workload = apps.app_chart.get("workload")
+            self.add_latency_record(
+                alb_dns,
+                hosted_zone_id,
+                fully_qualified_record_name(record_name, hosted_zone_name),
+                https = certificate is not None,
+                health_check_path = workload.readiness_probe.path if workload is not None and workload.readiness_probe is not None else "/"
+            )
+        elif hosted_zone_id is not None:
+            self.add_record(alb_dns, distribution, hosted_zone_id, hosted_zone_name, record_name)
+
+    def add_metrics_server(self):
+        # kube-system is selected by the default Fargate profile of the cluster
+        self.cluster.add_helm_chart(
+            "MetricsServer",
+            chart = "metrics-server",
+            repository = "https://kubernetes-sigs.github.io/metrics-server/",
+            namespace = "kube-system",
+            release = "metrics-server",
+            version = METRICS_SERVER_CHART_VERSION,
+            values = {
+                "containerPort": METRICS_SERVER_PORT
+            }
+        )
+
+    def add_services_endpoints(self, services_chart: ServicesChart):
+        # One output per ALB of the services: ServicesEndpoint, ServicesEndpoint2...
+        for index, ingress in enumerate(services_chart.ingresses):
+            CfnOutput(
+                self,
+                f"ServicesEndpoint{index + 1}" if index else "ServicesEndpoint",
+                value = f"http://{self.cluster.get_ingress_load_balancer_address(ingress.name, namespace='default')}"
+            )
+
+    def add_access_logs_bucket(self, elb_account_id: str, infrastructure: InfrastructureOptions) -> Bucket:
         logs_bucket = Bucket(
             self,
             "Bucket",
@@ -66,7 +236,8 @@ class KubernetesClusterStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,
             auto_delete_objects=True,
             enforce_ssl=True,
-            versioned=True
+            versioned=True,
+            lifecycle_rules=access_logs_lifecycle_rules() if infrastructure.access_logs_lifecycle else None
         )
 
         logs_bucket.add_to_resource_policy(
@@ -83,23 +254,65 @@ class KubernetesClusterStack(Stack):
             )
         )
 
-        # Cdk8s resources
-        app_chart = AppChart(
-            Ck8sApp(),
-            "AppChart",
-            namespace = "default",
-            alb_access_logs_bucket_name = logs_bucket.bucket_name,
-            certificate = certificate
-        )
+        # Athena table and saved latency queries over the ALB access logs
+        if infrastructure.access_logs_athena:
+            AccessLogsAthena(
+                self,
+                "AccessLogsAthena",
+                bucket = logs_bucket,
+                database_name = "cdk8s_samples_alb_logs"
+            )
+        return logs_bucket
 
-        added_chart = self.cluster.add_cdk8s_chart(
-            "AppChart",
-            app_chart,
-            # Expose via internet-facing ALB
-            ingress_alb = True,
-            ingress_alb_scheme = AlbScheme.INTERNET_FACING
-        )
+    def rewrite_images(self, charts: Mapping[str, Chart], apps: AppsOptions):
+        # Images pinned to the digest of their tag, then pulled from ECR in the region instead of the upstream registry
+        image_rewrites = []
+        if apps.image_resolver is not None:
+            image_rewrites.append(apps.image_resolver.resolve)
+        pull_through_cache = apps.pull_through_cache
+        if pull_through_cache is not None:
+            CfnPullThroughCacheRule(
+                self,
+                "PullThroughCacheRule",
+                ecr_repository_prefix = pull_through_cache.repository_prefix,
+                upstream_registry_url = pull_through_cache.upstream_registry_url,
+                credential_arn = pull_through_cache.credential_arn
+            )
+            # The first pull of an image creates its cache repository
+            self.cluster.default_profile.pod_execution_role.add_to_principal_policy(
+                PolicyStatement(
+                    actions = [
+                        "ecr:CreateRepository",
+                        "ecr:BatchImportUpstreamImage"
+                    ],
+                    resources = [
+                        f"arn:{self.partition}:ecr:{self.region}:{self.account}:repository/{pull_through_cache.repository_prefix}/*"
+                    ]
+                )
+            )
+            image_rewrites.append(
+                lambda image: pull_through_image(
+                    image,
+                    upstream_registry = pull_through_cache.upstream_registry,
+                    cache_registry = f"{self.account}.dkr.ecr.{self.region}.{self.url_suffix}",
+                    repository_prefix = pull_through_cache.repository_prefix
+                )
+            )
+        for rewrite in image_rewrites:
+            for chart in charts.values():
+                rewrite_chart_images(chart, rewrite)
+
+    def report_pod_sizes(self, charts: Mapping[str, Chart], apps: AppsOptions):
+        # Report the Fargate pod size of every workload and flag the ones paying for unused capacity
+        for pod_size in [pod_size for chart in charts.values() for pod_size in size_manifests(chart.to_json())]:
+            if pod_size.waste <= apps.fargate_max_waste:
+                Annotations.of(self).add_info(str(pod_size))
+            elif apps.fargate_sizing_strict:
+                Annotations.of(self).add_error(str(pod_size))
+            else:
+                Annotations.of(self).add_warning(str(pod_size))
 
+    def add_admins(self, admin_users: Sequence[str], admin_roles: Sequence[str]):
         # Add IAM users to cluster
         for username in admin_users:
             arn = f'arn:aws:iam::{self.account}:user/{username}'
@@ -116,28 +329,59 @@ class KubernetesClusterStack(Stack):
             role = Role.from_role_arn(self, f"{role_name}Role", arn, mutable=False)
             self.cluster.aws_auth.add_masters_role(role)
 
-        # The deletion of `app_chart` is what instructs the controller to delete the ELB.
-        # So we need to make sure this happens before the controller is deleted.
-        added_chart.node.add_dependency(self.cluster.alb_controller)
+    def add_latency_record(self, alb_dns: str, hosted_zone_id: str, name: str, https: bool = False, health_check_path: str = "/"):
+        # One latency record per region, Route 53 answers with the closest healthy ALB.
+        # With a certificate the ALB redirects HTTP to HTTPS, only an HTTPS check reaches the application.
+        health_check = CfnHealthCheck(
+            self,
+            "HealthCheck",
+            health_check_config = CfnHealthCheck.HealthCheckConfigProperty(
+                type = "HTTPS" if https else "HTTP",
+                fully_qualified_domain_name = alb_dns,
+                port = 443 if https else 80,
+                resource_path = health_check_path,
+                request_interval = 30,
+                failure_threshold = 3
+            )
+        )
 
-        alb_dns = self.cluster.get_ingress_load_balancer_address(app_chart.ingress.name)
+        CfnRecordSet(
+            self,
+            "LatencyRecord",
+            hosted_zone_id = hosted_zone_id,
+            name = name,
+            type = "CNAME",
+            ttl = "60",
+            resource_records = [alb_dns],
+            set_identifier = self.region,
+            region = self.region,
+            health_check_id = health_check.attr_health_check_id
+        )
 
-        # Return ALB Public DNS in stack outputs
-        #if record is None:
-        CfnOutput(
+    def add_record(self, alb_dns: str, distribution: Distribution, hosted_zone_id: str, hosted_zone_name: str, record_name: str):
+        hosted_zone = HostedZone.from_hosted_zone_attributes(
             self,
-            "ApplicationEndpoint",
-            value=f"http://{alb_dns}"
+            "HostedZone",
+            hosted_zone_id=hosted_zone_id,
+            zone_name=hosted_zone_name
         )
 
-        if hosted_zone_id is not None:
-            hosted_zone = HostedZone.from_hosted_zone_attributes(
+        if distribution is not None:
+            ARecord(
                 self,
-                "HostedZone",
-                hosted_zone_id=hosted_zone_id,
-                zone_name=hosted_zone_name
+                "AliasRecord",
+                record_name = record_name,
+                zone = hosted_zone,
+                target = RecordTarget.from_alias(CloudFrontTarget(distribution))
             )
-
+            AaaaRecord(
+                self,
+                "AliasRecordIpv6",
+                record_name = record_name,
+                zone = hosted_zone,
+                target = RecordTarget.from_alias(CloudFrontTarget(distribution))
+            )
+        else:
             CnameRecord(
                 self,
                 "CnameRecord",
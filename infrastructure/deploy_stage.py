@@ -1,6 +1,19 @@
+from dataclasses import dataclass
 from aws_cdk import Stage, Environment
+from aws_cdk.aws_ec2 import SubnetSelection, SubnetType
 from constructs import Construct
-from .cluster_stack import KubernetesClusterStack
+from .cluster_stack import KubernetesClusterStack, InfrastructureOptions
+from .charts import apps_options
+from .edge_cache import CloudFrontOptions
+
+@dataclass(frozen=True)
+class DeploymentTarget:
+    account: str
+    region: str
+    # ELB account of the region, allowed to write the ALB access logs
+    elb_account_id: str
+    # ACM certificates are regional
+    certificate: str = None
 
 class DeployStage(Stage):
 
@@ -14,10 +27,16 @@ class DeployStage(Stage):
             hosted_zone_id: str = None,
             hosted_zone_name: str = None,
             record_name: str = None,
+            latency_routing: bool = False,
             **kwargs
         ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Subnet types of the control plane network interfaces and kubectl handler, e.g. ["PRIVATE_WITH_EGRESS"]
+        vpc_subnet_types = self.node.try_get_context("vpcSubnetTypes")
+        # CloudFront distribution in front of the ALB, e.g. "cloudFront": {"cached_paths": {"/static/*": {}}}
+        cloudfront = self.node.try_get_context("cloudFront")
+
         self.stack = KubernetesClusterStack(
             self,
             f"{app_name}-app-stack",
@@ -31,5 +50,16 @@ class DeployStage(Stage):
             certificate = certificate,
             hosted_zone_id =  hosted_zone_id,
             hosted_zone_name = hosted_zone_name,
-            record_name = record_name
+            record_name = record_name,
+            apps = apps_options(self.node.try_get_context),
+            infrastructure = InfrastructureOptions(
+                kubectl_memory_mib = self.node.try_get_context("kubectlMemoryMib"),
+                kubectl_environment = self.node.try_get_context("kubectlEnvironment"),
+                vpc_subnets = [SubnetSelection(subnet_type=SubnetType[name]) for name in vpc_subnet_types] if vpc_subnet_types else None,
+                vpc_endpoints = bool(self.node.try_get_context("vpcEndpoints")),
+                access_logs_athena = bool(self.node.try_get_context("accessLogsAthena")),
+                access_logs_lifecycle = bool(self.node.try_get_context("accessLogsLifecycle")),
+                latency_routing = latency_routing,
+                cloudfront = CloudFrontOptions.from_dict(cloudfront) if cloudfront is not None else None
+            )
         )
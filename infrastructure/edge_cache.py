@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from typing import Mapping, Sequence
+from constructs import Construct
+from aws_cdk import Duration
+from aws_cdk.aws_certificatemanager import Certificate
+from aws_cdk.aws_cloudfront import (
+    Distribution,
+    BehaviorOptions,
+    CachePolicy,
+    CacheQueryStringBehavior,
+    CacheHeaderBehavior,
+    OriginRequestPolicy,
+    OriginProtocolPolicy,
+    OriginSslPolicy,
+    AllowedMethods,
+    ViewerProtocolPolicy,
+    SecurityPolicyProtocol,
+    PriceClass
+)
+from aws_cdk.aws_cloudfront_origins import HttpOrigin
+
+@dataclass(frozen=True)
+class PathCacheOptions:
+    default_ttl_seconds: int = 86400
+    max_ttl_seconds: int = 31536000
+    min_ttl_seconds: int = 0
+    # Query strings and headers that are part of the cache key, none by default
+    query_strings: Sequence[str] = ()
+    headers: Sequence[str] = ()
+
+@dataclass(frozen=True)
+class CloudFrontOptions:
+    # ACM certificate in us-east-1 for the record name, the record then points at the distribution
+    certificate_arn: str = None
+    # Cache policy by path pattern, e.g. {"/static/*": PathCacheOptions()}. Other paths are not cached.
+    cached_paths: Mapping[str, PathCacheOptions] = None
+    # Connections to the ALB are reused between requests for keepalive_timeout_seconds
+    keepalive_timeout_seconds: int = 60
+    read_timeout_seconds: int = 30
+    connection_timeout_seconds: int = 10
+    connection_attempts: int = 3
+    compress: bool = True
+    # PRICE_CLASS_100, PRICE_CLASS_200 or PRICE_CLASS_ALL edge locations
+    price_class: str = "PRICE_CLASS_100"
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "CloudFrontOptions":
+        cached_paths = values.get("cached_paths")
+        return cls(**{
+            **values,
+            "cached_paths": {
+                pattern: PathCacheOptions(**options) for pattern, options in cached_paths.items()
+            } if cached_paths is not None else None
+        })
+
+class EdgeDistribution(Construct):
+    # CloudFront distribution with the ALB as origin. Dynamic paths go through uncached with every viewer
+    # header, the cached paths are served from the edge locations.
+    def __init__(self, scope: Construct, id: str, alb_dns: str, options: CloudFrontOptions, domain_name: str = None, alb_certificate: str = None):
+        super().__init__(scope, id)
+
+        aliased = options.certificate_arn is not None and domain_name is not None
+        # The ALB only listens on HTTPS with its own certificate. That certificate matches the record name,
+        # not the ALB address, so HTTPS also needs the viewer host.
+        https = aliased and alb_certificate is not None
+        origin = HttpOrigin(
+            alb_dns,
+            protocol_policy = OriginProtocolPolicy.HTTPS_ONLY if https else OriginProtocolPolicy.HTTP_ONLY,
+            origin_ssl_protocols = [OriginSslPolicy.TLS_V1_2],
+            keepalive_timeout = Duration.seconds(options.keepalive_timeout_seconds),
+            read_timeout = Duration.seconds(options.read_timeout_seconds),
+            connection_timeout = Duration.seconds(options.connection_timeout_seconds),
+            connection_attempts = options.connection_attempts
+        )
+        origin_request_policy = OriginRequestPolicy.ALL_VIEWER if https else OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER
+
+        additional_behaviors = {}
+        for index, (pattern, cache) in enumerate((options.cached_paths or {}).items()):
+            additional_behaviors[pattern] = BehaviorOptions(
+                origin = origin,
+                cache_policy = CachePolicy(
+                    self,
+                    f"CachePolicy{index}",
+                    comment = f"Cache policy of {pattern}",
+                    default_ttl = Duration.seconds(cache.default_ttl_seconds),
+                    max_ttl = Duration.seconds(cache.max_ttl_seconds),
+                    min_ttl = Duration.seconds(cache.min_ttl_seconds),
+                    query_string_behavior = CacheQueryStringBehavior.allow_list(*cache.query_strings) if cache.query_strings else CacheQueryStringBehavior.none(),
+                    header_behavior = CacheHeaderBehavior.allow_list(*cache.headers) if cache.headers else CacheHeaderBehavior.none(),
+                    # Compressed and uncompressed objects are cached separately
+                    enable_accept_encoding_gzip = options.compress,
+                    enable_accept_encoding_brotli = options.compress
+                ),
+                origin_request_policy = origin_request_policy,
+                allowed_methods = AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+                viewer_protocol_policy = ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                compress = options.compress
+            )
+
+        self.distribution = Distribution(
+            self,
+            "Distribution",
+            default_behavior = BehaviorOptions(
+                origin = origin,
+                cache_policy = CachePolicy.CACHING_DISABLED,
+                origin_request_policy = origin_request_policy,
+                allowed_methods = AllowedMethods.ALLOW_ALL,
+                viewer_protocol_policy = ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                compress = options.compress
+            ),
+            additional_behaviors = additional_behaviors or None,
+            domain_names = [domain_name] if aliased else None,
+            certificate = Certificate.from_certificate_arn(self, "Certificate", options.certificate_arn) if aliased else None,
+            minimum_protocol_version = SecurityPolicyProtocol.TLS_V1_2_2021,
+            price_class = PriceClass[options.price_class]
+        )
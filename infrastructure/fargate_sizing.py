@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+from dataclasses import dataclass
+from typing import Sequence
+
+# vCPU -> available memory values (GiB) for an EKS Fargate pod
+FARGATE_POD_SIZES = {
+    0.25: [0.5, 1, 2],
+    0.5: [1, 2, 3, 4],
+    1: list(range(2, 9)),
+    2: list(range(4, 17)),
+    4: list(range(8, 31)),
+    8: list(range(16, 61, 4)),
+    16: list(range(32, 121, 8))
+}
+
+# Fargate reserves 256 MiB on each pod for the kubelet, kube-proxy and containerd
+FARGATE_MEMORY_OVERHEAD_MIB = 256
+
+# On-demand Linux/x86 prices (us-east-1), only used to weight CPU against memory waste
+FARGATE_VCPU_HOUR_PRICE = 0.04048
+FARGATE_GB_HOUR_PRICE = 0.004445
+
+# Workload kinds and the path to their pod spec
+POD_SPEC_PATHS = {
+    "Pod": ["spec"],
+    "Deployment": ["spec", "template", "spec"],
+    "StatefulSet": ["spec", "template", "spec"],
+    "ReplicaSet": ["spec", "template", "spec"],
+    "Job": ["spec", "template", "spec"],
+    "CronJob": ["spec", "jobTemplate", "spec", "template", "spec"]
+}
+
+MEMORY_UNITS = {
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+    "k": 10 ** 3,
+    "M": 10 ** 6,
+    "G": 10 ** 9,
+    "T": 10 ** 12
+}
+
+@dataclass(frozen=True)
+class FargatePodSize:
+    workload: str
+    requested_cpu: float
+    requested_memory_mib: float
+    cpu: float
+    memory_mib: int
+
+    @property
+    def wasted_cpu(self) -> float:
+        return self.cpu - self.requested_cpu
+
+    @property
+    def wasted_memory_mib(self) -> float:
+        return self.memory_mib - self.requested_memory_mib - FARGATE_MEMORY_OVERHEAD_MIB
+
+    @property
+    def waste(self) -> float:
+        # Share of the pod hourly price paid for capacity that was not requested
+        price = self.cpu * FARGATE_VCPU_HOUR_PRICE + self.memory_mib / 1024 * FARGATE_GB_HOUR_PRICE
+        wasted_price = self.wasted_cpu * FARGATE_VCPU_HOUR_PRICE + self.wasted_memory_mib / 1024 * FARGATE_GB_HOUR_PRICE
+        return wasted_price / price
+
+    def __str__(self) -> str:
+        return (
+            f"{self.workload} requests {self.requested_cpu:g} vCPU/{self.requested_memory_mib:g}Mi "
+            f"and runs on a {self.cpu:g} vCPU/{self.memory_mib / 1024:g}GB Fargate pod "
+            f"({self.wasted_cpu:g} vCPU and {self.wasted_memory_mib:g}Mi unused, {self.waste:.0%} of the pod price). "
+            f"Requesting {self.cpu:g} vCPU/{self.memory_mib - FARGATE_MEMORY_OVERHEAD_MIB}Mi costs the same"
+        )
+
+def parse_cpu(quantity) -> float:
+    quantity = str(quantity)
+    if quantity.endswith("m"):
+        return float(quantity[:-1]) / 1000
+    return float(quantity)
+
+def parse_memory_mib(quantity) -> float:
+    quantity = str(quantity)
+    for suffix, multiplier in MEMORY_UNITS.items():
+        if quantity.endswith(suffix):
+            return float(quantity[:-len(suffix)]) * multiplier / 2 ** 20
+    return float(quantity) / 2 ** 20
+
+def fargate_pod_size(cpu: float, memory_mib: float) -> tuple:
+    # Smallest vCPU/memory combination that fits the requests plus the Fargate overhead
+    memory_mib += FARGATE_MEMORY_OVERHEAD_MIB
+    for size_cpu, size_memory_gib in FARGATE_POD_SIZES.items():
+        if size_cpu < cpu:
+            continue
+        for memory_gib in size_memory_gib:
+            if memory_gib * 1024 >= memory_mib:
+                return size_cpu, int(memory_gib * 1024)
+    raise ValueError(f"No Fargate pod size fits {cpu:g} vCPU and {memory_mib:g}Mi")
+
+def pod_requests(pod_spec: dict) -> tuple:
+    # Fargate sizes on the larger of the biggest init container and the sum of the app containers.
+    # Limits are used when a container sets no request.
+    def container_requests(container):
+        resources = container.get("resources", {})
+        quantities = {**resources.get("limits", {}), **resources.get("requests", {})}
+        return parse_cpu(quantities.get("cpu", 0)), parse_memory_mib(quantities.get("memory", 0))
+
+    containers = [container_requests(container) for container in pod_spec.get("containers", [])]
+    init_containers = [container_requests(container) for container in pod_spec.get("initContainers", [])]
+
+    cpu = max([sum(cpu for cpu, _ in containers)] + [cpu for cpu, _ in init_containers])
+    memory_mib = max([sum(memory for _, memory in containers)] + [memory for _, memory in init_containers])
+    return cpu, memory_mib
+
+def size_manifests(manifests: Sequence[dict]) -> list:
+    sizes = []
+    for manifest in manifests:
+        path = POD_SPEC_PATHS.get(manifest.get("kind"))
+        if path is None:
+            continue
+        pod_spec = manifest
+        for key in path:
+            pod_spec = pod_spec.get(key, {})
+
+        cpu, memory_mib = pod_requests(pod_spec)
+        size_cpu, size_memory_mib = fargate_pod_size(cpu, memory_mib)
+        sizes.append(
+            FargatePodSize(
+                workload = f'{manifest["kind"]}/{manifest["metadata"]["name"]}',
+                requested_cpu = cpu,
+                requested_memory_mib = memory_mib,
+                cpu = size_cpu,
+                memory_mib = size_memory_mib
+            )
+        )
+    return sizes
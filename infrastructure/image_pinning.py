@@ -0,0 +1,160 @@
+import http.client
+import json
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlsplit, urlencode
+from cdk8s import Chart, ApiObject, JsonPatch
+
+# Registries whose API is served on another host than the one of the image name
+REGISTRY_HOSTS = {"docker.io": "registry-1.docker.io"}
+
+# Index and manifest types, so a multi-arch tag resolves to the digest of its index like a pull does
+MANIFEST_TYPES = ", ".join([
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json"
+])
+
+@dataclass(frozen=True)
+class ImageReference:
+    registry: str
+    repository: str
+    tag: str = "latest"
+    digest: str = None
+
+    @classmethod
+    def parse(cls, image: str) -> "ImageReference":
+        # Same defaults as docker: Docker Hub, library/ for official images and the latest tag
+        name, _, digest = image.partition("@")
+        first, _, rest = name.partition("/")
+        if rest and ("." in first or ":" in first or first == "localhost"):
+            registry, name = first, rest
+        else:
+            registry = "docker.io"
+        repository, tag = name, "latest"
+        if ":" in name.rsplit("/", 1)[-1]:
+            repository, tag = name.rsplit(":", 1)
+        if registry == "docker.io" and "/" not in repository:
+            repository = f"library/{repository}"
+        return cls(registry, repository, tag, digest or None)
+
+    def __str__(self) -> str:
+        image = f"{self.registry}/{self.repository}:{self.tag}"
+        return f"{image}@{self.digest}" if self.digest else image
+
+@dataclass(frozen=True)
+class PullThroughCacheOptions:
+    # Secrets Manager secret with the upstream credentials, its name must start with ecr-pullthroughcache/.
+    # Docker Hub requires one.
+    credential_arn: str = None
+    # Registry of the image names and host of its API
+    upstream_registry: str = "docker.io"
+    upstream_registry_url: str = "registry-1.docker.io"
+    repository_prefix: str = "docker-hub"
+
+    def __post_init__(self):
+        # ECR rejects a Docker Hub rule without credentials, fail at synth time instead of during the deployment
+        if self.credential_arn is None and self.upstream_registry_url == REGISTRY_HOSTS["docker.io"]:
+            raise ValueError("A Docker Hub pull through cache needs a credential_arn, the ARN of a secret named ecr-pullthroughcache/...")
+
+class RegistryClient:
+    # Anonymous tag lookups through the registry HTTP API v2. HEAD requests only, which Docker Hub
+    # does not count against the pull rate limit. Any object with the same digest method can replace it.
+    def __init__(self, timeout_seconds: float = 10):
+        self.timeout_seconds = timeout_seconds
+
+    def request(self, method: str, url: str, headers: dict) -> tuple:
+        parts = urlsplit(url)
+        connection = http.client.HTTPSConnection(parts.netloc, timeout=self.timeout_seconds)
+        try:
+            connection.request(method, f"{parts.path}?{parts.query}" if parts.query else parts.path, headers=headers)
+            response = connection.getresponse()
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, response.read()
+        finally:
+            connection.close()
+
+    def token(self, challenge: str) -> str:
+        # Bearer realm="https://auth.docker.io/token",service="registry.docker.io",scope="repository:library/nginx:pull"
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop("realm")
+        status, _, body = self.request("GET", f"{realm}?{urlencode(params)}", {})
+        if status != 200:
+            raise RuntimeError(f"Token request to {realm} failed with HTTP {status}")
+        document = json.loads(body)
+        return document.get("token") or document["access_token"]
+
+    def digest(self, registry: str, repository: str, tag: str) -> str:
+        url = f"https://{REGISTRY_HOSTS.get(registry, registry)}/v2/{repository}/manifests/{tag}"
+        headers = {"Accept": MANIFEST_TYPES}
+        status, response_headers, _ = self.request("HEAD", url, headers)
+        if status == 401 and response_headers.get("www-authenticate", "").startswith("Bearer"):
+            headers["Authorization"] = f'Bearer {self.token(response_headers["www-authenticate"])}'
+            status, response_headers, _ = self.request("HEAD", url, headers)
+        if status != 200 or "docker-content-digest" not in response_headers:
+            raise RuntimeError(f"Cannot resolve {registry}/{repository}:{tag}, HTTP {status}")
+        return response_headers["docker-content-digest"]
+
+class ImageResolver:
+    # Pins images to the digest of their tag at synth time. Lookups are kept in a JSON file,
+    # commit it so every synth of a commit deploys the same images without calling the registries.
+    def __init__(self, client=None, cache_path: str = None, max_age_seconds: float = None):
+        self.client = client or RegistryClient()
+        self.cache_path = Path(cache_path) if cache_path is not None else None
+        self.max_age_seconds = max_age_seconds
+        self.cache = {}
+        if self.cache_path is not None and self.cache_path.exists():
+            self.cache = json.loads(self.cache_path.read_text(encoding="utf-8"))
+
+    def digest(self, reference: ImageReference) -> str:
+        key = f"{reference.registry}/{reference.repository}:{reference.tag}"
+        entry = self.cache.get(key)
+        if entry is not None and (self.max_age_seconds is None or time.time() - entry["resolved_at"] < self.max_age_seconds):
+            return entry["digest"]
+        digest = self.client.digest(reference.registry, reference.repository, reference.tag)
+        self.cache[key] = {"digest": digest, "resolved_at": int(time.time())}
+        if self.cache_path is not None:
+            self.cache_path.write_text(json.dumps(self.cache, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        return digest
+
+    def resolve(self, image: str) -> str:
+        # The tag is kept for readability, the digest takes precedence when pulling
+        reference = ImageReference.parse(image)
+        if reference.digest is not None:
+            return image
+        return f"{image}@{self.digest(reference)}"
+
+def pull_through_image(image: str, upstream_registry: str, cache_registry: str, repository_prefix: str) -> str:
+    # Images of the upstream registry are pulled from the ECR pull through cache, by tag or digest
+    reference = ImageReference.parse(image)
+    if REGISTRY_HOSTS.get(reference.registry, reference.registry) != REGISTRY_HOSTS.get(upstream_registry, upstream_registry):
+        return image
+    return str(ImageReference(f"{cache_registry}/{repository_prefix}", reference.repository, reference.tag, reference.digest))
+
+def container_image_paths(value, path: str = "") -> list:
+    # JSON pointers to the image of every container and init container of a manifest
+    paths = []
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key in ("containers", "initContainers") and isinstance(child, list):
+                paths.extend((f"{path}/{key}/{index}/image", container["image"]) for index, container in enumerate(child))
+            else:
+                paths.extend(container_image_paths(child, f"{path}/{key}"))
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            paths.extend(container_image_paths(child, f"{path}/{index}"))
+    return paths
+
+def rewrite_chart_images(chart: Chart, rewrite: Callable[[str], str]):
+    # Patches the images of every workload of the chart, whatever construct defined them
+    for construct in chart.node.find_all():
+        if not ApiObject.is_api_object(construct):
+            continue
+        api_object = ApiObject.of(construct)
+        for path, image in container_image_paths(api_object.to_json()):
+            rewritten = rewrite(image)
+            if rewritten != image:
+                api_object.add_json_patch(JsonPatch.replace(path, rewritten))
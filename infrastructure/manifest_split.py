@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import re
+from typing import Sequence
+
+# chart: one manifest for the whole chart, kind: one per resource kind, resource: one per resource
+MANIFEST_SPLIT_MODES = ["chart", "kind", "resource"]
+
+def resource_key(resource: dict) -> str:
+    # Stable across content changes, so an updated resource keeps its construct and CloudFormation logical ids
+    metadata = resource.get("metadata", {})
+    key = f'{resource["kind"]}-{metadata.get("namespace", "default")}-{metadata["name"]}'
+    return re.sub("[^A-Za-z0-9-]", "-", key)
+
+def resource_identity(resource: dict) -> str:
+    metadata = resource.get("metadata", {})
+    return f'{resource["kind"]} {metadata.get("namespace", "default")}/{metadata["name"]}'
+
+def content_hash(resources: Sequence[dict]) -> str:
+    return hashlib.sha256(json.dumps(resources, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def split_manifests(resources: Sequence[dict], mode: str) -> dict:
+    # Groups of resources by stable key, in the order of the chart
+    if mode not in MANIFEST_SPLIT_MODES:
+        raise ValueError(f"Unknown manifest split mode {mode}, expected one of {', '.join(MANIFEST_SPLIT_MODES)}")
+    groups = {}
+    for resource in resources:
+        if mode == "chart":
+            key = "chart"
+        elif mode == "kind":
+            key = resource["kind"]
+        else:
+            key = resource_key(resource)
+            # Different names can sanitize to the same key, e.g. a.b and a-b
+            if key in groups:
+                raise ValueError(f"{resource_identity(groups[key][0])} and {resource_identity(resource)} share the manifest id {key}, rename one of them")
+        groups.setdefault(key, []).append(resource)
+    return groups
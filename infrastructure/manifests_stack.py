@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from typing import Mapping
+from constructs import Construct
+from aws_cdk import Stack
+from aws_cdk.aws_eks import Cluster, ICluster, KubectlProvider, KubernetesManifest, AlbScheme
+from aws_cdk.aws_iam import Role
+from cdk8s import Chart
+from .manifest_split import split_manifests, content_hash
+
+@dataclass(frozen=True)
+class KubectlProviderAttributes:
+    # ARN of the kubectl handler function, the role it assumes to call the cluster and its own execution role
+    function_arn: str
+    kubectl_role_arn: str
+    handler_role_arn: str
+
+    @classmethod
+    def from_provider(cls, provider: KubectlProvider) -> "KubectlProviderAttributes":
+        return cls(
+            function_arn = provider.service_token,
+            kubectl_role_arn = provider.role_arn,
+            handler_role_arn = provider.handler_role.role_arn
+        )
+
+def add_charts(scope: Construct, cluster: ICluster, charts: Mapping[str, Chart], manifest_split: str) -> list:
+    # One kubectl custom resource per chart, or per kind or resource so an update only re-applies
+    # the manifests whose content changed and each custom resource payload stays small
+    added_charts = []
+    for chart_id, chart in charts.items():
+        if manifest_split == "chart":
+            added_charts.append(
+                cluster.add_cdk8s_chart(
+                    chart_id,
+                    chart,
+                    # Expose via internet-facing ALB
+                    ingress_alb = True,
+                    ingress_alb_scheme = AlbScheme.INTERNET_FACING
+                )
+            )
+            continue
+        for key, resources in split_manifests(chart.to_json(), manifest_split).items():
+            manifest = KubernetesManifest(
+                scope,
+                f"{chart_id}-{key}",
+                cluster = cluster,
+                manifest = resources,
+                ingress_alb = True,
+                ingress_alb_scheme = AlbScheme.INTERNET_FACING
+            )
+            # Shows which manifests changed in the cloud assembly
+            manifest.node.add_metadata("content-hash", content_hash(resources))
+            added_charts.append(manifest)
+    return added_charts
+
+class KubernetesManifestsStack(Stack):
+    # Charts applied to an existing cluster through the kubectl provider of the cluster stack.
+    # Without a provider every stack importing the cluster deploys its own kubectl handler,
+    # VPC network interfaces included, before it can apply a single manifest.
+    def __init__(
+            self,
+            scope: Construct,
+            id: str,
+            cluster_name: str,
+            kubectl_provider: KubectlProviderAttributes,
+            charts: Mapping[str, Chart],
+            manifest_split: str = "chart",
+            **kwargs
+        ):
+
+        super().__init__(scope, id, **kwargs)
+
+        self.cluster = Cluster.from_cluster_attributes(
+            self,
+            "EKSCluster",
+            cluster_name = cluster_name,
+            kubectl_role_arn = kubectl_provider.kubectl_role_arn,
+            kubectl_provider = KubectlProvider.from_kubectl_provider_attributes(
+                self,
+                "KubectlProvider",
+                function_arn = kubectl_provider.function_arn,
+                kubectl_role_arn = kubectl_provider.kubectl_role_arn,
+                handler_role = Role.from_role_arn(self, "KubectlHandlerRole", kubectl_provider.handler_role_arn, mutable=False)
+            )
+        )
+
+        self.added_charts = add_charts(self, self.cluster, charts, manifest_split)
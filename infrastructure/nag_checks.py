@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import hashlib
+import json
+from importlib import metadata
+from pathlib import Path
+from aws_cdk import App, Aspects, Stack, Stage
+from aws_cdk.cx_api import CloudAssembly, SynthesisMessageLevel
+from cdk_nag import AwsSolutionsChecks
+
+# full: check every stack (pipeline default), cached: only stacks whose template changed, off: no checks
+NAG_MODES = ["full", "cached", "off"]
+
+def template_hash(template: dict) -> str:
+    # The nag version is part of the key so upgraded rules re-evaluate every stack.
+    # Suppressions live in the template metadata, so changing them changes the hash too.
+    digest = hashlib.sha256(metadata.version("cdk-nag").encode())
+    digest.update(json.dumps(template, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def nag_findings(assembly: CloudAssembly, stack: Stack) -> list:
+    return [
+        message for message in assembly.get_stack_artifact(stack.artifact_id).messages
+        if message.level in (SynthesisMessageLevel.ERROR, SynthesisMessageLevel.WARNING)
+        and str(message.entry.data).startswith("AwsSolutions-")
+    ]
+
+def synth_with_nag_checks(app: App, mode: str = "full", cache_file: str = ".nag-cache.json") -> CloudAssembly:
+    if mode not in NAG_MODES:
+        raise ValueError(f"Unknown nag mode {mode}, expected one of {', '.join(NAG_MODES)}")
+
+    if mode == "off":
+        return app.synth()
+
+    if mode == "full":
+        Aspects.of(app).add(AwsSolutionsChecks(verbose=True))
+        return app.synth()
+
+    # Stacks checked by an app level aspect, the ones of nested stages synthesize on their own
+    stacks = [
+        construct for construct in app.node.find_all()
+        if Stack.is_stack(construct) and not construct.nested and Stage.of(construct).node.path == app.node.path
+    ]
+
+    # First synth without checks to get the templates
+    assembly = app.synth()
+    hashes = {stack.node.path: template_hash(assembly.get_stack_artifact(stack.artifact_id).template) for stack in stacks}
+
+    cache_path = Path(cache_file)
+    cache = json.loads(cache_path.read_text(encoding="utf-8")) if cache_path.is_file() else {}
+
+    changed = [stack for stack in stacks if cache.get(stack.node.path) != hashes[stack.node.path]]
+    if not changed:
+        return assembly
+
+    for stack in changed:
+        Aspects.of(stack).add(AwsSolutionsChecks(verbose=True))
+    assembly = app.synth(force=True)
+
+    # Only stacks without findings are cached, the others are checked again on the next synth
+    for stack in changed:
+        if nag_findings(assembly, stack):
+            cache.pop(stack.node.path, None)
+        else:
+            cache[stack.node.path] = hashes[stack.node.path]
+    cache_path.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+
+    return assembly
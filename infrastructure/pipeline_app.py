@@ -0,0 +1,53 @@
+from typing import Mapping
+from aws_cdk import App, Environment
+from cdk_nag import NagSuppressions
+from .pipeline_stack import PipelineStack, SourceOptions, ChecksOptions, LoadTestOptions
+from .deploy_stage import DeploymentTarget
+
+def create_pipeline_stack(app: App, environ: Mapping[str, str]) -> PipelineStack:
+    # Construct tree of app.py, from the environment variables and the cdk.json context
+
+    # Optional post-deployment load test, e.g. "loadTest": {"rps": 50, "p95_ms": 300}
+    load_test = app.node.try_get_context("loadTest")
+
+    # Optional list of regions deployed in parallel behind latency-based DNS records,
+    # e.g. "deploymentTargets": [{"account": "111111111111", "region": "eu-west-1", "elb_account_id": "156460612806"}]
+    deployment_targets = [DeploymentTarget(**target) for target in app.node.try_get_context("deploymentTargets") or []]
+
+    pipeline_stack = PipelineStack(
+        app,
+        "cdk8s-samples-pipeline-stack",
+        env = Environment(
+            account = environ.get('ACCOUNT', None),
+            region = environ.get('REGION', None)
+        ),
+        app_name = app.node.try_get_context("appName"),
+        elb_account_id = environ.get('ELB_ACCOUNT_ID'),
+        certificate = environ.get('CERTIFICATE', None),
+        hosted_zone_id = environ.get('HOSTED_ZONE_ID', None),
+        hosted_zone_name = environ.get('HOSTED_ZONE_NAME', None),
+        record_name = environ.get('RECORD_NAME', None),
+        source = SourceOptions(
+            repo_string = environ.get('REPO_STRING', 'owner/repo'),
+            repo_branch = environ.get('REPO_BRANCH', 'main'),
+            connection_arn = environ.get('CONNECTION_ARN')
+        ),
+        checks = ChecksOptions(
+            gitleaks_version = app.node.try_get_context("gitleaksVersion"),
+            gitleaks_sha256 = app.node.try_get_context("gitleaksSha256"),
+            unit_test_shards = app.node.try_get_context("unitTestShards"),
+            load_test = LoadTestOptions(**load_test) if load_test is not None else None
+        ),
+        deployment_targets = deployment_targets
+    )
+
+    NagSuppressions.add_stack_suppressions(
+        pipeline_stack,
+        [
+            {
+                "id": "AwsSolutions-CB4",
+                "reason": "This is a demo, not production code. KMS for Codebuild is not needed"
+            }
+        ]
+    )
+    return pipeline_stack
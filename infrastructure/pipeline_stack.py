@@ -1,19 +1,97 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping, Sequence
 from constructs import Construct
-from aws_cdk import Stack
+from aws_cdk import Stack, Duration, RemovalPolicy, Environment
 from aws_cdk.pipelines import (
     CodePipeline,
     CodePipelineSource,
     ShellStep,
-    CodeBuildStep
+    CodeBuildStep,
+    CodeBuildOptions
 )
 from aws_cdk.aws_codebuild import (
     BuildEnvironment,
     LinuxBuildImage,
-    ComputeType
+    ComputeType,
+    Cache
 )
 from aws_cdk.aws_codebuild import BuildSpec
+from aws_cdk.aws_s3 import Bucket, BlockPublicAccess, BucketEncryption, LifecycleRule
 from cdk_nag import NagSuppressions
-from .deploy_stage import DeployStage
+from .deploy_stage import DeployStage, DeploymentTarget
+
+# Paths are relative to the repository root, whatever the working directory
+ROOT = Path(__file__).parent.parent
+
+# Files whose content determines the installed dependencies
+DEPENDENCY_FILES = ["requirements.txt", "requirements-dev.txt"]
+
+# pip and npm download caches on the CodeBuild standard images, plus the gitleaks release archives
+GITLEAKS_CACHE_DIR = "/root/.cache/gitleaks"
+DEPENDENCY_CACHE_PATHS = ["/root/.cache/pip/**/*", "/root/.npm/**/*", f"{GITLEAKS_CACHE_DIR}/**/*"]
+
+def dependency_hash(paths: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update((ROOT / path).read_bytes())
+    return digest.hexdigest()[:16]
+
+def split_unit_tests(count: int) -> list:
+    # Round-robin split of the test modules, never more shards than modules
+    test_files = sorted(path.relative_to(ROOT).as_posix() for path in (ROOT / "tests").rglob("test_*.py"))
+    count = max(1, min(count, len(test_files)))
+    return [test_files[index::count] for index in range(count)]
+
+@dataclass(frozen=True)
+class LoadTestOptions:
+    # Constant request rate against the ApplicationEndpoint output once the DEV stage is deployed
+    rps: float = 20
+    duration_seconds: int = 60
+    concurrency: int = 10
+    # Time left to the ALB controller to provision the load balancer after the deployment
+    ready_timeout_seconds: int = 600
+    # The step fails when any of the set SLOs is breached
+    p50_ms: float = None
+    p95_ms: float = None
+    p99_ms: float = 1000
+    max_error_rate: float = 0.01
+
+    def command(self, report_file: str) -> str:
+        slos = {
+            "--p50-ms": self.p50_ms,
+            "--p95-ms": self.p95_ms,
+            "--p99-ms": self.p99_ms,
+            "--max-error-rate": self.max_error_rate
+        }
+        return " ".join(
+            [
+                'python3 -m tools.http_load_test --url "$APPLICATION_ENDPOINT"',
+                f"--rps {self.rps:g} --duration {self.duration_seconds} --concurrency {self.concurrency}",
+                f"--ready-timeout {self.ready_timeout_seconds}",
+                *[f"{flag} {value:g}" for flag, value in slos.items() if value is not None],
+                f"--output {report_file}"
+            ]
+        )
+
+@dataclass(frozen=True)
+class SourceOptions:
+    # GitHub repository, e.g. owner/repo, read through a CodeStar connection
+    repo_string: str
+    connection_arn: str
+    repo_branch: str = "main"
+
+@dataclass(frozen=True)
+class ChecksOptions:
+    # S3 cache of the pip, npm and gitleaks downloads shared by the CodeBuild projects
+    dependency_cache: bool = True
+    gitleaks_version: str = "8.18.1"
+    gitleaks_sha256: str = None
+    unit_test_shards: int = 1
+    # Post-deployment load test of every DEV stage, none by default
+    load_test: LoadTestOptions = None
 
 class PipelineStack(Stack):
     def __init__(
@@ -26,77 +104,147 @@ class PipelineStack(Stack):
             hosted_zone_id: str,
             hosted_zone_name: str,
             record_name: str,
-            repo_string: str,
-            connection_arn: str,
-            repo_branch: str,
+            source: SourceOptions,
+            checks: ChecksOptions = None,
+            deployment_targets: Sequence[DeploymentTarget] = None,
             **kwargs
         ):
         super().__init__(scope, id, **kwargs)
 
-        cdk_install_commands =  [
-            "npm install -g aws-cdk",
+        checks = checks or ChecksOptions()
+        # The archive is only trusted through a checksum pinned in the repository, not one downloaded next to it.
+        # Without one the stack still synthesizes, but the GitLeaks step fails before downloading anything.
+        if checks.gitleaks_sha256 and not re.fullmatch("[0-9a-f]{64}", checks.gitleaks_sha256):
+            raise ValueError(f"gitleaksSha256 must be the hex SHA-256 of gitleaks_{checks.gitleaks_version}_linux_x64.tar.gz")
+
+        regions = [target.region for target in deployment_targets or []]
+        if len(regions) != len(set(regions)):
+            raise ValueError("Deployment targets must be in different regions, each region gets one latency record")
+        # Every region writes its latency record in the hosted zone, which belongs to a single account
+        if hosted_zone_id is not None and len({target.account for target in deployment_targets or []}) > 1:
+            raise ValueError("With a hosted zone, every deployment target must be in the account of the hosted zone")
+        cross_account = any(target.account != self.account for target in deployment_targets or [])
+
+        self.app_name = app_name
+        self.cdk_install_commands =  [
+            "npm install -g aws-cdk --prefer-offline",
             "pip3 install -r requirements.txt",
             "pip3 install -r requirements-dev.txt"
         ]
 
-        source_stage = CodePipelineSource.connection(
-            repo_string = repo_string,
-            branch = repo_branch,
-            connection_arn = connection_arn,
-            action_name = "Github_Source",
-            code_build_clone_output = True
-        )
+        self.source_stage = self.source_step(source)
 
-        environment = BuildEnvironment(
+        self.build_environment = BuildEnvironment(
             build_image = LinuxBuildImage.STANDARD_7_0,
             compute_type = ComputeType.SMALL
         )
 
         pylint_step = CodeBuildStep(
             "Linter",
-            input = source_stage,
-            build_environment = environment,
+            input = self.source_stage,
+            build_environment = self.build_environment,
             project_name = f"{app_name}-pipeline-linter",
-            install_commands = cdk_install_commands,
+            install_commands = self.cdk_install_commands,
             commands = [
                 "find . -name '*.py' ! -path './cdk.out/*' ! -path './node_modules/*' | xargs pylint"
             ]
         )
+        pytest_steps = self.unit_test_steps(checks.unit_test_shards)
 
-        pytest_step = CodeBuildStep(
-            "UnitTests",
-            input = source_stage,
-            build_environment = environment,
-            project_name = f"{app_name}-pipeline-unit-tests",
-            install_commands = cdk_install_commands,
-            commands = [
-                "coverage erase && python3 -m coverage run --branch -m pytest -v && coverage report",
-                "python3 -m coverage xml -i -o test-results/coverage.xml",
-                "python3 -m pytest --junitxml=test-results/results.xml"
-            ],
-            partial_build_spec = BuildSpec.from_object({
-                "reports": {
-                    "unit_tests_reports": {
-                        "files": "results.xml",
-                        "base-directory": "test-results",
-                        "file-format": "JUNITXML"
-                    },
-                    "coverage_reports": {
-                        "files": "coverage.xml",
-                        "base-directory": "test-results",
-                        "file-format": "COBERTURAXML"
-                    }
-                }
-            })
+        cache_bucket = self.add_dependency_cache_bucket() if checks.dependency_cache else None
+
+        pipeline = CodePipeline(
+            self,
+            "Pipeline",
+            pipeline_name = f"{app_name}-pipeline",
+            self_mutation = True,
+            # Targets in other accounts need a KMS key on the artifacts bucket
+            cross_account_keys = cross_account,
+            enable_key_rotation = cross_account,
+            code_build_defaults = self.code_build_defaults(cache_bucket),
+            synth = self.synth_step(elb_account_id, certificate, hosted_zone_id, hosted_zone_name, record_name, source)
+        )
+
+        safety_step, bandit_step, git_leaks_step = self.security_steps(checks.gitleaks_version, checks.gitleaks_sha256)
+
+        # A single DEV stage in the pipeline account and region, or a wave deploying every target region in parallel
+        # behind latency-based DNS records
+        if deployment_targets:
+            dev_stages = {
+                f"-{target.region}": DeployStage(
+                    self,
+                    f"DEV-{target.region}",
+                    env = Environment(
+                        account = target.account,
+                        region = target.region
+                    ),
+                    app_name = app_name,
+                    elb_account_id = target.elb_account_id,
+                    certificate = target.certificate,
+                    hosted_zone_id =  hosted_zone_id,
+                    hosted_zone_name = hosted_zone_name,
+                    record_name = record_name,
+                    latency_routing = True
+                )
+                for target in deployment_targets
+            }
+        else:
+            dev_stages = {
+                "": DeployStage(
+                    self,
+                    'DEV',
+                    app_name = app_name,
+                    elb_account_id = elb_account_id,
+                    certificate = certificate,
+                    hosted_zone_id =  hosted_zone_id,
+                    hosted_zone_name = hosted_zone_name,
+                    record_name = record_name
+                )
+            }
+
+        # Load the deployed application and fail the stage when the latency or error rate SLOs are breached
+        post_steps = {
+            suffix: [self.load_test_step(suffix, dev_stage, checks.load_test)] if checks.load_test is not None else []
+            for suffix, dev_stage in dev_stages.items()
+        }
+
+        self.add_waves(pipeline, dev_stages, [safety_step, bandit_step, git_leaks_step, pylint_step, *pytest_steps], post_steps, bool(deployment_targets))
+
+        # Force the pipeline construct creation forward before applying suppressions.
+        pipeline.build_pipeline()
+
+        self.add_suppressions(
+            pipeline,
+            cache_bucket,
+            [
+                git_leaks_step.project,
+                bandit_step.project,
+                *[step.project for step in pytest_steps],
+                *[step.project for steps in post_steps.values() for step in steps],
+                pylint_step.project,
+                safety_step.project
+            ]
         )
 
+    def source_step(self, source: SourceOptions) -> CodePipelineSource:
+        # Full clone, gitleaks scans the history
+        return CodePipelineSource.connection(
+            repo_string = source.repo_string,
+            branch = source.repo_branch,
+            connection_arn = source.connection_arn,
+            action_name = "Github_Source",
+            code_build_clone_output = True
+        )
+
+    def synth_step(self, elb_account_id: str, certificate: str, hosted_zone_id: str, hosted_zone_name: str, record_name: str, source: SourceOptions) -> ShellStep:
+        # Same environment variables as a local synth of app.py
         env_vars = {
             "ACCOUNT" : self.account,
             "REGION": self.region,
             "ELB_ACCOUNT_ID": elb_account_id,
-            "CONNECTION_ARN": connection_arn,
-            "REPO_BRANCH": repo_branch,
-            "REPO_STRING": repo_string
+            "CONNECTION_ARN": source.connection_arn,
+            "REPO_BRANCH": source.repo_branch,
+            "REPO_STRING": source.repo_string
         }
 
         if hosted_zone_name is not None:
@@ -110,87 +258,204 @@ class PipelineStack(Stack):
 
         if certificate is not None:
             env_vars["CERTIFICATE"] = certificate
-        pipeline = CodePipeline(
-            self,
-            "Pipeline",
-            pipeline_name = f"{app_name}-pipeline",
-            self_mutation = True,
-            synth = ShellStep(
-                "Synth",
-                input = source_stage,
-                env = env_vars,
-                install_commands = cdk_install_commands,
+
+        # The full cdk-nag checks always run in the pipeline, whatever nag mode cdk.json sets for local synths
+        return ShellStep(
+            "Synth",
+            input = self.source_stage,
+            env = env_vars,
+            install_commands = self.cdk_install_commands,
+            commands = [
+                "cdk synth -c nag=full"
+            ]
+        )
+
+    def unit_test_steps(self, unit_test_shards: int) -> list:
+        # Unit tests run once under coverage and write both the JUnit and the Cobertura reports.
+        # With several shards each one runs a slice of the test modules in parallel and a last step merges the coverage.
+        unit_test_reports = {
+            "unit_tests_reports": {
+                "files": "results.xml",
+                "base-directory": "test-results",
+                "file-format": "JUNITXML"
+            }
+        }
+        coverage_reports = {
+            "coverage_reports": {
+                "files": "coverage.xml",
+                "base-directory": "test-results",
+                "file-format": "COBERTURAXML"
+            }
+        }
+        coverage_report_commands = [
+            "python3 -m coverage report",
+            "python3 -m coverage xml -i -o test-results/coverage.xml"
+        ]
+
+        shards = split_unit_tests(unit_test_shards)
+        if len(shards) == 1:
+            return [
+                CodeBuildStep(
+                    "UnitTests",
+                    input = self.source_stage,
+                    build_environment = self.build_environment,
+                    project_name = f"{self.app_name}-pipeline-unit-tests",
+                    install_commands = self.cdk_install_commands,
+                    commands = [
+                        "python3 -m coverage erase",
+                        "python3 -m coverage run --branch -m pytest -v --junitxml=test-results/results.xml"
+                    ] + coverage_report_commands,
+                    partial_build_spec = BuildSpec.from_object({
+                        "reports": {**unit_test_reports, **coverage_reports}
+                    })
+                )
+            ]
+
+        pytest_steps = [
+            CodeBuildStep(
+                f"UnitTests{index}",
+                input = self.source_stage,
+                build_environment = self.build_environment,
+                project_name = f"{self.app_name}-pipeline-unit-tests-{index}",
+                install_commands = self.cdk_install_commands,
+                env = {
+                    "COVERAGE_FILE": f"test-results/coverage.shard{index}"
+                },
                 commands = [
-                    "cdk synth"
-                ]
+                    f"python3 -m coverage run --branch -m pytest -v --junitxml=test-results/results.xml {' '.join(test_files)}"
+                ],
+                primary_output_directory = "test-results",
+                partial_build_spec = BuildSpec.from_object({
+                    "reports": unit_test_reports
+                })
+            )
+            for index, test_files in enumerate(shards, start=1)
+        ]
+        pytest_steps.append(
+            CodeBuildStep(
+                "UnitTestsCoverage",
+                input = self.source_stage,
+                additional_inputs = {
+                    f"shards/{index}": shard_step.primary_output
+                    for index, shard_step in enumerate(pytest_steps, start=1)
+                },
+                build_environment = self.build_environment,
+                project_name = f"{self.app_name}-pipeline-unit-tests-coverage",
+                install_commands = [
+                    "pip3 install -r requirements-dev.txt"
+                ],
+                commands = [
+                    "python3 -m coverage combine shards/*/coverage.shard*"
+                ] + coverage_report_commands,
+                partial_build_spec = BuildSpec.from_object({
+                    "reports": coverage_reports
+                })
             )
         )
+        return pytest_steps
+
+    def add_dependency_cache_bucket(self) -> Bucket:
+        return Bucket(
+            self,
+            "DependencyCacheBucket",
+            block_public_access=BlockPublicAccess.BLOCK_ALL,
+            encryption=BucketEncryption.S3_MANAGED,
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            enforce_ssl=True,
+            lifecycle_rules=[
+                LifecycleRule(expiration=Duration.days(30))
+            ]
+        )
+
+    def code_build_defaults(self, cache_bucket: Bucket = None) -> CodeBuildOptions:
+        # S3 cache of pip/npm downloads shared by every CodeBuild project in the pipeline.
+        # The prefix changes with the requirements files so a dependency bump starts a fresh cache.
+        if cache_bucket is None:
+            return None
+        return CodeBuildOptions(
+            cache = Cache.bucket(cache_bucket, prefix=f"dependencies/{dependency_hash(DEPENDENCY_FILES)}"),
+            partial_build_spec = BuildSpec.from_object({
+                "cache": {
+                    "paths": DEPENDENCY_CACHE_PATHS
+                }
+            })
+        )
 
+    def security_steps(self, gitleaks_version: str, gitleaks_sha256: str = None) -> list:
+        # Safety, Bandit and GitLeaks steps, in this order
         safety_step = CodeBuildStep(
             "Safety",
-            input = source_stage,
-            build_environment = environment,
-            project_name = f"{app_name}-pipeline-safety",
-            install_commands = cdk_install_commands,
+            input = self.source_stage,
+            build_environment = self.build_environment,
+            project_name = f"{self.app_name}-pipeline-safety",
+            install_commands = self.cdk_install_commands,
             commands = [
-                "find requirements*.txt -execdir safety check -r {} \;"
+                "find requirements*.txt -execdir safety check -r {} \\;"
             ]
         )
 
         bandit_step = CodeBuildStep(
             "Bandit",
-            input = source_stage,
-            build_environment = environment,
-            project_name = f"{app_name}-pipeline-bandit",
-            install_commands = cdk_install_commands,
+            input = self.source_stage,
+            build_environment = self.build_environment,
+            project_name = f"{self.app_name}-pipeline-bandit",
+            install_commands = self.cdk_install_commands,
             commands = [
                 "bandit -r ."
             ]
         )
 
+        # Pinned gitleaks release, downloaded once into the CodeBuild cache and checked against the pinned SHA-256
         git_leaks_step = CodeBuildStep(
             "GitLeaks",
-            input = source_stage,
-            build_environment = environment,
-            project_name = f"{app_name}-pipeline-git-leaks",
-            install_commands = cdk_install_commands,
+            input = self.source_stage,
+            build_environment = self.build_environment,
+            project_name = f"{self.app_name}-pipeline-git-leaks",
+            env = {
+                "GITLEAKS_VERSION": gitleaks_version,
+                "GITLEAKS_URL": f"https://github.com/gitleaks/gitleaks/releases/download/v{gitleaks_version}",
+                "GITLEAKS_ARCHIVE": f"gitleaks_{gitleaks_version}_linux_x64.tar.gz",
+                **({"GITLEAKS_SHA256": gitleaks_sha256} if gitleaks_sha256 else {})
+            },
             commands = [
-                "CURRENT_DIR=$(pwd)",
-                "CLONE_FOLDER=gitleaks",
-                "mkdir $CLONE_FOLDER",
-                "git clone --quiet https://github.com/gitleaks/gitleaks.git $CLONE_FOLDER",
-                "cd $CLONE_FOLDER",
-                "make build",
-                "chmod +x gitleaks",
-                "mv gitleaks /usr/local/bin/",
-                "cd $CURRENT_DIR && rm -rf $CLONE_FOLDER",
+                '[ -n "$GITLEAKS_SHA256" ] || { echo "Set gitleaksSha256 in cdk.json to the SHA-256 of $GITLEAKS_ARCHIVE"; exit 1; }',
+                f"mkdir -p {GITLEAKS_CACHE_DIR}",
+                f'[ -f {GITLEAKS_CACHE_DIR}/$GITLEAKS_ARCHIVE ] || curl -sSfL -o {GITLEAKS_CACHE_DIR}/$GITLEAKS_ARCHIVE "$GITLEAKS_URL/$GITLEAKS_ARCHIVE"',
+                f'echo "$GITLEAKS_SHA256  $GITLEAKS_ARCHIVE" | (cd {GITLEAKS_CACHE_DIR} && sha256sum -c -) || (rm -f {GITLEAKS_CACHE_DIR}/$GITLEAKS_ARCHIVE && exit 1)',
+                f"tar -xzf {GITLEAKS_CACHE_DIR}/$GITLEAKS_ARCHIVE -C /usr/local/bin gitleaks",
                 "gitleaks detect --source . -v"
             ]
         )
+        return [safety_step, bandit_step, git_leaks_step]
 
-        pipeline.add_stage(
-            DeployStage(
-                self,
-                'DEV',
-                app_name = app_name,
-                elb_account_id = elb_account_id,
-                certificate = certificate,
-                hosted_zone_id =  hosted_zone_id,
-                hosted_zone_name = hosted_zone_name,
-                record_name = record_name
-            ),
-            pre = [
-                safety_step,
-                bandit_step,
-                git_leaks_step,
-                pylint_step,
-                pytest_step
-            ]
+    def load_test_step(self, suffix: str, dev_stage: DeployStage, load_test: LoadTestOptions) -> CodeBuildStep:
+        return CodeBuildStep(
+            f"LoadTest{suffix}",
+            input = self.source_stage,
+            build_environment = self.build_environment,
+            project_name = f"{self.app_name}-pipeline-load-test{suffix}",
+            env_from_cfn_outputs = {
+                "APPLICATION_ENDPOINT": dev_stage.stack.application_endpoint
+            },
+            commands = [
+                "mkdir -p load-test-results",
+                load_test.command("load-test-results/report.json")
+            ],
+            primary_output_directory = "load-test-results",
+            timeout = Duration.seconds(load_test.ready_timeout_seconds + load_test.duration_seconds).plus(Duration.minutes(10))
         )
 
-        # Force the pipeline construct creation forward before applying suppressions.
-        pipeline.build_pipeline()
+    def add_waves(self, pipeline: CodePipeline, dev_stages: Mapping[str, DeployStage], pre_steps: list, post_steps: Mapping[str, list], wave: bool):
+        # The checks run before the deployment, the load tests after it
+        if wave:
+            dev_wave = pipeline.add_wave("DEV", pre=pre_steps)
+            for suffix, dev_stage in dev_stages.items():
+                dev_wave.add_stage(dev_stage, post=post_steps[suffix])
+        else:
+            pipeline.add_stage(dev_stages[""], pre=pre_steps, post=post_steps[""])
 
+    def add_suppressions(self, pipeline: CodePipeline, cache_bucket: Bucket, projects: list):
         # CDK-NAG supressions
         NagSuppressions.add_resource_suppressions_by_path(
             self,
@@ -218,15 +483,31 @@ class PipelineStack(Stack):
                 ]
             )
 
+        # Artifact buckets of the support stacks CDK creates for the other regions
+        for support in pipeline.pipeline.cross_region_support.values():
+            NagSuppressions.add_resource_suppressions(
+                support.replication_bucket,
+                [
+                    {
+                        "id": "AwsSolutions-S1",
+                        "reason": "S3 bucket automatically created by CDK, I have no control on it on the configuration"
+                    }
+                ]
+            )
+
+        if cache_bucket is not None:
+            NagSuppressions.add_resource_suppressions(
+                cache_bucket,
+                [
+                    {
+                        "id": "AwsSolutions-S1",
+                        "reason": "The bucket only holds pip and npm download caches, access logs are not needed"
+                    }
+                ]
+            )
 
         NagSuppressions.add_resource_suppressions(
-            [
-                git_leaks_step.project,
-                bandit_step.project,
-                pytest_step.project,
-                pylint_step.project,
-                safety_step.project
-            ],
+            projects,
             [
                 {
                     "id": "AwsSolutions-IAM5",
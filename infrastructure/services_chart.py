@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+import yaml
+from constructs import Construct
+from cdk8s import Chart, ApiObjectMetadata, Size
+from cdk8s_plus_27 import (
+    ServicePort,
+    ServiceType,
+    Protocol,
+    Ingress,
+    IngressBackend,
+    PercentOrAbsolute
+)
+from .app_chart import (
+    AutoscalingOptions,
+    HttpProbeOptions,
+    GracefulShutdownOptions,
+    PodDisruptionBudgetOptions,
+    ZoneSpreadOptions,
+    WorkloadOptions,
+    add_workload,
+    alb_annotations
+)
+
+# The default quota is 100 listener rules per ALB, including the default rule. Services beyond this count
+# go to another ingress and ALB.
+RULES_PER_LOAD_BALANCER = 90
+
+def percent_or_absolute(value) -> PercentOrAbsolute:
+    # "25%" or a number of pods
+    if value is None:
+        return None
+    if isinstance(value, str) and value.endswith("%"):
+        return PercentOrAbsolute.percent(int(value[:-1]))
+    return PercentOrAbsolute.absolute(int(value))
+
+@dataclass(frozen=True)
+class ServiceSpec:
+    name: str
+    image: str
+    # Container port, the service listens on service_port
+    port: int = 8080
+    service_port: int = 80
+    cpu_request: float = 0.25
+    cpu_limit: float = 1
+    memory_request_mib: int = None
+    memory_limit_mib: int = None
+    # Fixed replicas or autoscaling, not both
+    replicas: int = None
+    autoscaling: AutoscalingOptions = None
+    # Same options as the AppChart workload
+    readiness_probe: HttpProbeOptions = None
+    liveness_probe: HttpProbeOptions = None
+    graceful_shutdown: GracefulShutdownOptions = None
+    pod_disruption_budget: PodDisruptionBudgetOptions = None
+    zone_spread: ZoneSpreadOptions = None
+    # Ingress rule, /<name> by default
+    path: str = None
+    host: str = None
+
+    def __post_init__(self):
+        try:
+            self.workload()
+        except ValueError as error:
+            raise ValueError(f"Service {self.name}: {error}") from error
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "ServiceSpec":
+        # Nested objects of a JSON or YAML spec, rolling update and disruption bounds as "25%" or a number of pods
+        options = {
+            "autoscaling": lambda value: AutoscalingOptions(**value),
+            "readiness_probe": lambda value: HttpProbeOptions(**value),
+            "liveness_probe": lambda value: HttpProbeOptions(**value),
+            "graceful_shutdown": lambda value: GracefulShutdownOptions(**{
+                **value,
+                "max_surge": percent_or_absolute(value.get("max_surge")),
+                "max_unavailable": percent_or_absolute(value.get("max_unavailable"))
+            }),
+            "pod_disruption_budget": lambda value: PodDisruptionBudgetOptions(
+                min_available = percent_or_absolute(value.get("min_available")),
+                max_unavailable = percent_or_absolute(value.get("max_unavailable"))
+            ),
+            "zone_spread": lambda value: ZoneSpreadOptions(**value)
+        }
+        try:
+            parsed = {key: parse(values[key]) for key, parse in options.items() if values.get(key) is not None}
+        except ValueError as error:
+            raise ValueError(f"Service {values.get('name')}: {error}") from error
+        return cls(**{**values, **parsed})
+
+    def workload(self) -> WorkloadOptions:
+        return WorkloadOptions(
+            replicas = self.replicas,
+            autoscaling = self.autoscaling,
+            cpu_request = self.cpu_request,
+            cpu_limit = self.cpu_limit,
+            memory_request = Size.mebibytes(self.memory_request_mib) if self.memory_request_mib is not None else None,
+            memory_limit = Size.mebibytes(self.memory_limit_mib) if self.memory_limit_mib is not None else None,
+            readiness_probe = self.readiness_probe,
+            liveness_probe = self.liveness_probe,
+            graceful_shutdown = self.graceful_shutdown,
+            pod_disruption_budget = self.pod_disruption_budget,
+            zone_spread = self.zone_spread
+        )
+
+def load_service_specs(path: str) -> list:
+    # JSON or YAML: a list of services or an object with a "services" list
+    text = Path(path).read_text(encoding="utf-8")
+    if Path(path).suffix in (".yaml", ".yml"):
+        document = yaml.safe_load(text)
+    else:
+        document = json.loads(text)
+    if isinstance(document, dict):
+        document = document["services"]
+
+    specs = [ServiceSpec.from_dict(values) for values in document]
+    names = [spec.name for spec in specs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate service names: {', '.join(duplicates)}")
+    return specs
+
+class ServicesChart(Chart):
+    # Every service of the spec in one chart: a deployment, a service and optionally an autoscaler and a
+    # disruption budget each, exposed through the rules of an ingress and ALB per rules_per_load_balancer services
+    def __init__(
+            self,
+            scope: Construct,
+            id: str,
+            namespace: str,
+            alb_access_logs_bucket_name: str,
+            services: Sequence[ServiceSpec],
+            certificate: str = None,
+            load_balancer_name: str = "services-alb",
+            rules_per_load_balancer: int = RULES_PER_LOAD_BALANCER
+        ):
+        super().__init__(scope, id)
+
+        # The first ingress keeps its unsuffixed names, later ones are numbered from 2
+        self.ingresses = []
+        for index in range(max(1, math.ceil(len(services) / rules_per_load_balancer))):
+            suffix = f"-{index + 1}" if index else ""
+            self.ingresses.append(Ingress(
+                self,
+                f"ServicesIngress{index + 1}" if index else "ServicesIngress",
+                metadata = ApiObjectMetadata(
+                    name = f"services-ingress{suffix}",
+                    namespace = namespace,
+                    annotations = alb_annotations(f"{load_balancer_name}{suffix}", alb_access_logs_bucket_name, certificate=certificate)
+                )
+            ))
+        self.ingress = self.ingresses[0]
+
+        self.deployments = {}
+        self.services = {}
+        for index, spec in enumerate(services):
+            workload = spec.workload()
+            deployment = add_workload(
+                self,
+                namespace,
+                workload.container(spec.name, spec.image, spec.port),
+                workload,
+                resource_id = lambda kind, name=spec.name: f"{name}-{kind}",
+                resource_name = lambda kind, name=spec.name: f"{name}-{kind}"
+            ).deployment
+
+            service = deployment.expose_via_service(
+                name = f"{spec.name}-service",
+                ports = [
+                    ServicePort(
+                        protocol = Protocol.TCP,
+                        target_port = spec.port,
+                        port = spec.service_port
+                    )
+                ],
+                service_type = ServiceType.NODE_PORT
+            )
+
+            # The services share the ingress, their target group health checks and deregistration delay
+            # are set on each service and override the ingress annotations
+            if spec.readiness_probe is not None:
+                for key, value in spec.readiness_probe.health_check_annotations().items():
+                    service.metadata.add_annotation(key, value)
+            if spec.graceful_shutdown is not None:
+                service.metadata.add_annotation(
+                    "alb.ingress.kubernetes.io/target-group-attributes",
+                    f"deregistration_delay.timeout_seconds={spec.graceful_shutdown.drain()}"
+                )
+
+            # Rules are evaluated in the order of the spec
+            path = spec.path or f"/{spec.name}"
+            ingress = self.ingresses[index // rules_per_load_balancer]
+            if spec.host is not None:
+                ingress.add_host_rule(spec.host, path, IngressBackend.from_service(service))
+            else:
+                ingress.add_rule(path, IngressBackend.from_service(service))
+
+            self.deployments[spec.name] = deployment
+            self.services[spec.name] = service
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from pathlib import Path
+from cdk8s import App, YamlOutputType
+from infrastructure.charts import apps_options, create_charts
+
+# Synthesizes only the cdk8s charts, without aws_cdk, to iterate on them quickly. The charts are the ones the
+# cluster stack deploys for the cdk.json context: canary, additional apps and services spec.
+# Values come from an optional JSON config file, overridden by the flags.
+parser = argparse.ArgumentParser(description="Synthesize the Kubernetes manifests of the application to a folder")
+parser.add_argument("--config", help="JSON file with namespace, alb_access_logs_bucket_name and certificate values")
+parser.add_argument("--namespace", help="Namespace of the application resources (default: default)")
+parser.add_argument("--bucket-name", dest="alb_access_logs_bucket_name", help="Bucket receiving the ALB access logs")
+parser.add_argument("--certificate", help="ACM certificate ARN, enables the HTTPS listener")
+parser.add_argument("--context", default="cdk.json", help="CDK config file whose context lists the charts (default: cdk.json)")
+parser.add_argument("--output", default="dist", help="Folder for the synthesized manifests, one subfolder per chart (default: dist)")
+parser.add_argument("--file-per-resource", action="store_true", help="Write one file per resource instead of one per chart")
+args = parser.parse_args()
+
+config = {
+    "namespace": "default",
+    "alb_access_logs_bucket_name": "alb-access-logs-bucket"
+}
+if args.config is not None:
+    with open(args.config, encoding="utf-8") as config_file:
+        config.update(json.load(config_file))
+for key in ["namespace", "alb_access_logs_bucket_name", "certificate"]:
+    if getattr(args, key) is not None:
+        config[key] = getattr(args, key)
+
+with open(args.context, encoding="utf-8") as context_file:
+    context = json.load(context_file).get("context", {})
+
+def new_app(chart_id: str) -> App:
+    # The application charts all have the AppChart id, each one is written to its own folder
+    return App(
+        outdir = str(Path(args.output) / chart_id),
+        yaml_output_type = YamlOutputType.FILE_PER_RESOURCE if args.file_per_resource else YamlOutputType.FILE_PER_CHART
+    )
+
+charts = create_charts(apps_options(context.get), new_app=new_app, **config)
+for chart in charts.values():
+    App.of(chart).synth()
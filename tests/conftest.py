@@ -0,0 +1,126 @@
+import dataclasses
+import hashlib
+import json
+import re
+from importlib import metadata
+from pathlib import Path
+from typing import NamedTuple
+import cdk8s
+import pytest
+from cdk8s_plus_27 import PercentOrAbsolute
+from aws_cdk import App, Environment
+from aws_cdk.assertions import Template, Annotations, Match
+from infrastructure.app_chart import AppChart
+from infrastructure.cluster_stack import KubernetesClusterStack
+
+ROOT = Path(__file__).parent.parent
+
+class SynthesizedStack(NamedTuple):
+    template: Template
+    # Annotation messages by level: info, warning and error
+    messages: dict
+
+class SynthesizedChart(NamedTuple):
+    chart: AppChart
+    manifests: list
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--synth-cache",
+        action = "store_true",
+        help = "Reuse the stack templates of a previous run when the infrastructure code and installed dependencies did not change"
+    )
+
+def source_fingerprint() -> str:
+    # Infrastructure sources plus the installed version of every pinned dependency
+    digest = hashlib.sha256()
+    for path in sorted((ROOT / "infrastructure").rglob("*.py")):
+        digest.update(path.read_bytes())
+    for requirement in (ROOT / "requirements.txt").read_text().splitlines():
+        name = re.split("[=<>~! ]", requirement.strip())[0]
+        if name:
+            digest.update(f"{name}=={metadata.version(name)}".encode())
+    return digest.hexdigest()
+
+# Value of the jsii parameter types, which have no usable repr
+JSII_KEYS = {
+    cdk8s.Size: lambda size: size.to_kibibytes(),
+    cdk8s.Duration: lambda duration: duration.to_milliseconds(),
+    PercentOrAbsolute: lambda value: value.value
+}
+
+def key_value(value):
+    # Value-level form of a parameter. Object reprs carry memory addresses, which get reused,
+    # so two different parameter sets could share a key.
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [key_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): key_value(item) for key, item in value.items()}
+    if dataclasses.is_dataclass(value):
+        fields = {field.name: key_value(getattr(value, field.name)) for field in dataclasses.fields(value)}
+        return {"type": type(value).__qualname__, "fields": fields}
+    for jsii_type, jsii_value in JSII_KEYS.items():
+        if isinstance(value, jsii_type):
+            return {"type": jsii_type.__name__, "value": jsii_value(value)}
+    raise TypeError(f"No cache key for {type(value).__qualname__} parameters, synthesize it without the fixture")
+
+def params_key(*params) -> str:
+    return hashlib.sha256(json.dumps(key_value(params), sort_keys=True).encode()).hexdigest()
+
+@pytest.fixture(scope="session")
+def synth_cluster_stack(request):
+    # Synthesizes each distinct KubernetesClusterStack parameter set once per session
+    synthesized = {}
+    disk_cache = request.config.cache if request.config.getoption("synth_cache") else None
+    fingerprint = source_fingerprint() if disk_cache is not None else None
+
+    def synth(context: dict, account: str, region: str, stack_id: str, **stack_params) -> SynthesizedStack:
+        key = params_key(context, account, region, stack_id, stack_params)
+        if key in synthesized:
+            return synthesized[key]
+
+        cached = disk_cache.get(f"synth/{key}", None) if disk_cache is not None else None
+        if cached is not None and cached["fingerprint"] == fingerprint:
+            synthesized[key] = SynthesizedStack(Template.from_json(cached["template"]), cached["messages"])
+            return synthesized[key]
+
+        stack = KubernetesClusterStack(
+            App(context=context),
+            stack_id,
+            env = Environment(
+                account = account,
+                region = region
+            ),
+            **stack_params
+        )
+        template = Template.from_stack(stack)
+        annotations = Annotations.from_stack(stack)
+        messages = {
+            "info": [message.entry.data for message in annotations.find_info("*", Match.any_value())],
+            "warning": [message.entry.data for message in annotations.find_warning("*", Match.any_value())],
+            "error": [message.entry.data for message in annotations.find_error("*", Match.any_value())]
+        }
+        synthesized[key] = SynthesizedStack(template, messages)
+
+        if disk_cache is not None:
+            disk_cache.set(f"synth/{key}", {"fingerprint": fingerprint, "template": template.to_json(), "messages": messages})
+        return synthesized[key]
+
+    return synth
+
+@pytest.fixture(scope="session")
+def synth_app_chart():
+    # Synthesizes each distinct AppChart parameter set once per session
+    synthesized = {}
+
+    def synth(chart_id: str = "cdk8s-test", **chart_params) -> SynthesizedChart:
+        key = params_key(chart_id, chart_params)
+        if key not in synthesized:
+            app = cdk8s.Testing.app(yaml_output_type=cdk8s.YamlOutputType.FOLDER_PER_CHART_FILE_PER_RESOURCE)
+            chart = AppChart(app, chart_id, **chart_params)
+            synthesized[key] = SynthesizedChart(chart, cdk8s.Testing.synth(chart))
+        return synthesized[key]
+
+    return synth
@@ -0,0 +1,22 @@
+# Test data shared by several test modules
+
+DIGEST = "sha256:" + "a" * 64
+
+class StubRegistryClient: # pylint: disable=too-few-public-methods
+    # Registry client resolving every tag to DIGEST, without network calls
+    def __init__(self):
+        self.lookups = []
+
+    def digest(self, registry, repository, tag):
+        self.lookups.append(f"{registry}/{repository}:{tag}")
+        return DIGEST
+
+def log_line(path, target, target_seconds, status="200"):
+    # ALB access log entry
+    return (
+        f"http 2024-01-31T10:00:00.000000Z app/my-service-alb/50dc6c495c0c9188 192.168.131.39:2817 {target} "
+        f'0.001 {target_seconds} 0.000 {status} {status} 34 366 "GET http://example.com:80{path}?id=1 HTTP/1.1" '
+        '"curl/7.46.0" - - arn:aws:elasticloadbalancing:us-east-1:123456789012:targetgroup/my-targets/73e2d6bc24d8a067 '
+        '"Root=1-58337262-36d228ad5d99923122bbe354" "-" "-" 0 2024-01-31T09:59:59.999000Z "forward" "-" "-" '
+        f'"{target}" "{status}" "-" "-"\n'
+    )
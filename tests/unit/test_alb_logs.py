@@ -0,0 +1,76 @@
+import gzip
+import io
+from tools.alb_logs import LocalSource, S3Source, parse_record, analyze, report, counter_percentile
+from tests.unit.helpers import log_line
+
+LOGS = {
+    "2024/01/31/first.log.gz": [log_line("/", "10.0.1.5:8080", latency / 1000) for latency in range(1, 101)],
+    "2024/01/31/second.log.gz": [
+        log_line("/slow", "10.0.2.7:8080", 2.5, "504"),
+        log_line("/", "-", -1, "503"),
+        "not an alb log line\n"
+    ]
+}
+
+def gzipped(lines):
+    return gzip.compress("".join(lines).encode())
+
+class StandInS3Client:
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None): # pylint: disable=invalid-name
+        assert Bucket == "logs-bucket"
+        keys = [key for key in sorted(LOGS) if key.startswith(Prefix)]
+        # One key per page to go through the pagination
+        index = int(ContinuationToken or 0)
+        return {
+            "Contents": [{"Key": keys[index]}],
+            "IsTruncated": index + 1 < len(keys),
+            "NextContinuationToken": str(index + 1)
+        }
+
+    def get_object(self, Bucket, Key): # pylint: disable=invalid-name
+        assert Bucket == "logs-bucket"
+        return {"Body": io.BytesIO(gzipped(LOGS[Key]))}
+
+def stand_in_client(endpoint_url):
+    assert endpoint_url == "http://localhost:9000"
+    return StandInS3Client()
+
+def check_report(results):
+    assert results["objects"] == 2
+    assert results["requests"] == 102
+    assert results["status"] == {"200": 100, "503": 1, "504": 1}
+    assert results["paths"]["/"]["requests"] == 101
+    assert results["paths"]["/"]["target_processing_ms"] == {"p50": 50, "p95": 95, "p99": 99, "max": 100}
+    assert results["paths"]["/"]["request_processing_ms"] == {"p50": 1, "p95": 1, "p99": 1, "max": 1}
+    assert results["paths"]["/slow"]["status"] == {"504": 1}
+    assert results["targets"]["10.0.2.7:8080"]["target_processing_ms"]["p99"] == 2500
+    # The rejected request has no target processing time
+    assert results["targets"]["-"]["target_processing_ms"] == {}
+    assert [slow["total_ms"] for slow in results["slowest"]] == [2501, 101, 100]
+    assert results["slowest"][0]["path"] == "/slow"
+
+def test_parse_record():
+    record = parse_record(log_line("/hello", "10.0.1.5:8080", 0.12))
+    assert record == {
+        "time": "2024-01-31T10:00:00.000000Z",
+        "target": "10.0.1.5:8080",
+        "request_processing_ms": 1,
+        "target_processing_ms": 120,
+        "response_processing_ms": 0,
+        "elb_status": "200",
+        "target_status": "200",
+        "path": "/hello"
+    }
+    assert parse_record("garbage") is None
+    assert counter_percentile({5: 1}, 0.99) == 5
+
+def test_local_directory(tmp_path):
+    for key, lines in LOGS.items():
+        (tmp_path / key).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / key).write_bytes(gzipped(lines))
+    check_report(report(analyze(LocalSource(tmp_path), workers=2, top=3)))
+
+def test_s3_compatible_source():
+    source = S3Source("logs-bucket", "2024/01/", "http://localhost:9000", client_factory=stand_in_client)
+    assert source.keys() == sorted(LOGS)
+    check_report(report(analyze(source, workers=2, top=3)))
@@ -1,23 +1,36 @@
+import json
 import cdk8s
-from infrastructure.app_chart import AppChart
-
-app = cdk8s.Testing.app(yaml_output_type=cdk8s.YamlOutputType.FOLDER_PER_CHART_FILE_PER_RESOURCE)
+import pytest
+from cdk8s import Duration, Size
+from cdk8s_plus_27 import ScalingRules, ScalingPolicy, Replicas, PercentOrAbsolute
+from infrastructure.app_chart import (
+    AppChart,
+    AutoscalingOptions,
+    HttpProbeOptions,
+    AlbPerformanceProfile,
+    GracefulShutdownOptions,
+    PodDisruptionBudgetOptions,
+    ZoneSpreadOptions,
+    WorkloadOptions,
+    CanaryOptions,
+    IngressGroupOptions
+)
 
 NAMESPACE = "default"
 LOGS_BUCKET = "mock-bucket"
 MOCK_ACM_ARN = "mock-arn"
 
-chart = AppChart(
-    app,
-    "cdk8s-test",
-    namespace = NAMESPACE,
-    alb_access_logs_bucket_name = LOGS_BUCKET,
-    certificate = MOCK_ACM_ARN
-)
-
-synth = cdk8s.Testing.synth(chart)
+@pytest.fixture
+def https_chart(synth_app_chart):
+    return synth_app_chart(
+        "cdk8s-test",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        certificate = MOCK_ACM_ARN
+    )
 
-def test_deployment():
+def test_deployment(https_chart):
+    chart, synth = https_chart
     deployment_synth = synth[0]
     expected_deployment =  {
         "apiVersion": "apps/v1",
@@ -95,7 +108,8 @@ def test_deployment():
 
     assert deployment_synth == expected_deployment
 
-def test_service():
+def test_service(https_chart):
+    chart, synth = https_chart
     service_synth = synth[1]
     expected_service = {
         "apiVersion": "v1",
@@ -119,7 +133,8 @@ def test_service():
     }
     assert service_synth == expected_service
 
-def test_ingress_https():
+def test_ingress_https(https_chart):
+    chart, synth = https_chart
     ingress_synth = synth[2]
     expected_ingress = {
         "apiVersion": "networking.k8s.io/v1",
@@ -161,14 +176,11 @@ def test_ingress_https():
     }
     assert ingress_synth == expected_ingress
 
-def test_ingress_http():
-    synth = cdk8s.Testing.synth(
-        AppChart(
-            app,
-            "cdk8s-test-2",
-            namespace = NAMESPACE,
-            alb_access_logs_bucket_name = LOGS_BUCKET
-        )
+def test_ingress_http(synth_app_chart):
+    chart, synth = synth_app_chart(
+        "cdk8s-test-2",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET
     )
     ingress_synth = synth[2]
     expected_ingress = {
@@ -206,3 +218,443 @@ def test_ingress_http():
         }
     }
     assert ingress_synth == expected_ingress
+
+def test_fixed_replicas(synth_app_chart):
+    synth = synth_app_chart(
+        "cdk8s-test-replicas",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(replicas = 4)
+    ).manifests
+    assert synth[0]["spec"]["replicas"] == 4
+    assert "HorizontalPodAutoscaler" not in [manifest["kind"] for manifest in synth]
+
+def test_autoscaling():
+    # Scaling rules have no value-level cache key, the chart is synthesized without the fixture
+    chart = AppChart(
+        cdk8s.Testing.app(),
+        "cdk8s-test-hpa",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(
+            autoscaling = AutoscalingOptions(
+                min_replicas = 3,
+                max_replicas = 12,
+                cpu_target_utilization = 60,
+                memory_target_utilization = 75,
+                scale_up = ScalingRules(
+                    stabilization_window = Duration.seconds(0),
+                    policies = [
+                        ScalingPolicy(replicas = Replicas.percent(100), duration = Duration.seconds(15))
+                    ]
+                ),
+                scale_down = ScalingRules(
+                    stabilization_window = Duration.minutes(5),
+                    policies = [
+                        ScalingPolicy(replicas = Replicas.absolute(1), duration = Duration.minutes(1))
+                    ]
+                )
+            )
+        )
+    )
+    synth = cdk8s.Testing.synth(chart)
+    deployment_synth = [manifest for manifest in synth if manifest["kind"] == "Deployment"][0]
+    hpa_synth = [manifest for manifest in synth if manifest["kind"] == "HorizontalPodAutoscaler"][0]
+
+    # The HPA owns the replica count
+    assert "replicas" not in deployment_synth["spec"]
+
+    expected_hpa = {
+        "apiVersion": "autoscaling/v2",
+        "kind": "HorizontalPodAutoscaler",
+        "metadata": {
+            "name": "my-cdk8s-hpa",
+            "namespace": NAMESPACE
+        },
+        "spec": {
+            "behavior": {
+                "scaleDown": {
+                    "policies": [
+                        {
+                            "periodSeconds": 60,
+                            "type": "Pods",
+                            "value": 1
+                        }
+                    ],
+                    "selectPolicy": "Max",
+                    "stabilizationWindowSeconds": 300
+                },
+                "scaleUp": {
+                    "policies": [
+                        {
+                            "periodSeconds": 15,
+                            "type": "Percent",
+                            "value": 100
+                        }
+                    ],
+                    "selectPolicy": "Max",
+                    "stabilizationWindowSeconds": 0
+                }
+            },
+            "maxReplicas": 12,
+            "metrics": [
+                {
+                    "resource": {
+                        "name": "cpu",
+                        "target": {
+                            "averageUtilization": 60,
+                            "type": "Utilization"
+                        }
+                    },
+                    "type": "Resource"
+                },
+                {
+                    "resource": {
+                        "name": "memory",
+                        "target": {
+                            "averageUtilization": 75,
+                            "type": "Utilization"
+                        }
+                    },
+                    "type": "Resource"
+                }
+            ],
+            "minReplicas": 3,
+            "scaleTargetRef": {
+                "apiVersion": "apps/v1",
+                "kind": "Deployment",
+                "name": "my-cdk8s-deployment"
+            }
+        }
+    }
+    assert hpa_synth == expected_hpa
+
+def test_autoscaling_and_replicas_conflict():
+    with pytest.raises(ValueError):
+        WorkloadOptions(
+            replicas = 2,
+            autoscaling = AutoscalingOptions(max_replicas = 4)
+        )
+
+def test_autoscaling_bounds():
+    with pytest.raises(ValueError):
+        AutoscalingOptions(max_replicas = 2, min_replicas = 3)
+    with pytest.raises(ValueError):
+        AutoscalingOptions(max_replicas = 2, min_replicas = 0)
+
+def test_memory_resources(synth_app_chart):
+    synth = synth_app_chart(
+        "cdk8s-test-memory",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(
+            memory_request = Size.mebibytes(256),
+            memory_limit = Size.mebibytes(512)
+        )
+    ).manifests
+    resources = synth[0]["spec"]["template"]["spec"]["containers"][0]["resources"]
+    assert resources == {
+        "limits": {
+            "cpu": "1",
+            "memory": "512Mi"
+        },
+        "requests": {
+            "cpu": "0.25",
+            "memory": "256Mi"
+        }
+    }
+
+def test_http_probes(synth_app_chart):
+    synth = synth_app_chart(
+        "cdk8s-test-probes",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(
+            readiness_probe = HttpProbeOptions(path = "/ready", period_seconds = 10, timeout_seconds = 3, failure_threshold = 2),
+            liveness_probe = HttpProbeOptions(path = "/healthz", period_seconds = 20, initial_delay_seconds = 15)
+        )
+    ).manifests
+    container = synth[0]["spec"]["template"]["spec"]["containers"][0]
+    assert container["readinessProbe"] == {
+        "failureThreshold": 2,
+        "httpGet": {
+            "path": "/ready",
+            "port": 8080,
+            "scheme": "HTTP"
+        },
+        "initialDelaySeconds": 0,
+        "periodSeconds": 10,
+        "successThreshold": 1,
+        "timeoutSeconds": 3
+    }
+    assert container["livenessProbe"] == {
+        "failureThreshold": 3,
+        "httpGet": {
+            "path": "/healthz",
+            "port": 8080,
+            "scheme": "HTTP"
+        },
+        "initialDelaySeconds": 15,
+        "periodSeconds": 20,
+        "successThreshold": 1,
+        "timeoutSeconds": 2
+    }
+
+    annotations = synth[2]["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-path"] == "/ready"
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-interval-seconds"] == "10"
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-timeout-seconds"] == "3"
+    assert annotations["alb.ingress.kubernetes.io/healthy-threshold-count"] == "2"
+    assert annotations["alb.ingress.kubernetes.io/unhealthy-threshold-count"] == "2"
+    assert annotations["alb.ingress.kubernetes.io/success-codes"] == "200-399"
+
+def test_readiness_probe_timeout():
+    with pytest.raises(ValueError):
+        WorkloadOptions(readiness_probe = HttpProbeOptions(period_seconds = 5, timeout_seconds = 5))
+
+@pytest.mark.parametrize("probe", [
+    {"period_seconds": 4, "timeout_seconds": 2},
+    {"period_seconds": 301},
+    {"timeout_seconds": 1},
+    {"period_seconds": 300, "timeout_seconds": 121},
+    {"failure_threshold": 11},
+    {"success_threshold": 11},
+    {"success_threshold": 0}
+])
+def test_probe_alb_limits(probe):
+    # Outside the ALB health check limits the controller cannot create the target group
+    with pytest.raises(ValueError):
+        HttpProbeOptions(**probe)
+
+def test_alb_profile_health_check_limits():
+    with pytest.raises(ValueError):
+        AlbPerformanceProfile(healthcheck_interval_seconds = 4)
+    with pytest.raises(ValueError):
+        AlbPerformanceProfile(unhealthy_threshold_count = 11)
+    assert HttpProbeOptions(period_seconds = 300, timeout_seconds = 120, failure_threshold = 10, success_threshold = 10)
+
+def test_alb_performance_profiles(synth_app_chart):
+    annotations = synth_app_chart(
+        "cdk8s-test-low-latency",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        alb_profile = AlbPerformanceProfile.low_latency_api()
+    ).manifests[2]["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/load-balancer-attributes"] == (
+        f"access_logs.s3.enabled=true,access_logs.s3.bucket={LOGS_BUCKET},"
+        "idle_timeout.timeout_seconds=30,routing.http2.enabled=true"
+    )
+    assert annotations["alb.ingress.kubernetes.io/target-group-attributes"] == (
+        "deregistration_delay.timeout_seconds=30,slow_start.duration_seconds=0,"
+        "load_balancing.algorithm.type=least_outstanding_requests"
+    )
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-interval-seconds"] == "5"
+    assert annotations["alb.ingress.kubernetes.io/healthy-threshold-count"] == "2"
+    assert annotations["alb.ingress.kubernetes.io/unhealthy-threshold-count"] == "2"
+
+    # The readiness probe keeps the last word on the health checks
+    annotations = synth_app_chart(
+        "cdk8s-test-long-lived",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        alb_profile = AlbPerformanceProfile.long_lived_connections(),
+        workload = WorkloadOptions(readiness_probe = HttpProbeOptions(path = "/ready"))
+    ).manifests[2]["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/load-balancer-attributes"].endswith(
+        "idle_timeout.timeout_seconds=3600,routing.http2.enabled=true"
+    )
+    assert annotations["alb.ingress.kubernetes.io/target-group-attributes"] == (
+        "deregistration_delay.timeout_seconds=300,slow_start.duration_seconds=60,"
+        "load_balancing.algorithm.type=round_robin"
+    )
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-interval-seconds"] == "5"
+    assert annotations["alb.ingress.kubernetes.io/unhealthy-threshold-count"] == "3"
+
+def test_alb_performance_profile_validation():
+    with pytest.raises(ValueError):
+        AlbPerformanceProfile(load_balancing_algorithm = "random")
+    with pytest.raises(ValueError):
+        AlbPerformanceProfile(slow_start_seconds = 30, load_balancing_algorithm = "least_outstanding_requests")
+
+def test_graceful_shutdown(synth_app_chart):
+    synth = synth_app_chart(
+        "cdk8s-test-graceful-shutdown",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        alb_profile = AlbPerformanceProfile.low_latency_api(),
+        workload = WorkloadOptions(
+            graceful_shutdown = GracefulShutdownOptions(
+                shutdown_seconds = 10,
+                max_surge = PercentOrAbsolute.absolute(2)
+            )
+        )
+    ).manifests
+    deployment_spec = synth[0]["spec"]
+    assert deployment_spec["strategy"] == {
+        "rollingUpdate": {
+            "maxSurge": 2,
+            "maxUnavailable": 0
+        },
+        "type": "RollingUpdate"
+    }
+    # The pod keeps serving for the ALB deregistration delay of the profile
+    pod_spec = deployment_spec["template"]["spec"]
+    assert pod_spec["terminationGracePeriodSeconds"] == 40
+    assert pod_spec["containers"][0]["lifecycle"] == {
+        "preStop": {
+            "exec": {
+                "command": ["sleep", "30"]
+            }
+        }
+    }
+    annotations = synth[2]["metadata"]["annotations"]
+    assert "deregistration_delay.timeout_seconds=30," in annotations["alb.ingress.kubernetes.io/target-group-attributes"]
+    assert "least_outstanding_requests" in annotations["alb.ingress.kubernetes.io/target-group-attributes"]
+
+    # An explicit drain time overrides the deregistration delay
+    synth = synth_app_chart(
+        "cdk8s-test-graceful-shutdown-drain",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(graceful_shutdown = GracefulShutdownOptions(drain_seconds = 20))
+    ).manifests
+    assert synth[0]["spec"]["strategy"]["rollingUpdate"] == {"maxSurge": "25%", "maxUnavailable": 0}
+    assert synth[0]["spec"]["template"]["spec"]["terminationGracePeriodSeconds"] == 35
+    # Without an ALB profile, the other load balancer and target group attributes keep their defaults
+    annotations = synth[2]["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/target-group-attributes"] == "deregistration_delay.timeout_seconds=20"
+    assert annotations["alb.ingress.kubernetes.io/load-balancer-attributes"] == (
+        f"access_logs.s3.enabled=true,access_logs.s3.bucket={LOGS_BUCKET}"
+    )
+    assert "alb.ingress.kubernetes.io/healthcheck-interval-seconds" not in annotations
+
+def test_disruption_budget_and_zone_spread(synth_app_chart):
+    chart, synth = synth_app_chart(
+        "cdk8s-test-disruption",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(
+            replicas = 6,
+            pod_disruption_budget = PodDisruptionBudgetOptions(max_unavailable = PercentOrAbsolute.percent(34)),
+            zone_spread = ZoneSpreadOptions()
+        )
+    )
+    assert synth[0]["spec"]["template"]["spec"]["topologySpreadConstraints"] == [
+        {
+            "maxSkew": 1,
+            "topologyKey": "topology.kubernetes.io/zone",
+            "whenUnsatisfiable": "ScheduleAnyway",
+            "labelSelector": {
+                "matchLabels": chart.deployment.match_labels
+            }
+        }
+    ]
+    pdb_synth = [manifest for manifest in synth if manifest["kind"] == "PodDisruptionBudget"][0]
+    assert pdb_synth == {
+        "apiVersion": "policy/v1",
+        "kind": "PodDisruptionBudget",
+        "metadata": {
+            "name": "my-cdk8s-pdb",
+            "namespace": NAMESPACE
+        },
+        "spec": {
+            "maxUnavailable": "34%",
+            "selector": {
+                "matchLabels": chart.deployment.match_labels
+            }
+        }
+    }
+
+    synth = synth_app_chart(
+        "cdk8s-test-disruption-min",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        workload = WorkloadOptions(pod_disruption_budget = PodDisruptionBudgetOptions(min_available = PercentOrAbsolute.absolute(1)))
+    ).manifests
+    pdb_synth = [manifest for manifest in synth if manifest["kind"] == "PodDisruptionBudget"][0]
+    assert pdb_synth["spec"]["minAvailable"] == 1
+    assert "maxUnavailable" not in pdb_synth["spec"]
+    assert "topologySpreadConstraints" not in synth[0]["spec"]["template"]["spec"]
+
+    with pytest.raises(ValueError):
+        PodDisruptionBudgetOptions()
+
+def test_canary(synth_app_chart):
+    chart, synth = synth_app_chart(
+        "cdk8s-test-canary",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        canary = CanaryOptions(image="paulbouwer/hello-kubernetes:1.10", weight=20, replicas=2)
+    )
+    canary_synth = [manifest for manifest in synth if manifest["metadata"]["name"] == "my-cdk8s-canary-deployment"][0]
+    assert canary_synth["spec"]["replicas"] == 2
+    assert canary_synth["spec"]["template"]["spec"]["containers"][0]["image"] == "paulbouwer/hello-kubernetes:1.10"
+    assert synth[0]["spec"]["template"]["spec"]["containers"][0]["image"] == "paulbouwer/hello-kubernetes:1.5"
+
+    # Each service only selects the pods of its deployment
+    canary_service_synth = [manifest for manifest in synth if manifest["metadata"]["name"] == "my-canary-service"][0]
+    assert canary_service_synth["spec"]["selector"] == chart.canary_deployment.match_labels
+    assert synth[1]["spec"]["selector"] != canary_service_synth["spec"]["selector"]
+
+    ingress_synth = synth[2]
+    assert json.loads(ingress_synth["metadata"]["annotations"]["alb.ingress.kubernetes.io/actions.weighted-routing"]) == {
+        "type": "forward",
+        "forwardConfig": {
+            "targetGroups": [
+                {"serviceName": "my-service", "servicePort": "80", "weight": 80},
+                {"serviceName": "my-canary-service", "servicePort": "80", "weight": 20}
+            ]
+        }
+    }
+    assert ingress_synth["spec"]["rules"][0]["http"]["paths"][0] == {
+        "backend": {
+            "service": {
+                "name": "weighted-routing",
+                "port": {
+                    "name": "use-annotation"
+                }
+            }
+        },
+        "path": "/",
+        "pathType": "Prefix"
+    }
+
+    with pytest.raises(ValueError):
+        CanaryOptions(image="paulbouwer/hello-kubernetes:1.10", weight=120)
+
+def test_ingress_group(synth_app_chart):
+    synth = synth_app_chart(
+        "cdk8s-test-ingress-group",
+        namespace = NAMESPACE,
+        alb_access_logs_bucket_name = LOGS_BUCKET,
+        name = "orders",
+        ingress_group = IngressGroupOptions("shared", order=2, path="/orders", host="api.mydomain.com")
+    ).manifests
+    assert [manifest["metadata"]["name"] for manifest in synth] == ["orders-deployment", "orders-service", "orders-ingress"]
+
+    ingress_synth = synth[2]
+    annotations = ingress_synth["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/group.name"] == "shared"
+    assert annotations["alb.ingress.kubernetes.io/group.order"] == "2"
+    assert annotations["alb.ingress.kubernetes.io/load-balancer-name"] == "shared-alb"
+    assert ingress_synth["spec"]["rules"] == [
+        {
+            "host": "api.mydomain.com",
+            "http": {
+                "paths": [
+                    {
+                        "backend": {
+                            "service": {
+                                "name": "orders-service",
+                                "port": {
+                                    "number": 80
+                                }
+                            }
+                        },
+                        "path": "/orders",
+                        "pathType": "Prefix"
+                    }
+                ]
+            }
+        }
+    ]
@@ -0,0 +1,48 @@
+import pytest
+from infrastructure.app_chart import AlbPerformanceProfile
+from infrastructure.charts import AppsOptions, apps_options, create_charts
+
+def test_additional_app_names():
+    # An unnamed chart would overwrite the resources of the main app
+    with pytest.raises(ValueError):
+        AppsOptions(ingress_group="shared", additional_apps=[{"path": "/a"}])
+    with pytest.raises(ValueError):
+        AppsOptions(ingress_group="shared", additional_apps=[{"name": "team-a", "path": "/a"}, {"name": "team-a", "path": "/b"}])
+    with pytest.raises(ValueError):
+        AppsOptions(app_chart={"name": "team-a"}, ingress_group="shared", additional_apps=[{"name": "team-a", "path": "/a"}])
+    with pytest.raises(ValueError):
+        AppsOptions(additional_apps=[{"name": "team-a", "path": "/a"}])
+
+def test_ingress_group_load_balancer_attributes():
+    # Target group settings may differ between the apps, the load balancer attributes may not
+    with pytest.raises(ValueError):
+        AppsOptions(
+            ingress_group = "shared",
+            additional_apps = [{"name": "team-a", "path": "/a", "alb_profile": AlbPerformanceProfile.long_lived_connections()}]
+        )
+    assert AppsOptions(
+        app_chart = {"alb_profile": AlbPerformanceProfile(deregistration_delay_seconds=10)},
+        ingress_group = "shared",
+        additional_apps = [{"name": "team-a", "path": "/a", "alb_profile": AlbPerformanceProfile(slow_start_seconds=30)}]
+    )
+
+def test_create_charts():
+    context = {
+        "ingressGroup": "shared",
+        "additionalApps": [{"name": "team-a", "path": "/a"}],
+        "canary": {"image": "paulbouwer/hello-kubernetes:1.10"}
+    }
+    charts = create_charts(apps_options(context.get), "mock-bucket", namespace="apps")
+    assert sorted(charts) == ["AppChart", "AppChart-team-a-deployment"]
+    assert charts["AppChart-team-a-deployment"].deployment.name == "team-a-deployment"
+    assert charts["AppChart"].canary_deployment is not None
+    assert {chart.deployment.metadata.namespace for chart in charts.values()} == {"apps"}
+
+def test_fargate_sizing_context():
+    apps = apps_options({"fargateMaxWaste": 0.1, "fargateSizingStrict": True}.get)
+    assert (apps.fargate_max_waste, apps.fargate_sizing_strict) == (0.1, True)
+    apps = apps_options({}.get)
+    assert (apps.fargate_max_waste, apps.fargate_sizing_strict) == (0.25, False)
+    # The waste is a share of the pod price
+    with pytest.raises(ValueError):
+        apps_options({"fargateMaxWaste": 25}.get)
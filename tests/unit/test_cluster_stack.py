@@ -1,10 +1,20 @@
-import random
+import json
+import re
+import pytest
 from aws_cdk import App, Environment
-from aws_cdk.assertions import Template, Match
-from infrastructure.cluster_stack import KubernetesClusterStack
+from aws_cdk.aws_ec2 import SubnetSelection, SubnetType
+from aws_cdk.assertions import Match, Template
+from cdk8s import Size
+from infrastructure.app_chart import WorkloadOptions, HttpProbeOptions
+from infrastructure.charts import AppsOptions
+from infrastructure.cluster_stack import KubernetesClusterStack, InfrastructureOptions
+from infrastructure.edge_cache import CloudFrontOptions
+from infrastructure.image_pinning import ImageResolver, PullThroughCacheOptions
+from tests.unit.helpers import log_line, StubRegistryClient, DIGEST
 
 REGION = "us-east-1"
-ACCOUNT = str(random.randint(111111111111, 999999999999))
+ACCOUNT = "123456789012"
+ELB_ACCOUNT_ID = "127311923021"
 K8S_VERSION = "1.28"
 APP_NAME = "cdk8s-samples"
 HOSTED_ZONE_ID = "mock-zone-id"''
@@ -22,30 +32,25 @@ context_mock = {
     ]
 }
 
-app = App(context=context_mock)
-app_name = app.node.try_get_context("appName")
-
-
-stack = KubernetesClusterStack(
-    app,
-    f"{app_name}-app-stack",
-    env=Environment(
-        account=ACCOUNT,
-        region=REGION
-    ),
-    admin_users=[],
-    admin_roles=app.node.try_get_context("adminRoles"),
-    elb_account_id = str(random.randint(111111111111, 999999999999)),
-    certificate = "mock-acm-id",
-    hosted_zone_id = HOSTED_ZONE_ID,
-    hosted_zone_name = "mydomain.com",
-    record_name = RECORD_NAME
-)
-
-template = Template.from_stack(stack)
+@pytest.fixture
+def cluster(synth_cluster_stack):
+    return synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = context_mock["adminRoles"],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = "mock-acm-id",
+        hosted_zone_id = HOSTED_ZONE_ID,
+        hosted_zone_name = "mydomain.com",
+        record_name = RECORD_NAME
+    )
 
 
-def test_eks_cluster():
+def test_eks_cluster(cluster):
+    template = cluster.template
     template.has_resource_properties(
         "Custom::AWSCDK-EKS-Cluster",
         {
@@ -182,7 +187,19 @@ def test_eks_cluster():
         }
     )
 
-def test_r53():
+def test_metrics_server(cluster):
+    # The HorizontalPodAutoscalers read the pod resource metrics from metrics-server
+    template = cluster.template
+    charts = template.find_resources("Custom::AWSCDK-EKS-HelmChart", {"Properties": {"Chart": "metrics-server"}})
+    assert len(charts) == 1
+    chart = list(charts.values())[0]["Properties"]
+    assert chart["Namespace"] == "kube-system"
+    assert chart["Repository"] == "https://kubernetes-sigs.github.io/metrics-server/"
+    # Off the port of the Fargate kubelet
+    assert json.loads(chart["Values"]) == {"containerPort": 4443}
+
+def test_r53(cluster):
+    template = cluster.template
     template.has_resource_properties(
         "AWS::Route53::RecordSet",
         {
@@ -200,3 +217,407 @@ def test_r53():
             "Type": "CNAME"
         }
     )
+
+def test_fargate_sizing(cluster):
+    assert any(
+        message.startswith("Deployment/my-cdk8s-deployment requests 0.25 vCPU/0Mi and runs on a 0.25 vCPU/0.5GB Fargate pod")
+        for message in cluster.messages["info"]
+    )
+    assert not cluster.messages["error"]
+
+def test_fargate_sizing_strict(synth_cluster_stack):
+    # The unused memory of the app pod is a tenth of its price, above the limit it fails the synth
+    messages = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        apps = AppsOptions(fargate_max_waste = 0.05, fargate_sizing_strict = True)
+    ).messages
+    assert any(message.startswith("Deployment/my-cdk8s-deployment requests") for message in messages["error"])
+
+def test_application_endpoint(cluster, synth_cluster_stack):
+    # The ALB certificate matches the record name, HTTP requests to the ALB are redirected
+    cluster.template.has_output("ApplicationEndpoint", {"Value": f"https://{RECORD_NAME}"})
+
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None
+    ).template
+    template.has_output("ApplicationEndpoint", {"Value": {"Fn::Join": ["", ["http://", Match.any_value()]]}})
+
+def test_latency_health_check(synth_cluster_stack):
+    # With a certificate, the health check probes the application over HTTPS on its readiness path
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = "mock-acm-id",
+        hosted_zone_id = HOSTED_ZONE_ID,
+        hosted_zone_name = "mydomain.com",
+        record_name = RECORD_NAME,
+        apps = AppsOptions(app_chart = {"workload": WorkloadOptions(readiness_probe = HttpProbeOptions(path = "/healthz"))}),
+        infrastructure = InfrastructureOptions(latency_routing = True)
+    ).template
+
+    template.has_resource_properties(
+        "AWS::Route53::HealthCheck",
+        {"HealthCheckConfig": Match.object_like({"Type": "HTTPS", "Port": 443, "ResourcePath": "/healthz"})}
+    )
+
+def test_access_logs_athena(synth_cluster_stack):
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        infrastructure = InfrastructureOptions(
+            access_logs_athena = True,
+            access_logs_lifecycle = True
+        )
+    ).template
+
+    table = template.find_resources("AWS::Glue::Table")
+    table_input = list(table.values())[0]["Properties"]["TableInput"]
+    assert [key["Name"] for key in table_input["PartitionKeys"]] == ["region", "day"]
+    assert table_input["Parameters"]["projection.enabled"] == "true"
+    assert table_input["Parameters"]["projection.region.values"] == REGION
+
+    # The table regex parses a real log line into one group per column
+    columns = table_input["StorageDescriptor"]["Columns"]
+    regex = table_input["StorageDescriptor"]["SerdeInfo"]["Parameters"]["input.regex"]
+    fields = re.fullmatch(regex, log_line("/hello", "10.0.1.5:8080", 0.12).strip()).groups()
+    assert len(fields) == len(columns)
+    parsed = dict(zip([column["Name"] for column in columns], fields))
+    assert parsed["target_ip"] == "10.0.1.5"
+    assert parsed["target_processing_time"] == "0.12"
+    assert parsed["request_url"] == "http://example.com:80/hello?id=1"
+
+    template.resource_count_is("AWS::Athena::NamedQuery", 3)
+    template.has_resource_properties(
+        "AWS::S3::Bucket",
+        {
+            "LifecycleConfiguration": {
+                "Rules": Match.array_with([
+                    Match.object_like({
+                        "Prefix": "AWSLogs/",
+                        "Transitions": [
+                            {"StorageClass": "STANDARD_IA", "TransitionInDays": 30},
+                            {"StorageClass": "GLACIER_IR", "TransitionInDays": 90}
+                        ]
+                    }),
+                    Match.object_like({
+                        "Prefix": "athena-results/",
+                        "ExpirationInDays": 7
+                    })
+                ])
+            }
+        }
+    )
+
+def test_ingress_group(synth_cluster_stack):
+    stack = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        apps = AppsOptions(
+            ingress_group = "cdk8s-samples",
+            additional_apps = [
+                {"name": "orders", "path": "/orders"},
+                {"name": "users", "path": "/users"}
+            ]
+        )
+    )
+    template = stack.template
+
+    ingresses = {}
+    for manifest in template.find_resources("Custom::AWSCDK-EKS-KubernetesResource").values():
+        # Manifests referencing the logs bucket are joined with its name at deploy time
+        manifest = manifest["Properties"]["Manifest"]
+        if isinstance(manifest, dict):
+            manifest = "".join(part if isinstance(part, str) else "bucket" for part in manifest["Fn::Join"][1])
+        for resource in json.loads(manifest):
+            if resource["kind"] == "Ingress":
+                ingresses[resource["metadata"]["name"]] = resource["metadata"]["annotations"]
+    assert {name: annotations["alb.ingress.kubernetes.io/group.order"] for name, annotations in ingresses.items()} == {
+        "orders-ingress": "1",
+        "users-ingress": "2",
+        "my-test-ingress": "3"
+    }
+    assert {annotations["alb.ingress.kubernetes.io/group.name"] for annotations in ingresses.values()} == {"cdk8s-samples"}
+
+    # The shared ALB address is resolved once, for the main ingress
+    template.resource_count_is("Custom::AWSCDK-EKS-KubernetesObjectValue", 1)
+    template.has_resource_properties("Custom::AWSCDK-EKS-KubernetesObjectValue", {"ObjectName": "my-test-ingress"})
+
+def test_manifest_split(synth_cluster_stack):
+    def manifests(memory_request_mib):
+        template = synth_cluster_stack(
+            context = context_mock,
+            account = ACCOUNT,
+            region = REGION,
+            stack_id = f"{APP_NAME}-app-stack",
+            admin_users = [],
+            admin_roles = [],
+            elb_account_id = ELB_ACCOUNT_ID,
+            certificate = None,
+            hosted_zone_id = None,
+            hosted_zone_name = None,
+            record_name = None,
+            apps = AppsOptions(
+                app_chart = {"workload": WorkloadOptions(memory_request = Size.mebibytes(memory_request_mib))},
+                manifest_split = "resource"
+            )
+        ).template
+        return {
+            logical_id: resource["Properties"]["Manifest"]
+            for logical_id, resource in template.find_resources("Custom::AWSCDK-EKS-KubernetesResource").items()
+            if "AppChart" in logical_id
+        }
+
+    before = manifests(512)
+    after = manifests(1024)
+    assert len(before) == 3
+    assert sorted(before) == sorted(after)
+    # Only the deployment manifest changes
+    changed = [logical_id for logical_id in before if before[logical_id] != after[logical_id]]
+    assert len(changed) == 1
+    assert changed[0].startswith("AppChartDeploymentdefaultmycdk8sdeployment")
+
+def test_vpc_endpoints(synth_cluster_stack):
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        infrastructure = InfrastructureOptions(vpc_endpoints = True)
+    ).template
+
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {"VpcEndpointType": "Gateway", "ServiceName": Match.any_value()})
+    interface_endpoints = template.find_resources("AWS::EC2::VPCEndpoint", {"Properties": {"VpcEndpointType": "Interface"}}).values()
+    service_names = [json.dumps(endpoint["Properties"]["ServiceName"]) for endpoint in interface_endpoints]
+    for service in ["ecr.api", "ecr.dkr", "sts", "logs", "elasticloadbalancing"]:
+        assert len([name for name in service_names if f".{service}" in name]) == 1
+
+    # The interface endpoints resolve the public service names inside the VPC
+    for endpoint in interface_endpoints:
+        assert endpoint["Properties"]["PrivateDnsEnabled"] is True
+
+def test_vpc_subnets():
+    # Subnet selections have no value-level cache key, the stack is synthesized without the fixture
+    template = Template.from_stack(KubernetesClusterStack(
+        App(context=context_mock),
+        f"{APP_NAME}-app-stack",
+        env = Environment(account=ACCOUNT, region=REGION),
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        infrastructure = InfrastructureOptions(vpc_subnets = [SubnetSelection(subnet_type = SubnetType.PRIVATE_WITH_EGRESS)])
+    ))
+
+    # The control plane network interfaces only go in the private subnets
+    private_subnets = sorted(template.find_resources("AWS::EC2::Subnet", {"Properties": {"MapPublicIpOnLaunch": False}}))
+    cluster = list(template.find_resources("Custom::AWSCDK-EKS-Cluster").values())[0]
+    subnet_ids = cluster["Properties"]["Config"]["resourcesVpcConfig"]["subnetIds"]
+    assert private_subnets
+    assert sorted(subnet["Ref"] for subnet in subnet_ids) == private_subnets
+
+def test_pull_through_cache():
+    # The stub registry client has no value-level cache key, the stack is synthesized without the fixture
+    template = Template.from_stack(KubernetesClusterStack(
+        App(context=context_mock),
+        f"{APP_NAME}-app-stack",
+        env = Environment(account=ACCOUNT, region=REGION),
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        apps = AppsOptions(
+            image_resolver = ImageResolver(client=StubRegistryClient()),
+            pull_through_cache = PullThroughCacheOptions(
+                credential_arn = f"arn:aws:secretsmanager:{REGION}:{ACCOUNT}:secret:ecr-pullthroughcache/docker-hub"
+            )
+        )
+    ))
+
+    template.has_resource_properties(
+        "AWS::ECR::PullThroughCacheRule",
+        {"EcrRepositoryPrefix": "docker-hub", "UpstreamRegistryUrl": "registry-1.docker.io"}
+    )
+    template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": Match.array_with([
+                    Match.object_like({"Action": ["ecr:CreateRepository", "ecr:BatchImportUpstreamImage"]})
+                ])
+            }
+        }
+    )
+
+    # The application is pulled from the cache, pinned to the digest of its tag
+    assert f"/docker-hub/paulbouwer/hello-kubernetes:1.5@{DIGEST}" in json.dumps(template.to_json())
+
+def test_cloudfront(synth_cluster_stack):
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = "mock-acm-id",
+        hosted_zone_id = HOSTED_ZONE_ID,
+        hosted_zone_name = "mydomain.com",
+        record_name = RECORD_NAME,
+        infrastructure = InfrastructureOptions(
+            cloudfront = CloudFrontOptions.from_dict({
+                "certificate_arn": f"arn:aws:acm:us-east-1:{ACCOUNT}:certificate/mock-edge-certificate",
+                "cached_paths": {"/static/*": {"default_ttl_seconds": 3600, "query_strings": ["v"]}},
+                "keepalive_timeout_seconds": 30
+            })
+        )
+    ).template
+
+    template.has_resource_properties(
+        "AWS::CloudFront::Distribution",
+        {
+            "DistributionConfig": Match.object_like({
+                "Aliases": [RECORD_NAME],
+                "Origins": [
+                    Match.object_like({
+                        "CustomOriginConfig": Match.object_like({
+                            "OriginProtocolPolicy": "https-only",
+                            "OriginKeepaliveTimeout": 30,
+                            "OriginSSLProtocols": ["TLSv1.2"]
+                        })
+                    })
+                ],
+                "DefaultCacheBehavior": Match.object_like({"Compress": True, "ViewerProtocolPolicy": "redirect-to-https"}),
+                "CacheBehaviors": [Match.object_like({"PathPattern": "/static/*", "Compress": True})]
+            })
+        }
+    )
+    template.has_resource_properties(
+        "AWS::CloudFront::CachePolicy",
+        {
+            "CachePolicyConfig": Match.object_like({
+                "DefaultTTL": 3600,
+                "ParametersInCacheKeyAndForwardedToOrigin": Match.object_like({
+                    "EnableAcceptEncodingGzip": True,
+                    "QueryStringsConfig": {"QueryStringBehavior": "whitelist", "QueryStrings": ["v"]}
+                })
+            })
+        }
+    )
+
+    # The record points at the distribution instead of the ALB
+    template.resource_count_is("AWS::Route53::RecordSet", 2)
+    template.has_resource_properties(
+        "AWS::Route53::RecordSet",
+        {"Type": "A", "AliasTarget": Match.object_like({"DNSName": {"Fn::GetAtt": [Match.any_value(), "DomainName"]}})}
+    )
+
+def test_cloudfront_without_alb_certificate(synth_cluster_stack):
+    # The viewers get the edge certificate, the ALB only listens on HTTP
+    template = synth_cluster_stack(
+        context = context_mock,
+        account = ACCOUNT,
+        region = REGION,
+        stack_id = f"{APP_NAME}-app-stack",
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = ELB_ACCOUNT_ID,
+        certificate = None,
+        hosted_zone_id = HOSTED_ZONE_ID,
+        hosted_zone_name = "mydomain.com",
+        record_name = RECORD_NAME,
+        infrastructure = InfrastructureOptions(
+            cloudfront = CloudFrontOptions(certificate_arn=f"arn:aws:acm:us-east-1:{ACCOUNT}:certificate/mock-edge-certificate")
+        )
+    ).template
+
+    template.has_resource_properties(
+        "AWS::CloudFront::Distribution",
+        {
+            "DistributionConfig": Match.object_like({
+                "Aliases": [RECORD_NAME],
+                "ViewerCertificate": Match.object_like({
+                    "AcmCertificateArn": f"arn:aws:acm:us-east-1:{ACCOUNT}:certificate/mock-edge-certificate"
+                }),
+                "Origins": [
+                    Match.object_like({
+                        "CustomOriginConfig": Match.object_like({"OriginProtocolPolicy": "http-only"})
+                    })
+                ]
+            })
+        }
+    )
+
+def test_cloudfront_requires_edge_certificate(synth_cluster_stack):
+    # The ALB only answers HTTPS for the record name
+    with pytest.raises(ValueError):
+        synth_cluster_stack(
+            context = context_mock,
+            account = ACCOUNT,
+            region = REGION,
+            stack_id = f"{APP_NAME}-app-stack",
+            admin_users = [],
+            admin_roles = [],
+            elb_account_id = ELB_ACCOUNT_ID,
+            certificate = "mock-acm-id",
+            hosted_zone_id = HOSTED_ZONE_ID,
+            hosted_zone_name = "mydomain.com",
+            record_name = RECORD_NAME,
+            infrastructure = InfrastructureOptions(cloudfront = CloudFrontOptions())
+        )
@@ -0,0 +1,81 @@
+import pytest
+from infrastructure.fargate_sizing import (
+    parse_cpu,
+    parse_memory_mib,
+    fargate_pod_size,
+    pod_requests,
+    size_manifests
+)
+
+def deployment(name, containers, init_containers = None):
+    pod_spec = {"containers": containers}
+    if init_containers is not None:
+        pod_spec["initContainers"] = init_containers
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "name": name
+        },
+        "spec": {
+            "template": {
+                "spec": pod_spec
+            }
+        }
+    }
+
+def container(cpu = None, memory = None, limits = None):
+    requests = {}
+    if cpu is not None:
+        requests["cpu"] = cpu
+    if memory is not None:
+        requests["memory"] = memory
+    return {"resources": {"requests": requests, "limits": limits or {}}}
+
+def test_parse_quantities():
+    assert parse_cpu("250m") == 0.25
+    assert parse_cpu("0.25") == 0.25
+    assert parse_cpu(2) == 2
+    assert parse_memory_mib("512Mi") == 512
+    assert parse_memory_mib("1Gi") == 1024
+    assert parse_memory_mib("1G") == pytest.approx(953.67, 0.01)
+    assert parse_memory_mib(str(2 ** 20)) == 1
+
+def test_fargate_pod_size():
+    # 256Mi are added for the Fargate components
+    assert fargate_pod_size(0.25, 256) == (0.25, 512)
+    assert fargate_pod_size(0.25, 257) == (0.25, 1024)
+    assert fargate_pod_size(0.3, 512) == (0.5, 1024)
+    # Memory above what the vCPU size allows moves to the next vCPU size
+    assert fargate_pod_size(0.25, 2048) == (0.5, 3072)
+    assert fargate_pod_size(4, 30 * 1024) == (8, 32 * 1024)
+    with pytest.raises(ValueError):
+        fargate_pod_size(32, 1024)
+
+def test_pod_requests():
+    pod_spec = deployment(
+        "app",
+        [container("250m", "512Mi"), container(limits = {"cpu": "1", "memory": "1Gi"})],
+        [container("2", "256Mi")]
+    )["spec"]["template"]["spec"]
+    assert pod_requests(pod_spec) == (2, 1536)
+
+def test_size_manifests():
+    sizes = size_manifests([
+        deployment("fitted", [container("1", "1792Mi")]),
+        deployment("oversized", [container("1.1", "512Mi")]),
+        {"apiVersion": "v1", "kind": "Service", "metadata": {"name": "svc"}}
+    ])
+    assert [size.workload for size in sizes] == ["Deployment/fitted", "Deployment/oversized"]
+
+    fitted = sizes[0]
+    oversized = sizes[1]
+    assert (fitted.cpu, fitted.memory_mib) == (1, 2048)
+    assert fitted.wasted_cpu == 0 and fitted.wasted_memory_mib == 0
+    assert fitted.waste == 0
+
+    assert (oversized.cpu, oversized.memory_mib) == (2, 4096)
+    assert oversized.wasted_cpu == pytest.approx(0.9)
+    assert oversized.wasted_memory_mib == 3328
+    assert oversized.waste > 0.5
+    assert "2 vCPU/4GB" in str(oversized)
@@ -0,0 +1,77 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from tools.http_load_test import percentile, summarize, slo_breaches, main
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        status = {"/error": 500, "/redirect": 301}.get(self.path, 200)
+        body = b"hello"
+        self.send_response(status)
+        if status == 301:
+            self.send_header("Location", "https://127.0.0.1/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+@pytest.fixture(scope="module")
+def stand_in_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_summarize():
+    samples = [(200, latency / 1000) for latency in range(1, 101)] + [(503, 0.2), (None, 5.0)]
+    report = summarize(samples, 2)
+    assert report["requests"] == 102
+    assert report["errors"] == 2
+    assert report["error_rate"] == 0.0196
+    assert report["rps"] == 51
+    assert report["latency_ms"] == {"p50": 51, "p95": 97, "p99": 200, "max": 5000}
+    assert report["status"] == {"200": 100, "503": 1, "error": 1}
+    assert percentile([3, 1, 2], 0.5) == 2
+
+def test_slo_breaches():
+    report = summarize([(200, 0.1)] * 99 + [(500, 0.9)], 1)
+    assert not slo_breaches(report, p50_ms=100, p95_ms=100, max_error_rate=0.01)
+    assert slo_breaches(report, p99_ms=50, max_error_rate=0) == [
+        "p99 latency 100.0ms over the 50ms SLO",
+        "error rate 1.00% over the 0.00% SLO"
+    ]
+    assert slo_breaches(summarize([], 1)) == ["No request was sent"]
+
+def test_load_test(stand_in_url, tmp_path, capsys):
+    output = tmp_path / "report.json"
+    assert main(
+        [
+            "--url", stand_in_url,
+            "--rps", "100",
+            "--duration", "1",
+            "--concurrency", "4",
+            "--ready-timeout", "5",
+            "--p99-ms", "1000",
+            "--max-error-rate", "0",
+            "--output", str(output)
+        ]
+    ) == 0
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert report["requests"] == 100
+    assert report["status"] == {"200": 100}
+    assert not report["slo_breaches"]
+    assert json.loads(capsys.readouterr().out) == report
+
+    assert main(["--url", f"{stand_in_url}/error", "--rps", "20", "--duration", "0.5", "--max-error-rate", "0.01"]) == 1
+    assert "SLO breach: error rate 100.00% over the 1.00% SLO" in capsys.readouterr().err
+
+    # Redirects are not followed, an HTTP endpoint redirecting to HTTPS fails the test
+    assert main(["--url", f"{stand_in_url}/redirect", "--rps", "20", "--duration", "0.5", "--ready-timeout", "5", "--max-error-rate", "0.01"]) == 1
+    assert json.loads(capsys.readouterr().out)["status"] == {"301": 10}
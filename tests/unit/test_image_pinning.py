@@ -0,0 +1,72 @@
+import json
+import cdk8s
+import pytest
+from infrastructure.app_chart import AppChart, CanaryOptions
+from infrastructure.image_pinning import ImageReference, ImageResolver, PullThroughCacheOptions, pull_through_image, rewrite_chart_images
+from tests.unit.helpers import DIGEST, StubRegistryClient
+
+def test_parse_image_reference():
+    assert ImageReference.parse("nginx") == ImageReference("docker.io", "library/nginx", "latest")
+    assert ImageReference.parse("paulbouwer/hello-kubernetes:1.5") == ImageReference("docker.io", "paulbouwer/hello-kubernetes", "1.5")
+    assert ImageReference.parse("localhost:5000/team/app:2") == ImageReference("localhost:5000", "team/app", "2")
+    assert ImageReference.parse(f"public.ecr.aws/nginx/nginx@{DIGEST}") == ImageReference("public.ecr.aws", "nginx/nginx", "latest", DIGEST)
+
+def test_resolver_cache(tmp_path):
+    cache_path = tmp_path / "image-digests.json"
+    client = StubRegistryClient()
+    resolver = ImageResolver(client=client, cache_path=cache_path)
+    assert resolver.resolve("paulbouwer/hello-kubernetes:1.5") == f"paulbouwer/hello-kubernetes:1.5@{DIGEST}"
+    assert resolver.resolve("paulbouwer/hello-kubernetes:1.5") == f"paulbouwer/hello-kubernetes:1.5@{DIGEST}"
+    # Pinned images are left as they are
+    assert resolver.resolve(f"nginx@{DIGEST}") == f"nginx@{DIGEST}"
+    assert client.lookups == ["docker.io/paulbouwer/hello-kubernetes:1.5"]
+
+    # A later synth reads the lookups from disk
+    client = StubRegistryClient()
+    ImageResolver(client=client, cache_path=cache_path).resolve("paulbouwer/hello-kubernetes:1.5")
+    assert not client.lookups
+    assert json.loads(cache_path.read_text())["docker.io/paulbouwer/hello-kubernetes:1.5"]["digest"] == DIGEST
+
+    # Expired lookups are resolved again
+    ImageResolver(client=client, cache_path=cache_path, max_age_seconds=-1).resolve("paulbouwer/hello-kubernetes:1.5")
+    assert client.lookups == ["docker.io/paulbouwer/hello-kubernetes:1.5"]
+
+def test_pull_through_image():
+    options = PullThroughCacheOptions(credential_arn="arn:aws:secretsmanager:us-east-1:123456789012:secret:ecr-pullthroughcache/docker-hub")
+    registry = "123456789012.dkr.ecr.us-east-1.amazonaws.com"
+    assert pull_through_image("nginx:1.25", options.upstream_registry, registry, options.repository_prefix) == \
+        f"{registry}/docker-hub/library/nginx:1.25"
+    assert pull_through_image(f"paulbouwer/hello-kubernetes:1.5@{DIGEST}", options.upstream_registry, registry, options.repository_prefix) == \
+        f"{registry}/docker-hub/paulbouwer/hello-kubernetes:1.5@{DIGEST}"
+    # Other registries are not cached
+    assert pull_through_image("public.ecr.aws/nginx/nginx:1.25", options.upstream_registry, registry, options.repository_prefix) == \
+        "public.ecr.aws/nginx/nginx:1.25"
+
+def test_pull_through_cache_credentials():
+    # Docker Hub requires credentials, other upstream registries may not
+    with pytest.raises(ValueError):
+        PullThroughCacheOptions()
+    with pytest.raises(ValueError):
+        PullThroughCacheOptions(upstream_registry="registry-1.docker.io", repository_prefix="hub")
+    assert PullThroughCacheOptions(upstream_registry="public.ecr.aws", upstream_registry_url="public.ecr.aws", repository_prefix="ecr-public")
+
+def test_rewrite_chart_images():
+    chart = AppChart(
+        cdk8s.Testing.app(),
+        "cdk8s-test",
+        namespace = "test",
+        alb_access_logs_bucket_name = "mock-bucket",
+        canary = CanaryOptions(image="paulbouwer/hello-kubernetes:1.10")
+    )
+    resolver = ImageResolver(client=StubRegistryClient())
+    rewrite_chart_images(chart, resolver.resolve)
+
+    images = {
+        manifest["metadata"]["name"]: [container["image"] for container in manifest["spec"]["template"]["spec"]["containers"]]
+        for manifest in chart.to_json()
+        if manifest["kind"] == "Deployment"
+    }
+    assert images == {
+        "my-cdk8s-deployment": [f"paulbouwer/hello-kubernetes:1.5@{DIGEST}"],
+        "my-cdk8s-canary-deployment": [f"paulbouwer/hello-kubernetes:1.10@{DIGEST}"]
+    }
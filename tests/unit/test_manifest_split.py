@@ -0,0 +1,19 @@
+import pytest
+from infrastructure.manifest_split import split_manifests
+
+def resource(kind, name, namespace="default"):
+    return {"apiVersion": "v1", "kind": kind, "metadata": {"name": name, "namespace": namespace}}
+
+def test_split_manifests():
+    resources = [resource("Service", "orders"), resource("Deployment", "orders"), resource("Service", "users")]
+    assert list(split_manifests(resources, "chart")) == ["chart"]
+    assert {key: len(group) for key, group in split_manifests(resources, "kind").items()} == {"Service": 2, "Deployment": 1}
+    assert list(split_manifests(resources, "resource")) == ["Service-default-orders", "Deployment-default-orders", "Service-default-users"]
+    with pytest.raises(ValueError):
+        split_manifests(resources, "namespace")
+
+def test_resource_key_collision():
+    with pytest.raises(ValueError, match="Service default/a.b and Service default/a-b share the manifest id Service-default-a-b"):
+        split_manifests([resource("Service", "a.b"), resource("Service", "a-b")], "resource")
+    # The kind is part of the key
+    assert len(split_manifests([resource("Service", "a.b"), resource("Deployment", "a-b")], "resource")) == 2
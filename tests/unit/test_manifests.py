@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+
+# Runs manifests.py in a fresh interpreter and fails if it loaded aws_cdk
+RUN_MANIFESTS = """
+import runpy, sys
+sys.argv = ["manifests.py"] + sys.argv[1:]
+runpy.run_path("manifests.py", run_name="__main__")
+assert not [module for module in sys.modules if module.startswith("aws_cdk")], "aws_cdk imported"
+"""
+
+def synth_manifests(*args) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", RUN_MANIFESTS, *args],
+        cwd = ROOT,
+        capture_output = True,
+        text = True,
+        check = False
+    )
+
+def test_manifests_without_aws_cdk(tmp_path):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"namespace": "apps", "alb_access_logs_bucket_name": "config-bucket"}))
+
+    result = synth_manifests(
+        "--config", str(config_file),
+        "--certificate", "mock-arn",
+        "--output", str(tmp_path / "dist"),
+        "--file-per-resource"
+    )
+    assert result.returncode == 0, result.stderr
+
+    manifests = {path.name: path.read_text() for path in (tmp_path / "dist" / "AppChart").iterdir()}
+    assert len(manifests) == 3
+    deployment = [content for name, content in manifests.items() if name.startswith("Deployment.")][0]
+    assert "namespace: apps" in deployment
+    ingress = [content for name, content in manifests.items() if name.startswith("Ingress.")][0]
+    assert "access_logs.s3.bucket=config-bucket" in ingress
+    assert "alb.ingress.kubernetes.io/certificate-arn: mock-arn" in ingress
+
+def test_manifests_of_the_context(tmp_path):
+    # Same charts as the cluster stack for the same context
+    context_file = tmp_path / "cdk.json"
+    context_file.write_text(json.dumps({"context": {
+        "ingressGroup": "shared",
+        "additionalApps": [{"name": "team-a", "path": "/a"}],
+        "canary": {"image": "paulbouwer/hello-kubernetes:1.10", "weight": 10}
+    }}))
+
+    result = synth_manifests("--context", str(context_file), "--output", str(tmp_path / "dist"))
+    assert result.returncode == 0, result.stderr
+
+    assert sorted(path.name for path in (tmp_path / "dist").iterdir()) == ["AppChart", "AppChart-team-a-deployment"]
+    main = next((tmp_path / "dist" / "AppChart").glob("*.k8s.yaml")).read_text()
+    assert "name: my-cdk8s-canary-deployment" in main
+    assert "alb.ingress.kubernetes.io/group.name: shared" in main
+    additional = next((tmp_path / "dist" / "AppChart-team-a-deployment").glob("*.k8s.yaml")).read_text()
+    assert "name: team-a-deployment" in additional
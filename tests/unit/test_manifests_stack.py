@@ -0,0 +1,72 @@
+from aws_cdk import App, Environment
+from aws_cdk.assertions import Template, Match
+from aws_cdk.aws_eks import KubectlProvider
+from cdk8s import App as Ck8sApp
+from infrastructure.app_chart import create_app_chart
+from infrastructure.cluster_stack import KubernetesClusterStack, InfrastructureOptions
+from infrastructure.manifests_stack import KubernetesManifestsStack
+
+ENV = Environment(account="123456789012", region="us-east-1")
+
+def test_shared_kubectl_provider():
+    app = App(context={"appName": "cdk8s-samples"})
+    cluster_stack = KubernetesClusterStack(
+        app,
+        "cdk8s-samples-app-stack",
+        env = ENV,
+        admin_users = [],
+        admin_roles = [],
+        elb_account_id = "127311923021",
+        certificate = None,
+        hosted_zone_id = None,
+        hosted_zone_name = None,
+        record_name = None,
+        infrastructure = InfrastructureOptions(
+            kubectl_memory_mib = 2048,
+            kubectl_environment = {"KUBECTL_LOG_LEVEL": "1"}
+        )
+    )
+    manifests_stacks = [
+        KubernetesManifestsStack(
+            app,
+            f"cdk8s-samples-{name}-stack",
+            env = ENV,
+            cluster_name = "cdk8s-samples",
+            kubectl_provider = cluster_stack.kubectl_provider,
+            charts = {
+                # A namespace selected by the Fargate profile of the cluster, one chart name per team
+                "AppChart": create_app_chart(
+                    Ck8sApp(),
+                    namespace = "default",
+                    alb_access_logs_bucket_name = "mock-bucket",
+                    name = name
+                )
+            }
+        )
+        for name in ["team-a", "team-b"]
+    ]
+
+    # The kubectl handler of the cluster stack is sized
+    provider_template = Template.from_stack(KubectlProvider.get_or_create(cluster_stack, cluster_stack.cluster))
+    provider_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "MemorySize": 2048,
+            "Environment": {"Variables": Match.object_like({"KUBECTL_LOG_LEVEL": "1"})}
+        }
+    )
+
+    # The manifests stacks deploy no handler of their own and apply their charts through the shared one
+    for stack in manifests_stacks:
+        template = Template.from_stack(stack)
+        template.resource_count_is("AWS::CloudFormation::Stack", 0)
+        template.resource_count_is("AWS::Lambda::Function", 0)
+        template.resource_count_is("Custom::AWSCDK-EKS-KubernetesResource", 1)
+        template.has_resource_properties(
+            "Custom::AWSCDK-EKS-KubernetesResource",
+            {
+                "ServiceToken": {"Fn::ImportValue": Match.any_value()},
+                "RoleArn": {"Fn::ImportValue": Match.any_value()},
+                "ClusterName": "cdk8s-samples"
+            }
+        )
@@ -0,0 +1,61 @@
+import pytest
+from aws_cdk import App, Stack
+from aws_cdk.aws_s3 import Bucket
+from aws_cdk.cx_api import SynthesisMessageLevel
+from cdk_nag import NagSuppressions
+from infrastructure.nag_checks import synth_with_nag_checks
+
+def nag_app(outdir, suppressed: bool) -> App:
+    app = App(outdir=str(outdir))
+    stack = Stack(app, "NagStack")
+    bucket = Bucket(stack, "Bucket")
+    if suppressed:
+        NagSuppressions.add_resource_suppressions(
+            bucket,
+            [
+                {"id": rule, "reason": "Test bucket, never deployed"}
+                for rule in ["AwsSolutions-S1", "AwsSolutions-S10"]
+            ]
+        )
+    return app
+
+def nag_errors(assembly) -> list:
+    return [
+        message.entry.data for message in assembly.get_stack_by_name("NagStack").messages
+        if message.level == SynthesisMessageLevel.ERROR
+    ]
+
+def nag_report_written(outdir) -> bool:
+    return (outdir / "AwsSolutions-NagStack-NagReport.csv").is_file()
+
+def test_nag_modes(tmp_path):
+    assembly = synth_with_nag_checks(nag_app(tmp_path / "full", False), "full")
+    assert any(error.startswith("AwsSolutions-S1:") for error in nag_errors(assembly))
+
+    assembly = synth_with_nag_checks(nag_app(tmp_path / "off", False), "off")
+    assert not nag_errors(assembly)
+    assert not nag_report_written(tmp_path / "off")
+
+    with pytest.raises(ValueError):
+        synth_with_nag_checks(nag_app(tmp_path / "unknown", False), "fast")
+
+def test_nag_cache(tmp_path):
+    cache_file = tmp_path / "nag-cache.json"
+
+    # Stacks with findings are checked again on every synth
+    for run in ["findings-1", "findings-2"]:
+        assembly = synth_with_nag_checks(nag_app(tmp_path / run, False), "cached", str(cache_file))
+        assert any(error.startswith("AwsSolutions-S1:") for error in nag_errors(assembly))
+        assert nag_report_written(tmp_path / run)
+
+    # A clean stack is checked once, then skipped while its template does not change
+    synth_with_nag_checks(nag_app(tmp_path / "clean-1", True), "cached", str(cache_file))
+    assert nag_report_written(tmp_path / "clean-1")
+    assembly = synth_with_nag_checks(nag_app(tmp_path / "clean-2", True), "cached", str(cache_file))
+    assert not nag_report_written(tmp_path / "clean-2")
+    assert not nag_errors(assembly)
+
+    # Removing the suppressions changes the template
+    assembly = synth_with_nag_checks(nag_app(tmp_path / "findings-3", False), "cached", str(cache_file))
+    assert nag_report_written(tmp_path / "findings-3")
+    assert nag_errors(assembly)
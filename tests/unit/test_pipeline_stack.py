@@ -0,0 +1,227 @@
+import hashlib
+import json
+import pytest
+from aws_cdk import App, Environment
+from aws_cdk.assertions import Template, Match
+from infrastructure.pipeline_stack import PipelineStack, SourceOptions, ChecksOptions, LoadTestOptions, ROOT, DEPENDENCY_FILES, dependency_hash, split_unit_tests
+from infrastructure.deploy_stage import DeploymentTarget
+
+ACCOUNT = "123456789012"
+REGION = "us-east-1"
+APP_NAME = "cdk8s-samples"
+HOSTED_ZONE_ID = "mock-zone-id"
+HOSTED_ZONE_NAME = "mydomain.com"
+GITLEAKS_SHA256 = hashlib.sha256(b"gitleaks archive").hexdigest()
+
+# Both regions in the account of the hosted zone
+TARGET_ACCOUNT = "210987654321"
+TARGETS = [
+    DeploymentTarget(account=TARGET_ACCOUNT, region="us-east-1", elb_account_id="127311923021"),
+    DeploymentTarget(account=TARGET_ACCOUNT, region="eu-west-1", elb_account_id="156460612806", certificate="mock-eu-acm-id")
+]
+
+def pipeline_stack(deployment_targets, **checks):
+    return PipelineStack(
+        App(context={"appName": APP_NAME, "adminRoles": [], "adminUsers": []}),
+        f"{APP_NAME}-pipeline-stack",
+        env = Environment(
+            account = ACCOUNT,
+            region = REGION
+        ),
+        app_name = APP_NAME,
+        elb_account_id = "127311923021",
+        certificate = None,
+        hosted_zone_id = HOSTED_ZONE_ID,
+        hosted_zone_name = HOSTED_ZONE_NAME,
+        record_name = "app",
+        source = SourceOptions(
+            repo_string = "owner/repo",
+            connection_arn = f"arn:aws:codestar-connections:{REGION}:{ACCOUNT}:connection/mock"
+        ),
+        checks = ChecksOptions(**checks),
+        deployment_targets = deployment_targets
+    )
+
+def test_multi_region_wave():
+    stack = pipeline_stack(TARGETS)
+    template = Template.from_stack(stack)
+
+    # Both regions deploy in the same pipeline stage, after the checks
+    pipeline = list(template.find_resources("AWS::CodePipeline::Pipeline").values())[0]
+    dev_actions = [stage for stage in pipeline["Properties"]["Stages"] if stage["Name"] == "DEV"][0]["Actions"]
+    deploy_actions = {action["Name"]: action for action in dev_actions if action["Name"].endswith(".Deploy")}
+    assert sorted(deploy_actions) == ["DEV-eu-west-1.cdk8s-samples-app-stack.Deploy", "DEV-us-east-1.cdk8s-samples-app-stack.Deploy"]
+    assert deploy_actions["DEV-eu-west-1.cdk8s-samples-app-stack.Deploy"]["Region"] == "eu-west-1"
+    assert len({action["RunOrder"] for action in deploy_actions.values()}) == 1
+
+    # The targets are in another account than the pipeline
+    template.has_resource_properties("AWS::KMS::Key", {"EnableKeyRotation": True})
+
+    for target in TARGETS:
+        cluster_template = Template.from_stack(stack.node.find_child(f"DEV-{target.region}").stack)
+        cluster_template.resource_count_is("AWS::Route53::HealthCheck", 1)
+        # With a certificate the HTTP port only redirects, the check goes through HTTPS
+        cluster_template.has_resource_properties(
+            "AWS::Route53::HealthCheck",
+            {"HealthCheckConfig": Match.object_like(
+                {"Type": "HTTPS", "Port": 443} if target.certificate is not None else {"Type": "HTTP", "Port": 80}
+            )}
+        )
+        cluster_template.has_resource_properties(
+            "AWS::Route53::RecordSet",
+            {
+                "HostedZoneId": HOSTED_ZONE_ID,
+                "Name": f"app.{HOSTED_ZONE_NAME}.",
+                "Type": "CNAME",
+                "Region": target.region,
+                "SetIdentifier": target.region,
+                "HealthCheckId": {"Fn::GetAtt": [Match.any_value(), "HealthCheckId"]}
+            }
+        )
+        cluster_template.has_resource_properties(
+            "AWS::S3::BucketPolicy",
+            {
+                "PolicyDocument": {
+                    "Statement": Match.array_with([
+                        Match.object_like({
+                            "Principal": {"AWS": {"Fn::Join": ["", Match.array_with([f":iam::{target.elb_account_id}:root"])]}}
+                        })
+                    ])
+                }
+            }
+        )
+
+def test_duplicate_regions():
+    with pytest.raises(ValueError):
+        pipeline_stack([TARGETS[0], DeploymentTarget(account=TARGET_ACCOUNT, region="us-east-1", elb_account_id="127311923021")])
+
+def test_hosted_zone_accounts():
+    # The hosted zone cannot be in both accounts
+    with pytest.raises(ValueError):
+        pipeline_stack([TARGETS[0], DeploymentTarget(account=ACCOUNT, region="eu-west-1", elb_account_id="156460612806")])
+
+def test_dependency_hash(tmp_path, monkeypatch):
+    expected = hashlib.sha256(b"".join((ROOT / path).read_bytes() for path in DEPENDENCY_FILES)).hexdigest()[:16]
+    # Independent of the working directory
+    monkeypatch.chdir(tmp_path)
+    assert dependency_hash(DEPENDENCY_FILES) == expected
+
+    template = Template.from_stack(pipeline_stack([]))
+    template.has_resource_properties(
+        "AWS::CodeBuild::Project",
+        {"Cache": {"Type": "S3", "Location": {"Fn::Join": ["/", [Match.any_value(), f"dependencies/{expected}"]]}}}
+    )
+
+def test_split_unit_tests(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    modules = sorted(path.relative_to(ROOT).as_posix() for path in (ROOT / "tests").rglob("test_*.py"))
+    assert "tests/unit/test_pipeline_stack.py" in modules
+
+    shards = split_unit_tests(3)
+    assert len(shards) == 3
+    assert sorted(module for shard in shards for module in shard) == modules
+    # Never more shards than modules
+    assert len(split_unit_tests(len(modules) + 5)) == len(modules)
+
+def test_gitleaks_checksum():
+    with pytest.raises(ValueError):
+        pipeline_stack([], gitleaks_sha256="not-a-checksum")
+
+    template = Template.from_stack(pipeline_stack([], gitleaks_sha256=GITLEAKS_SHA256))
+    template.has_resource_properties(
+        "AWS::CodeBuild::Project",
+        {"Name": "cdk8s-samples-pipeline-git-leaks", "Environment": Match.object_like({
+            "EnvironmentVariables": Match.array_with([{"Name": "GITLEAKS_SHA256", "Type": "PLAINTEXT", "Value": GITLEAKS_SHA256}])
+        })}
+    )
+
+    # No fallback on the checksums downloaded from the release, the step stops before the download
+    template = Template.from_stack(pipeline_stack([]))
+    project = [
+        project for project in template.find_resources("AWS::CodeBuild::Project").values()
+        if project["Properties"].get("Name") == "cdk8s-samples-pipeline-git-leaks"
+    ][0]["Properties"]
+    assert "GITLEAKS_SHA256" not in [variable["Name"] for variable in project["Environment"]["EnvironmentVariables"]]
+    commands = json.loads(project["Source"]["BuildSpec"])["phases"]["build"]["commands"]
+    assert commands[0].startswith('[ -n "$GITLEAKS_SHA256" ] || {')
+
+def test_synth_runs_full_nag_checks():
+    template = Template.from_stack(pipeline_stack([]))
+    synth = [
+        project for project in template.find_resources("AWS::CodeBuild::Project").values()
+        if "cdk synth" in project["Properties"]["Source"]["BuildSpec"]
+    ]
+    assert len(synth) == 1
+    assert json.loads(synth[0]["Properties"]["Source"]["BuildSpec"])["phases"]["build"]["commands"] == ["cdk synth -c nag=full"]
+
+def test_load_test():
+    template = Template.from_stack(pipeline_stack([], load_test=LoadTestOptions(rps=50, p95_ms=300, max_error_rate=0.02)))
+
+    # The SLOs are the thresholds of the load test command, the report is the step output
+    template.has_resource_properties(
+        "AWS::CodeBuild::Project",
+        {
+            "Name": "cdk8s-samples-pipeline-load-test",
+            "TimeoutInMinutes": 21,
+            "Source": Match.object_like({"BuildSpec": Match.serialized_json(Match.object_like({
+                "phases": {"build": {"commands": [
+                    "mkdir -p load-test-results",
+                    'python3 -m tools.http_load_test --url "$APPLICATION_ENDPOINT" --rps 50 --duration 60 --concurrency 10 '
+                    "--ready-timeout 600 --p95-ms 300 --p99-ms 1000 --max-error-rate 0.02 --output load-test-results/report.json"
+                ]}},
+                "artifacts": Match.object_like({"base-directory": "load-test-results"})
+            }))})
+        }
+    )
+
+    # The endpoint comes from the ApplicationEndpoint output of the deployed stack, once it is deployed
+    pipeline = list(template.find_resources("AWS::CodePipeline::Pipeline").values())[0]
+    actions = {action["Name"]: action for action in [stage for stage in pipeline["Properties"]["Stages"] if stage["Name"] == "DEV"][0]["Actions"]}
+    deploy = actions["cdk8s-samples-app-stack.Deploy"]
+    load_test = actions["LoadTest"]
+    assert json.loads(load_test["Configuration"]["EnvironmentVariables"]) == [
+        {"name": "APPLICATION_ENDPOINT", "type": "PLAINTEXT", "value": f"#{{{deploy['Namespace']}.ApplicationEndpoint}}"}
+    ]
+    assert load_test["RunOrder"] > deploy["RunOrder"]
+
+def test_unit_test_shards():
+    template = Template.from_stack(pipeline_stack([], unit_test_shards=3))
+    projects = {
+        project["Properties"]["Name"]: project["Properties"]
+        for project in template.find_resources("AWS::CodeBuild::Project").values()
+        if "unit-tests" in project["Properties"].get("Name", "")
+    }
+    assert sorted(projects) == [f"cdk8s-samples-pipeline-unit-tests-{suffix}" for suffix in ("1", "2", "3", "coverage")]
+
+    # Each shard runs its slice of the test modules and outputs its coverage data file
+    shard_files = []
+    for index, test_files in enumerate(split_unit_tests(3), start=1):
+        project = projects[f"cdk8s-samples-pipeline-unit-tests-{index}"]
+        build_spec = json.loads(project["Source"]["BuildSpec"])
+        assert build_spec["phases"]["build"]["commands"] == [
+            f"python3 -m coverage run --branch -m pytest -v --junitxml=test-results/results.xml {' '.join(test_files)}"
+        ]
+        assert build_spec["artifacts"]["base-directory"] == "test-results"
+        assert {"Name": "COVERAGE_FILE", "Type": "PLAINTEXT", "Value": f"test-results/coverage.shard{index}"} in \
+            project["Environment"]["EnvironmentVariables"]
+        shard_files.extend(test_files)
+    assert sorted(shard_files) == split_unit_tests(1)[0]
+
+    # The last step combines the shard outputs into the Cobertura coverage report
+    build_spec = json.loads(projects["cdk8s-samples-pipeline-unit-tests-coverage"]["Source"]["BuildSpec"])
+    assert build_spec["phases"]["build"]["commands"] == [
+        "python3 -m coverage combine shards/*/coverage.shard*",
+        "python3 -m coverage report",
+        "python3 -m coverage xml -i -o test-results/coverage.xml"
+    ]
+    assert build_spec["reports"]["coverage_reports"] == {
+        "files": ["coverage.xml"],
+        "base-directory": "test-results",
+        "file-format": "COBERTURAXML"
+    }
+    pipeline = list(template.find_resources("AWS::CodePipeline::Pipeline").values())[0]
+    actions = {action["Name"]: action for stage in pipeline["Properties"]["Stages"] for action in stage["Actions"]}
+    assert [artifact["Name"] for artifact in actions["UnitTestsCoverage"]["InputArtifacts"][1:]] == [
+        actions[f"UnitTests{index}"]["OutputArtifacts"][0]["Name"] for index in (1, 2, 3)
+    ]
+    assert actions["UnitTestsCoverage"]["RunOrder"] > actions["UnitTests1"]["RunOrder"]
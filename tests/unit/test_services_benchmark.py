@@ -0,0 +1,28 @@
+from benchmarks.services_benchmark import PHASES, summarize, superlinear
+
+def size_run(seconds):
+    return {
+        phase: {
+            "seconds": seconds,
+            "python_rss_mib": 100.0,
+            "node_rss_mib": 300.0,
+            "python_rss_growth_mib": 1.0,
+            "node_rss_growth_mib": 2.0
+        }
+        for phase in PHASES
+    }
+
+def test_linear_scaling():
+    results = summarize({10: size_run(1.1), 100: size_run(2.0), 400: size_run(5.0)})
+    chart = results["phases"]["services_chart"]
+    assert results["sizes"] == [10, 100, 400]
+    assert chart["marginal_ms_per_service"] == [10.0, 10.0]
+    assert chart["fit"] == {"ms_per_service": 10.0, "intercept_seconds": 1.0, "r_squared": 1.0}
+    assert chart["node_rss_mib"] == {10: 300.0, 100: 300.0, 400: 300.0}
+    assert not superlinear(results, 1.0)
+
+def test_superlinear_scaling():
+    results = summarize({10: size_run(1.1), 100: size_run(2.0), 400: size_run(11.0)})
+    slower = superlinear(results, 1.0)
+    assert len(slower) == len(PHASES)
+    assert slower[0] == "services_chart: 30.0ms per service at the largest size vs 10.0ms at the smallest"
@@ -0,0 +1,164 @@
+import json
+import cdk8s
+import pytest
+from cdk8s import Duration
+from cdk8s_plus_27 import ScalingRules, ScalingPolicy, Replicas
+from infrastructure.app_chart import AutoscalingOptions
+from infrastructure.services_chart import ServicesChart, ServiceSpec, RULES_PER_LOAD_BALANCER, load_service_specs
+
+SPEC = {
+    "services": [
+        {
+            "name": "orders",
+            "image": "example/orders:1.0",
+            "port": 9000,
+            "cpu_request": 0.5,
+            "memory_request_mib": 1024,
+            "autoscaling": {"max_replicas": 8, "min_replicas": 3}
+        },
+        {
+            "name": "users",
+            "image": "example/users:2.1",
+            "replicas": 2,
+            "host": "users.mydomain.com",
+            "path": "/"
+        }
+    ]
+}
+
+def test_services_chart(tmp_path):
+    spec_file = tmp_path / "services.json"
+    spec_file.write_text(json.dumps(SPEC), encoding="utf-8")
+    specs = load_service_specs(spec_file)
+    assert [spec.name for spec in specs] == ["orders", "users"]
+    assert specs[0].autoscaling.max_replicas == 8
+
+    chart = ServicesChart(
+        cdk8s.Testing.app(),
+        "cdk8s-test-services",
+        namespace = "test-namespace",
+        alb_access_logs_bucket_name = "mock-bucket",
+        services = specs
+    )
+    synth = cdk8s.Testing.synth(chart)
+    by_name = {manifest["metadata"]["name"]: manifest for manifest in synth}
+    assert sorted(by_name) == ["orders-deployment", "orders-hpa", "orders-service", "services-ingress", "users-deployment", "users-service"]
+
+    container = by_name["orders-deployment"]["spec"]["template"]["spec"]["containers"][0]
+    assert container["image"] == "example/orders:1.0"
+    assert container["ports"][0]["containerPort"] == 9000
+    assert container["resources"]["requests"] == {"cpu": "0.5", "memory": "1024Mi"}
+    assert by_name["orders-hpa"]["spec"]["minReplicas"] == 3
+    assert by_name["users-deployment"]["spec"]["replicas"] == 2
+    assert by_name["orders-service"]["spec"]["ports"][0] == {"port": 80, "protocol": "TCP", "targetPort": 9000}
+
+    # One ALB, one rule per service in the order of the spec
+    ingress = by_name["services-ingress"]
+    assert ingress["metadata"]["annotations"]["alb.ingress.kubernetes.io/load-balancer-name"] == "services-alb"
+    assert [(rule.get("host"), rule["http"]["paths"][0]["path"], rule["http"]["paths"][0]["backend"]["service"]["name"]) for rule in ingress["spec"]["rules"]] == [
+        (None, "/orders", "orders-service"),
+        ("users.mydomain.com", "/", "users-service")
+    ]
+
+def test_service_spec_validation(tmp_path):
+    spec_file = tmp_path / "services.json"
+    spec_file.write_text(json.dumps([SPEC["services"][1], SPEC["services"][1]]), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_service_specs(spec_file)
+
+    spec_file.write_text(json.dumps([{**SPEC["services"][0], "replicas": 2}]), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_service_specs(spec_file)
+
+    # Probe errors name the service
+    spec_file.write_text(json.dumps([{**SPEC["services"][1], "readiness_probe": {"period_seconds": 1}}]), encoding="utf-8")
+    with pytest.raises(ValueError, match=f"Service {SPEC['services'][1]['name']}: "):
+        load_service_specs(spec_file)
+
+def test_yaml_services_spec(tmp_path):
+    spec_file = tmp_path / "services.yaml"
+    spec_file.write_text("""
+services:
+  - name: orders
+    image: example/orders:1.0
+    autoscaling:
+      max_replicas: 8
+    readiness_probe:
+      path: /ready
+    liveness_probe:
+      path: /healthz
+      period_seconds: 20
+    graceful_shutdown:
+      drain_seconds: 20
+      max_surge: 50%
+    pod_disruption_budget:
+      max_unavailable: 1
+    zone_spread:
+      when_unsatisfiable: DoNotSchedule
+""", encoding="utf-8")
+    chart = ServicesChart(
+        cdk8s.Testing.app(),
+        "cdk8s-test-services-yaml",
+        namespace = "test-namespace",
+        alb_access_logs_bucket_name = "mock-bucket",
+        services = load_service_specs(spec_file)
+    )
+    by_name = {manifest["metadata"]["name"]: manifest for manifest in cdk8s.Testing.synth(chart)}
+    assert sorted(by_name) == ["orders-deployment", "orders-hpa", "orders-pdb", "orders-service", "services-ingress"]
+
+    # Same workload as an AppChart with these options
+    deployment_spec = by_name["orders-deployment"]["spec"]
+    assert deployment_spec["strategy"]["rollingUpdate"] == {"maxSurge": "50%", "maxUnavailable": 0}
+    pod_spec = deployment_spec["template"]["spec"]
+    assert pod_spec["terminationGracePeriodSeconds"] == 35
+    assert pod_spec["topologySpreadConstraints"][0]["whenUnsatisfiable"] == "DoNotSchedule"
+    container = pod_spec["containers"][0]
+    assert container["readinessProbe"]["httpGet"]["path"] == "/ready"
+    assert container["livenessProbe"]["periodSeconds"] == 20
+    assert container["lifecycle"]["preStop"]["exec"]["command"] == ["sleep", "20"]
+    assert by_name["orders-pdb"]["spec"]["maxUnavailable"] == 1
+
+    # The target group of the service follows its probe and drain time, the shared ingress keeps the defaults
+    annotations = by_name["orders-service"]["metadata"]["annotations"]
+    assert annotations["alb.ingress.kubernetes.io/healthcheck-path"] == "/ready"
+    assert annotations["alb.ingress.kubernetes.io/target-group-attributes"] == "deregistration_delay.timeout_seconds=20"
+    assert "alb.ingress.kubernetes.io/healthcheck-path" not in by_name["services-ingress"]["metadata"]["annotations"]
+
+def test_service_scaling_rules():
+    chart = ServicesChart(
+        cdk8s.Testing.app(),
+        "cdk8s-test-services-scaling",
+        namespace = "test-namespace",
+        alb_access_logs_bucket_name = "mock-bucket",
+        services = [
+            ServiceSpec(
+                name = "orders",
+                image = "example/orders:1.0",
+                autoscaling = AutoscalingOptions(
+                    max_replicas = 8,
+                    scale_down = ScalingRules(
+                        stabilization_window = Duration.minutes(10),
+                        policies = [ScalingPolicy(replicas = Replicas.absolute(1), duration = Duration.minutes(1))]
+                    )
+                )
+            )
+        ]
+    )
+    hpa = [manifest for manifest in cdk8s.Testing.synth(chart) if manifest["kind"] == "HorizontalPodAutoscaler"][0]
+    assert hpa["spec"]["behavior"]["scaleDown"]["stabilizationWindowSeconds"] == 600
+    assert hpa["spec"]["behavior"]["scaleDown"]["policies"] == [{"periodSeconds": 60, "type": "Pods", "value": 1}]
+
+def test_listener_rule_quota():
+    def ingresses(count):
+        specs = [ServiceSpec(name=f"service{index}", image="example/app:1.0", replicas=1) for index in range(count)]
+        chart = ServicesChart(cdk8s.Testing.app(), "ServicesChart", namespace="default", alb_access_logs_bucket_name="mock-bucket", services=specs)
+        return {
+            # The controller creates one listener rule per path
+            manifest["metadata"]["annotations"]["alb.ingress.kubernetes.io/load-balancer-name"]: sum(len(rule["http"]["paths"]) for rule in manifest["spec"]["rules"])
+            for manifest in chart.to_json()
+            if manifest["kind"] == "Ingress"
+        }
+
+    # A full ALB, then the next service goes to a second one
+    assert ingresses(RULES_PER_LOAD_BALANCER) == {"services-alb": RULES_PER_LOAD_BALANCER}
+    assert ingresses(RULES_PER_LOAD_BALANCER + 1) == {"services-alb": RULES_PER_LOAD_BALANCER, "services-alb-2": 1}
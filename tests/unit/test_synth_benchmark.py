@@ -0,0 +1,34 @@
+from benchmarks.synth_benchmark import PHASES, summarize, regressions
+
+def benchmark_run(seconds):
+    return {
+        phase: {
+            "seconds": seconds,
+            "python_rss_mib": 100.0,
+            "node_rss_mib": None,
+            "python_rss_growth_mib": 1.0,
+            "node_rss_growth_mib": None
+        }
+        for phase in PHASES
+    }
+
+def test_summarize():
+    results = summarize([benchmark_run(1.0), benchmark_run(3.0), benchmark_run(2.0)])
+    assert results["runs"] == 3
+    assert results["phases"]["app_synth"]["seconds"] == {"min": 1.0, "median": 2.0, "mean": 2.0, "max": 3.0}
+    assert results["phases"]["app_synth"]["python_rss_mib"] == 100.0
+    assert results["phases"]["app_synth"]["node_rss_mib"] is None
+    assert results["total_seconds"] == 2.0 * len(PHASES)
+
+def test_regressions():
+    baseline = summarize([benchmark_run(1.0)])
+    assert not regressions(summarize([benchmark_run(1.15)]), baseline, 0.2)
+
+    slower = regressions(summarize([benchmark_run(1.5)]), baseline, 0.2)
+    assert len(slower) == len(PHASES)
+    assert slower[0] == "jsii_startup: 1.500s vs 1.000s baseline (+50%)"
+
+def test_regressions_zero_baseline():
+    slower = regressions(summarize([benchmark_run(0.5)]), summarize([benchmark_run(0.0)]), 0.2)
+    assert slower[0] == "jsii_startup: 0.500s vs 0.000s baseline (from 0s)"
+    assert not regressions(summarize([benchmark_run(0.0)]), summarize([benchmark_run(0.0)]), 0.2)
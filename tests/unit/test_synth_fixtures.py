@@ -0,0 +1,16 @@
+import pytest
+from cdk8s import Size
+from infrastructure.app_chart import GracefulShutdownOptions
+from infrastructure.image_pinning import ImageResolver
+from tests.conftest import params_key
+
+def test_params_key_by_value():
+    # Objects created and released in turn reuse memory addresses, their keys must still differ
+    keys = {params_key({"memory_request": Size.mebibytes(size)}) for size in range(1, 6)}
+    assert len(keys) == 5
+    assert params_key(Size.mebibytes(1024)) == params_key(Size.gibibytes(1))
+    assert params_key(GracefulShutdownOptions(drain_seconds=20)) != params_key(GracefulShutdownOptions(drain_seconds=30))
+
+def test_params_key_rejects_objects():
+    with pytest.raises(TypeError):
+        params_key({"image_resolver": ImageResolver()})
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Quoted fields may contain spaces and escaped quotes
+FIELD = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+# Processing times logged by the ALB for each request, in seconds, -1 when the request never reached that point
+TIMINGS = {
+    "request_processing_ms": 5,
+    "target_processing_ms": 6,
+    "response_processing_ms": 7
+}
+
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+def parse_record(line: str) -> dict:
+    # https://docs.aws.amazon.com/elasticloadbalancing/latest/application/load-balancer-access-logs.html#access-log-entry-syntax
+    fields = [quoted or unquoted for quoted, unquoted in FIELD.findall(line)]
+    if len(fields) < 13:
+        return None
+    request = fields[12].split(" ")
+    try:
+        # Whole milliseconds, the resolution of the log
+        timings = {name: round(float(fields[index]) * 1000) for name, index in TIMINGS.items()}
+    except ValueError:
+        return None
+    return {
+        "time": fields[1],
+        "target": fields[4],
+        **timings,
+        "elb_status": fields[8],
+        "target_status": fields[9],
+        "path": (urlsplit(request[1]).path or "/") if len(request) > 1 else "-"
+    }
+
+def read_records(stream):
+    # One record at a time, gzip'd objects are decompressed while they are read
+    with gzip.open(stream, "rt", encoding="utf-8", errors="replace") as lines:
+        for line in lines:
+            record = parse_record(line)
+            if record is not None:
+                yield record
+
+class LocalSource:
+    # Log objects synced or downloaded from the logs bucket, keeping the bucket layout or not
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def keys(self) -> list:
+        return sorted(str(path.relative_to(self.directory)) for path in self.directory.rglob("*.log.gz"))
+
+    def open(self, key: str):
+        return open(self.directory / key, "rb")
+
+def boto3_client(endpoint_url: str = None):
+    # boto3 is only needed to read from S3, it is not part of the requirements
+    import boto3 # pylint: disable=import-outside-toplevel,import-error
+    return boto3.client("s3", endpoint_url=endpoint_url)
+
+class S3Source:
+    # The logs bucket or any S3-compatible endpoint. The client is created again in each worker process.
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, client_factory=boto3_client):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.client_factory = client_factory
+        self.client = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "client": None}
+
+    def s3_client(self):
+        if self.client is None:
+            self.client = self.client_factory(self.endpoint_url)
+        return self.client
+
+    def keys(self) -> list:
+        keys = []
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            page = self.s3_client().list_objects_v2(**kwargs)
+            keys += [item["Key"] for item in page.get("Contents", []) if item["Key"].endswith(".log.gz")]
+            if not page.get("IsTruncated"):
+                return keys
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    def open(self, key: str):
+        return self.s3_client().get_object(Bucket=self.bucket, Key=key)["Body"]
+
+def new_group() -> dict:
+    # Latencies are counted per millisecond value, so memory does not grow with the number of records
+    return {"requests": 0, "status": Counter(), **{name: Counter() for name in TIMINGS}}
+
+def add_record(stats: dict, record: dict, top: int):
+    stats["requests"] += 1
+    stats["status"][record["elb_status"]] += 1
+    for key, groups in [(record["path"], stats["paths"]), (record["target"], stats["targets"])]:
+        group = groups.setdefault(key, new_group())
+        group["requests"] += 1
+        group["status"][record["elb_status"]] += 1
+        for name in TIMINGS:
+            if record[name] >= 0:
+                group[name][record[name]] += 1
+
+    total = sum(max(0, record[name]) for name in TIMINGS)
+    slow = (total, record["time"], record["path"], record["target"], record["elb_status"])
+    if len(stats["slowest"]) < top:
+        heapq.heappush(stats["slowest"], slow)
+    else:
+        heapq.heappushpop(stats["slowest"], slow)
+
+def new_stats() -> dict:
+    return {"objects": 0, "requests": 0, "status": Counter(), "paths": {}, "targets": {}, "slowest": []}
+
+def merge_stats(stats: dict, other: dict, top: int) -> dict:
+    stats["objects"] += other["objects"]
+    stats["requests"] += other["requests"]
+    stats["status"].update(other["status"])
+    for kind in ["paths", "targets"]:
+        for key, other_group in other[kind].items():
+            group = stats[kind].setdefault(key, new_group())
+            group["requests"] += other_group["requests"]
+            for name in ["status", *TIMINGS]:
+                group[name].update(other_group[name])
+    stats["slowest"] = heapq.nlargest(top, stats["slowest"] + other["slowest"])
+    heapq.heapify(stats["slowest"])
+    return stats
+
+def analyze_object(source, top: int, key: str) -> dict:
+    stats = new_stats()
+    stats["objects"] = 1
+    with closing(source.open(key)) as stream:
+        for record in read_records(stream):
+            add_record(stats, record, top)
+    return stats
+
+def analyze(source, workers: int = None, top: int = 20) -> dict:
+    # Objects are spread over worker processes, each returns its partial stats
+    keys = source.keys()
+    stats = new_stats()
+    analyze_key = partial(analyze_object, source, top)
+    workers = min(workers or os.cpu_count() or 1, max(1, len(keys)))
+    if workers == 1:
+        for key in keys:
+            merge_stats(stats, analyze_key(key), top)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            for partial_stats in pool.imap_unordered(analyze_key, keys):
+                merge_stats(stats, partial_stats, top)
+    return stats
+
+def counter_percentile(counter: Counter, fraction: float) -> int:
+    # Nearest-rank percentile over the counted values
+    rank = max(1, math.ceil(fraction * sum(counter.values())))
+    seen = 0
+    for value in sorted(counter):
+        seen += counter[value]
+        if seen >= rank:
+            return value
+    return None
+
+def latency_summary(counter: Counter) -> dict:
+    if not counter:
+        return {}
+    return {
+        **{name: counter_percentile(counter, fraction) for name, fraction in PERCENTILES.items()},
+        "max": max(counter)
+    }
+
+def report(stats: dict) -> dict:
+    def groups(kind):
+        return {
+            key: {
+                "requests": group["requests"],
+                "status": dict(sorted(group["status"].items())),
+                **{name: latency_summary(group[name]) for name in TIMINGS}
+            }
+            for key, group in sorted(stats[kind].items(), key=lambda item: -item[1]["requests"])
+        }
+
+    return {
+        "objects": stats["objects"],
+        "requests": stats["requests"],
+        "status": dict(sorted(stats["status"].items())),
+        "paths": groups("paths"),
+        "targets": groups("targets"),
+        "slowest": [
+            {"total_ms": total, "time": time, "path": path, "target": target, "elb_status": status}
+            for total, time, path, target, status in sorted(stats["slowest"], reverse=True)
+        ]
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Latency percentiles, status codes and slowest requests of ALB access logs")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--directory", help="Local directory with the .log.gz objects")
+    source_group.add_argument("--bucket", help="Access logs bucket, requires boto3")
+    parser.add_argument("--prefix", default="", help="Key prefix in the bucket, e.g. AWSLogs/<account>/elasticloadbalancing/<region>/2024/01/31/")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint to read from instead of Amazon S3")
+    parser.add_argument("--workers", type=int, help="Worker processes, one per core by default")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest requests to report")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.directory:
+        source = LocalSource(args.directory)
+    else:
+        source = S3Source(args.bucket, args.prefix, args.endpoint_url)
+
+    results = report(analyze(source, args.workers, args.top))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
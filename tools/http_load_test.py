@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import argparse
+import http.client
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+def connection_factory(url: str, timeout_seconds: float):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    return lambda: connection_class(parts.netloc, timeout=timeout_seconds), path
+
+def send_request(connections: threading.local, connect, path: str):
+    # One keep-alive connection per worker thread, reopened after any failure.
+    # Redirects are not followed and count as errors: the ALB answers HTTP with a redirect to HTTPS
+    # when TLS is enabled, so its latency says nothing about the application. Load the HTTPS endpoint instead.
+    if getattr(connections, "connection", None) is None:
+        connections.connection = connect()
+    try:
+        connections.connection.request("GET", path)
+        response = connections.connection.getresponse()
+        response.read()
+        return response.status
+    except (OSError, http.client.HTTPException):
+        connections.connection.close()
+        connections.connection = None
+        return None
+
+def run_load_test(url: str, rps: float, duration_seconds: float, concurrency: int, timeout_seconds: float = 5) -> list:
+    # Open model: requests are scheduled at a fixed rate whatever the response times, and latency is measured
+    # from the scheduled time, so requests queued behind slow ones are not hidden (coordinated omission).
+    connect, path = connection_factory(url, timeout_seconds)
+    connections = threading.local()
+    samples = []
+
+    def timed_request(scheduled):
+        status = send_request(connections, connect, path)
+        samples.append((status, time.perf_counter() - scheduled))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(max(1, int(rps * duration_seconds))):
+            scheduled = start + index / rps
+            time.sleep(max(0, scheduled - time.perf_counter()))
+            executor.submit(timed_request, scheduled)
+    return samples
+
+def percentile(values: list, fraction: float) -> float:
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def is_error(status) -> bool:
+    return status is None or not 200 <= status < 300
+
+def summarize(samples: list, duration_seconds: float) -> dict:
+    latencies_ms = [latency * 1000 for _, latency in samples]
+    errors = sum(1 for status, _ in samples if is_error(status))
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0,
+        "rps": round(len(samples) / duration_seconds, 2),
+        "latency_ms": {
+            **{name: round(percentile(latencies_ms, fraction), 2) for name, fraction in PERCENTILES.items()},
+            "max": round(max(latencies_ms), 2)
+        } if samples else {},
+        "status": dict(sorted(Counter("error" if status is None else str(status) for status, _ in samples).items()))
+    }
+
+def slo_breaches(report: dict, p50_ms: float = None, p95_ms: float = None, p99_ms: float = None, max_error_rate: float = None) -> list:
+    breaches = []
+    if not report["requests"]:
+        return ["No request was sent"]
+    for name, target in {"p50": p50_ms, "p95": p95_ms, "p99": p99_ms}.items():
+        if target is not None and report["latency_ms"][name] > target:
+            breaches.append(f"{name} latency {report['latency_ms'][name]:.1f}ms over the {target:g}ms SLO")
+    if max_error_rate is not None and report["error_rate"] > max_error_rate:
+        breaches.append(f"error rate {report['error_rate']:.2%} over the {max_error_rate:.2%} SLO")
+    return breaches
+
+def wait_until_ready(url: str, timeout_seconds: float, interval_seconds: float = 5) -> bool:
+    # The ALB is provisioned by the controller after the stack deployment, wait for its first healthy answer
+    connect, path = connection_factory(url, interval_seconds)
+    connections = threading.local()
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        # A redirect also means the ALB is up, the test then reports it as errors
+        status = send_request(connections, connect, path)
+        if status is not None and status < 400:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval_seconds)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Constant rate HTTP load test with latency and error rate SLOs")
+    parser.add_argument("--url", required=True, help="Endpoint to load, e.g. the ApplicationEndpoint stack output")
+    parser.add_argument("--rps", type=float, default=20, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds")
+    parser.add_argument("--concurrency", type=int, default=10, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=5, help="Request timeout in seconds")
+    parser.add_argument("--ready-timeout", type=float, default=0, help="Seconds to wait for the endpoint to answer before the test")
+    parser.add_argument("--p50-ms", type=float, help="p50 latency SLO in milliseconds")
+    parser.add_argument("--p95-ms", type=float, help="p95 latency SLO in milliseconds")
+    parser.add_argument("--p99-ms", type=float, help="p99 latency SLO in milliseconds")
+    parser.add_argument("--max-error-rate", type=float, help="Allowed share of failed or non-2xx responses, e.g. 0.01")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    if args.ready_timeout and not wait_until_ready(args.url, args.ready_timeout):
+        print(f"{args.url} did not answer within {args.ready_timeout:g}s", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    samples = run_load_test(args.url, args.rps, args.duration, args.concurrency, args.timeout)
+    report = summarize(samples, time.perf_counter() - start)
+    report["slo_breaches"] = slo_breaches(report, args.p50_ms, args.p95_ms, args.p99_ms, args.max_error_rate)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+    for message in report["slo_breaches"]:
+        print(f"SLO breach: {message}", file=sys.stderr)
+    return 1 if report["slo_breaches"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())